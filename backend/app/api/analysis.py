@@ -1,21 +1,46 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from app.services.regulation_service import regulation_service
 from app.services.document_service import document_service
+from app.utils.disconnect import CancelOnDisconnectRoute
+from app.utils.uploads import PDF_UPLOAD_OPENAPI, receive_pdf_upload
 
-router = APIRouter(prefix="/analyze", tags=["Analysis"])
+router = APIRouter(prefix="/analyze", tags=["Analysis"], route_class=CancelOnDisconnectRoute)
 
-@router.post("/regulations")
-async def analyze_regulations(file: UploadFile = File(...)):
-    if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="El archivo debe ser un PDF")
-    
-    result = await regulation_service.analyze_regulations(file)
+@router.post("/regulations", openapi_extra=PDF_UPLOAD_OPENAPI)
+async def analyze_regulations(request: Request):
+    # El PDF se vuelca a disco por streaming (memoria acotada) y se borra al terminar
+    async with await receive_pdf_upload(request) as upload:
+        result = await regulation_service.analyze_regulations(upload)
     return result
 
-@router.post("/extract-text")
-async def extract_text(file: UploadFile = File(...)):
-    if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="El archivo debe ser un PDF")
-    
-    text = await document_service.extract_text_from_pdf(file)
-    return {"text_preview": text[:1000], "total_length": len(text)}
+@router.get("/regulations/{document_hash}")
+async def get_regulations_by_hash(document_hash: str):
+    # Permite al frontend calcular el SHA-256 del PDF y evitar la subida si ya fue analizado
+    result = await regulation_service.get_cached_analysis(document_hash.lower())
+    if result is None:
+        raise HTTPException(status_code=404, detail="Reglamento no analizado previamente")
+    return result
+
+PREVIEW_LENGTH = 1000
+
+@router.post("/extract-text", openapi_extra=PDF_UPLOAD_OPENAPI)
+async def extract_text(request: Request, preview_only: bool = False):
+    async with await receive_pdf_upload(request) as upload:
+        if not preview_only:
+            text = await document_service.extract_text_from_upload(upload)
+            return {"text_preview": text[:PREVIEW_LENGTH], "total_length": len(text)}
+
+        # Solo vista previa (opt-in): se detiene en cuanto hay suficiente texto, sin parsear todo
+        # el PDF; por eso no hay `total_length`, sino cuántas páginas se leyeron
+        parts, length, pages_parsed = [], 0, 0
+        async for page_text in document_service.aiter_pages(upload.path):
+            parts.append(page_text)
+            length += len(page_text)
+            pages_parsed += 1
+            if length >= PREVIEW_LENGTH:
+                break
+    return {
+        "text_preview": "".join(parts)[:PREVIEW_LENGTH],
+        "total_length": None,
+        "pages_parsed": pages_parsed,
+    }
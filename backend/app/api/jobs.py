@@ -0,0 +1,88 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from app.api.thesis import StructureRequest
+from app.api.writing import FullChapterRequest
+from app.services.job_service import TERMINAL_STATUSES, job_service
+from app.utils.streaming import SSE_HEADERS, sse_event
+from app.utils.uploads import PDF_UPLOAD_OPENAPI, receive_pdf_upload
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+EVENTS_POLL_SECONDS = 0.5
+
+def _job_response(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events",
+    }
+
+@router.post("/writing/full-chapter", status_code=status.HTTP_202_ACCEPTED)
+async def submit_full_chapter(request: FullChapterRequest):
+    job = await job_service.submit("writing.full_chapter", request.model_dump())
+    return _job_response(job)
+
+@router.post("/thesis/structure", status_code=status.HTTP_202_ACCEPTED)
+async def submit_structure(request: StructureRequest):
+    if not request.title:
+        raise HTTPException(status_code=400, detail="El título es obligatorio")
+    job = await job_service.submit("thesis.structure", request.model_dump())
+    return _job_response(job)
+
+@router.post("/analyze/regulations", status_code=status.HTTP_202_ACCEPTED, openapi_extra=PDF_UPLOAD_OPENAPI)
+async def submit_regulations(request: Request):
+    # El PDF queda en un archivo temporal del worker que acepta el trabajo (no en memoria);
+    # el job service lo borra cuando el trabajo termina
+    upload = await receive_pdf_upload(request)
+    try:
+        job = await job_service.submit(
+            "analysis.regulations", {"filename": upload.filename, "size": upload.size}, attachment=upload,
+        )
+    except BaseException:
+        upload.cleanup()
+        raise
+    return _job_response(job)
+
+@router.get("/stats")
+async def jobs_stats():
+    return job_service.stats()
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    job = await job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return {k: v for k, v in job.items() if k not in ("payload", "user_id")}
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = await job_service.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return {"job_id": job_id, "status": job["status"], "cancel_requested": job["cancel_requested"]}
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    if await job_service.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def events():
+        yield ": stream-open\n\n"
+        last_update = None
+        while True:
+            # Se lee del job store: el trabajo puede estar corriendo en otro worker
+            job = await job_service.get(job_id)
+            if job is None:
+                return
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield sse_event("status", {"status": job["status"], "progress": job["progress"]})
+            if job["status"] in TERMINAL_STATUSES:
+                yield sse_event("done", {"status": job["status"], "result": job["result"], "error": job["error"]})
+                return
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
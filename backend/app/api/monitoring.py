@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.services.ai_service import ai_service
+from app.services.scheduler_service import llm_scheduler
+from app.utils.metrics import registry
+from app.utils.profiler import profiler
+import os
+
+router = APIRouter(tags=["Monitoring"])
+
+CACHE_EVENTS = registry.gauge("thesia_ai_cache_events", "Eventos acumulados de la caché de respuestas", ("event",))
+CACHE_HIT_RATIO = registry.gauge("thesia_ai_cache_hit_ratio", "Proporción de aciertos de la caché de respuestas")
+SCHEDULER = registry.gauge("thesia_llm_scheduler", "Estado del planificador de llamadas al LLM", ("field",))
+SINGLE_FLIGHT = registry.gauge("thesia_llm_single_flight", "Contadores de deduplicación de prompts", ("field",))
+
+def _collect():
+    cache = ai_service.cache.stats()
+    for event in ("hits_memory", "hits_disk", "misses", "evictions", "entries", "bytes"):
+        CACHE_EVENTS.set(cache[event], event=event)
+    CACHE_HIT_RATIO.set(cache["hit_ratio"])
+    for field, value in llm_scheduler.stats().items():
+        SCHEDULER.set(value, field=field)
+    for field, value in ai_service.single_flight.stats().items():
+        SINGLE_FLIGHT.set(float(value), field=field)
+
+registry.add_collector(_collect)
+
+def _require_profiler():
+    # El profiler puede exponer rutas internas: solo se habilita explícitamente
+    if os.getenv("PROFILER_ENABLED", "false").lower() != "true":
+        raise HTTPException(status_code=404, detail="Profiler deshabilitado")
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.post("/debug/profiler/start")
+async def start_profiler(interval_ms: float = 10, duration_seconds: float = 60):
+    _require_profiler()
+    profiler.start(interval_ms / 1000, duration_seconds)
+    return profiler.status()
+
+@router.post("/debug/profiler/stop")
+async def stop_profiler():
+    _require_profiler()
+    profiler.stop()
+    return profiler.status()
+
+@router.get("/debug/profiler", response_class=PlainTextResponse)
+async def profiler_report():
+    _require_profiler()
+    return PlainTextResponse(profiler.collapsed())
@@ -1,9 +1,24 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from app.services.profile_service import profile_service, ProfileConfig, ProfileValidationResult
+from app.utils.streaming import NDJSON_MEDIA_TYPE, SSE_HEADERS, ndjson_line
 
 router = APIRouter(prefix="/profile", tags=["Profile"])
 
+class ProfileBatchRequest(BaseModel):
+    items: list[ProfileConfig] = Field(..., min_length=1, max_length=500)
+
 @router.post("/validate")
 async def validate_profile(config: ProfileConfig):
     result = profile_service.validate_profile(config)
     return result
+
+@router.post("/validate/batch")
+async def validate_profile_batch(request: ProfileBatchRequest):
+    """Valida una cohorte completa; una línea NDJSON por perfil: {"index", "result"}."""
+    def lines():
+        for index, result in profile_service.validate_batch(request.items):
+            yield ndjson_line({"index": index, "result": result.model_dump()})
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=SSE_HEADERS)
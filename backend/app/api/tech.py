@@ -1,8 +1,12 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from app.services.ai_service import ai_service
 from app.services.tech_service import tech_service
+from app.utils.streaming import SSE_HEADERS
+from app.utils.disconnect import CancelOnDisconnectRoute
 
-router = APIRouter(prefix="/tech", tags=["Technical"])
+router = APIRouter(prefix="/tech", tags=["Technical"], route_class=CancelOnDisconnectRoute)
 
 class ArchitectureRequest(BaseModel):
     model_type: str
@@ -19,6 +23,17 @@ async def generate_architecture(request: ArchitectureRequest):
         request.model_type, request.framework, request.task_description
     )
 
+@router.post("/generate-architecture/stream")
+async def generate_architecture_stream(request: ArchitectureRequest):
+    ai_service.admit("tech.architecture")
+    return StreamingResponse(
+        tech_service.stream_architecture_description(
+            request.model_type, request.framework, request.task_description
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
 @router.post("/estimate-resources")
 async def estimate_resources(request: ResourceRequest):
     return tech_service.estimate_resources(request.params_millions, request.batch_size)
@@ -1,10 +1,16 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional
+from app.services.ai_service import ai_service
 from app.services.viability_service import viability_service
 from app.services.structure_service import structure_service
 from app.services.chapter_one_service import chapter_one_service
+from app.utils.errors import error_event
+from app.utils.streaming import NDJSON_MEDIA_TYPE, SSE_HEADERS, ndjson_line
+from app.utils.disconnect import CancelOnDisconnectRoute
 
-router = APIRouter(prefix="/thesis", tags=["Thesis"])
+router = APIRouter(prefix="/thesis", tags=["Thesis"], route_class=CancelOnDisconnectRoute)
 
 class ThesisIdeaRequest(BaseModel):
     title: str
@@ -12,16 +18,23 @@ class ThesisIdeaRequest(BaseModel):
     variables: list[str]
     scope: str
 
+class ThesisIdeaBatchRequest(BaseModel):
+    items: list[ThesisIdeaRequest] = Field(..., min_length=1, max_length=200)
+
 class StructureRequest(BaseModel):
     title: str
     objective: str
     regulation_structure: list = None
+    # SHA-256 del reglamento analizado: activa la recuperación de pasajes relevantes
+    document_hash: Optional[str] = None
 
 class ChapterOneRequest(BaseModel):
     title: str
     problem_description: str
     objectives: str
     justification: str
+    # Identificador estable del borrador: activa la re-revisión incremental por párrafos
+    document_id: Optional[str] = Field(None, max_length=128)
 
 @router.post("/evaluate-viability")
 async def evaluate_viability(request: ThesisIdeaRequest):
@@ -37,6 +50,31 @@ async def evaluate_viability(request: ThesisIdeaRequest):
     )
     return result
 
+@router.post("/evaluate-viability/batch")
+async def evaluate_viability_batch(request: ThesisIdeaBatchRequest):
+    """
+    Evalúa una cohorte de ideas (varias por llamada al modelo). Responde NDJSON, una línea
+    por idea a medida que se completa: {"index", "result"} o {"index", "error"}.
+    """
+    ideas = [item.model_dump() for item in request.items]
+    invalid = [i for i, idea in enumerate(ideas) if not idea["title"] or not idea["objective"]]
+    skipped = set(invalid)
+    valid = [i for i in range(len(ideas)) if i not in skipped]
+
+    async def lines():
+        for index in invalid:
+            yield ndjson_line({"index": index, "error": "El título y objetivo son obligatorios"})
+        async for position, result in viability_service.evaluate_batch([ideas[i] for i in valid]):
+            if isinstance(result, Exception):
+                # Mismo type/message que la respuesta HTTP de ese error (ver app/utils/errors.py)
+                yield ndjson_line(error_event(result, {"index": valid[position], "error": "Error al procesar la evaluación"}))
+            else:
+                yield ndjson_line({"index": valid[position], "result": result})
+
+    if valid:
+        ai_service.admit("thesis.viability")
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=SSE_HEADERS)
+
 @router.post("/generate-structure")
 async def generate_structure(request: StructureRequest):
     if not request.title:
@@ -45,16 +83,35 @@ async def generate_structure(request: StructureRequest):
     result = await structure_service.generate_structure(
         request.title,
         request.objective,
-        request.regulation_structure
+        request.regulation_structure,
+        request.document_hash
     )
     return result
 
+@router.post("/generate-structure/stream")
+async def generate_structure_stream(request: StructureRequest):
+    if not request.title:
+        raise HTTPException(status_code=400, detail="El título es obligatorio")
+
+    ai_service.admit("thesis.structure")
+    return StreamingResponse(
+        structure_service.stream_structure(
+            request.title,
+            request.objective,
+            request.regulation_structure,
+            request.document_hash
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
 @router.post("/review-chapter-one")
 async def review_chapter_one(request: ChapterOneRequest):
     result = await chapter_one_service.review_chapter_one(
         request.title,
         request.problem_description,
         request.objectives,
-        request.justification
+        request.justification,
+        request.document_id
     )
     return result
@@ -0,0 +1,26 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from app.services.scheduler_service import current_user_id
+from app.services.usage_service import usage_service
+from app.utils.auth import is_admin
+
+router = APIRouter(prefix="/usage", tags=["Usage"])
+
+@router.get("/report")
+async def usage_report(request: Request, days: int = Query(7, ge=1, le=90),
+                       group_by: Literal["endpoint", "user_id", "day"] = "endpoint",
+                       user_id: Optional[str] = None):
+    """
+    Tokens, coste y latencia agregados; las filas más caras primero. Sin credencial de
+    administrador (X-Admin-Token) solo se ve el consumo propio.
+    """
+    if not is_admin(request):
+        if group_by == "user_id" or (user_id is not None and user_id != current_user_id.get()):
+            raise HTTPException(status_code=403, detail="El reporte de otros usuarios requiere credencial de administrador")
+        user_id = current_user_id.get()
+    return await usage_service.report(days, group_by, user_id)
+
+@router.get("/me")
+async def usage_me():
+    """Gasto de hoy del usuario actual y lo que le queda de su presupuesto diario."""
+    return usage_service.summary()
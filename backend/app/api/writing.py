@@ -1,28 +1,65 @@
 from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+from app.services.ai_service import ai_service
 from app.services.writing_service import writing_service
+from app.utils.streaming import SSE_HEADERS
+from app.utils.disconnect import CancelOnDisconnectRoute
 
-router = APIRouter(prefix="/writing", tags=["Writing"])
+router = APIRouter(prefix="/writing", tags=["Writing"], route_class=CancelOnDisconnectRoute)
 
 class TextAnalysisRequest(BaseModel):
     text: str
+    # hybrid: reglas locales + modelo solo en párrafos marcados; rules: solo local; llm: todo al modelo
+    mode: Literal["hybrid", "rules", "llm"] = "hybrid"
+    # Identificador estable del documento: solo los párrafos nuevos o modificados van al modelo
+    document_id: Optional[str] = Field(None, max_length=128)
 
 class VersionGenerationRequest(BaseModel):
     context_info: str
     style_request: str
+    # Solo los estilos que se van a leer (por defecto los tres)
+    styles: Optional[list[Literal["formal", "statistical", "theoretical"]]] = Field(None, min_length=1)
+    # Una llamada concurrente por estilo en lugar de una sola con las tres versiones
+    parallel: bool = False
 
 class FullChapterRequest(BaseModel):
     data: dict
     profile: dict
+    # Genera cada sección (1.1-1.5) en una llamada concurrente independiente
+    parallel: bool = False
 
 @router.post("/analyze")
 async def analyze_text(request: TextAnalysisRequest):
-    return await writing_service.analyze_writing(request.text)
+    return await writing_service.analyze_writing(request.text, request.mode, request.document_id)
 
 @router.post("/generate-versions")
 async def generate_versions(request: VersionGenerationRequest):
-    return await writing_service.generate_versions(request.context_info, request.style_request)
+    return await writing_service.generate_versions(
+        request.context_info, request.style_request, request.styles, request.parallel
+    )
+
+@router.post("/generate-versions/stream")
+async def generate_versions_stream(request: VersionGenerationRequest):
+    # Siempre en paralelo: cada versión se envía apenas termina
+    ai_service.admit("writing.versions")
+    return StreamingResponse(
+        writing_service.stream_versions(request.context_info, request.style_request, request.styles),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 @router.post("/generate-full-chapter")
 async def generate_full_chapter(request: FullChapterRequest):
-    return await writing_service.generate_full_chapter(request.data, request.profile)
+    return await writing_service.generate_full_chapter(request.data, request.profile, request.parallel)
+
+@router.post("/generate-full-chapter/stream")
+async def generate_full_chapter_stream(request: FullChapterRequest):
+    # Cuota y cola se comprueban antes del 200: después solo quedaría un evento de error
+    ai_service.admit("writing.full_chapter")
+    return StreamingResponse(
+        writing_service.stream_full_chapter(request.data, request.profile),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
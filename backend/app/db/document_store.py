@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Optional
+from app.db.sqlite import LazySQLite
+from app.db.write_behind import WriteBehindQueue
+from app.utils.env import load_env
+
+load_env()
+
+class SQLiteDocumentStore:
+    """Almacén local (stand-in de Supabase) para texto, chunks y estructura de reglamentos."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._sqlite = LazySQLite(path, (
+            "CREATE TABLE IF NOT EXISTS regulation_documents ("
+            "sha256 TEXT PRIMARY KEY, text TEXT, chunks TEXT, regulation TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)",
+        ))
+
+    @property
+    def _db(self):
+        return self._sqlite.connection
+
+    def _get(self, sha256: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, chunks, regulation FROM regulation_documents WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "sha256": sha256,
+            "text": row[0],
+            "chunks": json.loads(row[1]) if row[1] else None,
+            "regulation": json.loads(row[2]) if row[2] else None,
+        }
+
+    def _upsert(self, sha256: str, fields: dict):
+        now = time.time()
+        values = {k: (v if k == "text" else json.dumps(v, ensure_ascii=False)) for k, v in fields.items()}
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO regulation_documents (sha256, created_at, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(sha256) DO NOTHING", (sha256, now, now)
+            )
+            assignments = ", ".join(f"{k} = ?" for k in values)
+            self._db.execute(
+                f"UPDATE regulation_documents SET {assignments}, updated_at = ? WHERE sha256 = ?",
+                (*values.values(), now, sha256),
+            )
+            self._db.commit()
+
+    async def get(self, sha256: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, sha256)
+
+    async def save(self, sha256: str, **fields):
+        await asyncio.to_thread(self._upsert, sha256, fields)
+
+class SupabaseDocumentStore:
+    """Misma interfaz sobre la tabla `regulation_documents` de Supabase (ver supabase_setup.sql)."""
+
+    TABLE = "regulation_documents"
+    COLUMNS = ("text", "chunks", "regulation")
+
+    def __init__(self):
+        # Los guardados no esperan a Supabase: se agrupan en upserts por lote (ver write_behind.py)
+        self._writes = WriteBehindQueue(self.TABLE, self._flush)
+
+    @property
+    def _client(self):
+        # El repositorio se crea en el primer uso (ver get_supabase), no al construir el store
+        from app.db.supabase import get_supabase
+        return get_supabase()
+
+    async def _flush(self, batch: list[tuple[str, dict]]):
+        # PostgREST exige las mismas columnas en todas las filas de un upsert: un POST por combinación
+        groups: dict[tuple, list[dict]] = {}
+        for sha256, fields in batch:
+            groups.setdefault(tuple(sorted(fields)), []).append({"sha256": sha256, **fields})
+        for rows in groups.values():
+            await self._client.upsert(self.TABLE, rows, on_conflict="sha256")
+
+    async def get(self, sha256: str) -> Optional[dict]:
+        # Lo pendiente se toma antes de consultar: si el flusher lo escribe entre medias, ya viene en la fila
+        pending = self._writes.pending(sha256)
+        record = await self._client.select_one(self.TABLE, "sha256", sha256, "sha256, " + ", ".join(self.COLUMNS))
+        if pending:
+            record = {"sha256": sha256, **dict.fromkeys(self.COLUMNS), **(record or {}), **pending}
+        return record
+
+    async def save(self, sha256: str, **fields):
+        await self._writes.put(sha256, fields)
+
+def create_document_store():
+    backend = os.getenv("DOCUMENT_STORE_BACKEND", "sqlite").lower()
+    if backend == "supabase":
+        return SupabaseDocumentStore()
+    return SQLiteDocumentStore(os.getenv("DOCUMENT_STORE_SQLITE_PATH", "thesia_documents.db"))
+
+document_store = create_document_store()
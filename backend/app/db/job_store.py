@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from app.db.sqlite import LazySQLite
+from app.db.write_behind import WriteBehindQueue
+from app.utils.env import load_env
+
+load_env()
+
+JSON_FIELDS = ("payload", "progress", "result")
+
+class SQLiteJobStore:
+    """Estado de los trabajos en segundo plano (stand-in local de la tabla de Supabase)."""
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._sqlite = LazySQLite(path, (
+            "CREATE TABLE IF NOT EXISTS generation_jobs ("
+            "id TEXT PRIMARY KEY, user_id TEXT, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT, progress TEXT, result TEXT, error TEXT, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)",
+        ))
+
+    @property
+    def _db(self):
+        return self._sqlite.connection
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for field in JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def _create(self, job: dict):
+        now = time.time()
+        values = {k: (json.dumps(v, ensure_ascii=False) if k in JSON_FIELDS else v) for k, v in job.items()}
+        values.update(created_at=now, updated_at=now)
+        with self._lock:
+            # Purga perezosa de trabajos viejos para que la tabla no crezca sin límite
+            self._db.execute("DELETE FROM generation_jobs WHERE updated_at < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                f"INSERT INTO generation_jobs ({', '.join(values)}) VALUES ({', '.join('?' for _ in values)})",
+                tuple(values.values()),
+            )
+            self._db.commit()
+
+    def _get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            cursor = self._db.cursor()
+            cursor.row_factory = sqlite3.Row
+            row = cursor.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def _update(self, job_id: str, fields: dict):
+        values = {k: (json.dumps(v, ensure_ascii=False) if k in JSON_FIELDS else v) for k, v in fields.items()}
+        assignments = ", ".join(f"{k} = ?" for k in values)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE generation_jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                (*values.values(), time.time(), job_id),
+            )
+            self._db.commit()
+
+    async def create(self, job: dict):
+        await asyncio.to_thread(self._create, job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def update(self, job_id: str, **fields):
+        await asyncio.to_thread(self._update, job_id, fields)
+
+class SupabaseJobStore:
+    """Misma interfaz sobre la tabla `generation_jobs` de Supabase (ver supabase_setup.sql)."""
+
+    TABLE = "generation_jobs"
+
+    def __init__(self):
+        # El progreso y el resultado se escriben en diferido (ver write_behind.py): varios updates
+        # seguidos del mismo trabajo se fusionan en un solo PATCH y nunca frenan al handler
+        self._writes = WriteBehindQueue(self.TABLE, self._flush)
+
+    @property
+    def _client(self):
+        # El repositorio se crea en el primer uso (ver get_supabase), no al construir el store
+        from app.db.supabase import get_supabase
+        return get_supabase()
+
+    async def _flush(self, batch: list[tuple[str, dict]]):
+        await asyncio.gather(*(self._client.update(self.TABLE, "id", job_id, fields) for job_id, fields in batch))
+
+    async def create(self, job: dict):
+        # La creación sí se espera: el trabajo tiene que existir para cualquier worker que lo consulte
+        now = time.time()
+        await self._client.insert(self.TABLE, [{**job, "created_at": now, "updated_at": now}])
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        pending = self._writes.pending(job_id)
+        job = await self._client.select_one(self.TABLE, "id", job_id)
+        if job is not None and pending:
+            job.update(pending)
+        return job
+
+    async def update(self, job_id: str, **fields):
+        await self._writes.put(job_id, {**fields, "updated_at": time.time()})
+
+def create_job_store():
+    backend = os.getenv("JOB_STORE_BACKEND", os.getenv("DOCUMENT_STORE_BACKEND", "sqlite")).lower()
+    if backend == "supabase":
+        return SupabaseJobStore()
+    return SQLiteJobStore(
+        os.getenv("JOB_STORE_SQLITE_PATH", "thesia_jobs.db"),
+        ttl_seconds=int(os.getenv("JOB_TTL_SECONDS", str(7 * 24 * 3600))),
+    )
+
+job_store = create_job_store()
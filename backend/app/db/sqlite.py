@@ -0,0 +1,34 @@
+import sqlite3
+import threading
+from typing import Optional
+
+class LazySQLite:
+    """
+    Conexión SQLite compartida que se abre (y crea su esquema) en el primer uso, no al
+    importar el módulo. Los stores la usan siempre desde hilos (asyncio.to_thread), así
+    que abrir el archivo tampoco bloquea el event loop.
+    """
+
+    def __init__(self, path: str, schema: tuple[str, ...]):
+        self.path = path
+        self.schema = schema
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            with self._lock:
+                if self._connection is None:
+                    connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                    # WAL permite lecturas concurrentes desde varios procesos
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    for statement in self.schema:
+                        connection.execute(statement)
+                    connection.commit()
+                    self._connection = connection
+        return self._connection
+
+    @property
+    def is_open(self) -> bool:
+        return self._connection is not None
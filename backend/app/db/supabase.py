@@ -1,13 +1,82 @@
+import json
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
+import threading
+from typing import Optional
+from app.utils.env import load_env
+from app.utils.http_pool import http_pool
 
-load_dotenv()
+load_env()
 
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_ANON_KEY")
+class SupabaseRepository:
+    """
+    Acceso asíncrono a las tablas de Supabase vía su API REST (PostgREST) sobre el pool HTTP
+    compartido. Reemplaza al cliente síncrono de supabase-py, que obligaba a usar un hilo por consulta.
+    """
 
-supabase: Client = create_client(url, key)
+    def __init__(self, url: str, key: str, schema: str = "public"):
+        if not url or not key:
+            raise RuntimeError("Faltan SUPABASE_URL y SUPABASE_SERVICE_ROLE_KEY (o SUPABASE_ANON_KEY)")
+        self.rest_url = url.rstrip("/") + "/rest/v1"
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+            "Accept-Profile": schema,
+            "Content-Profile": schema,
+        }
 
-def get_supabase():
-    return supabase
+    @classmethod
+    def from_env(cls) -> "SupabaseRepository":
+        # El backend usa la service role key si está disponible (tablas con RLS sin políticas públicas)
+        return cls(
+            os.getenv("SUPABASE_URL"),
+            os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY"),
+            os.getenv("SUPABASE_SCHEMA", "public"),
+        )
+
+    async def _request(self, method: str, table: str, params: Optional[dict] = None,
+                       body=None, prefer: Optional[str] = None):
+        headers = dict(self.headers)
+        if prefer:
+            headers["Prefer"] = prefer
+        response = await http_pool.client().request(
+            method, f"{self.rest_url}/{table}", params=params, headers=headers,
+            content=json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None,
+        )
+        response.raise_for_status()
+        return response
+
+    async def select_one(self, table: str, column: str, value: str, columns: str = "*") -> Optional[dict]:
+        response = await self._request("GET", table, params={"select": columns, column: f"eq.{value}", "limit": "1"})
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def select(self, table: str, filters: dict, columns: str = "*") -> list[dict]:
+        """`filters` en sintaxis de PostgREST, ej. {"day": "gte.2025-01-01"}."""
+        response = await self._request("GET", table, params={"select": columns, **filters})
+        return response.json()
+
+    async def insert(self, table: str, rows: list[dict]):
+        await self._request("POST", table, body=rows, prefer="return=minimal")
+
+    async def upsert(self, table: str, rows: list[dict], on_conflict: str):
+        """Un solo POST para todo el lote. PostgREST exige las mismas columnas en todas las filas."""
+        await self._request(
+            "POST", table, params={"on_conflict": on_conflict}, body=rows,
+            prefer="resolution=merge-duplicates,return=minimal",
+        )
+
+    async def update(self, table: str, column: str, value: str, fields: dict):
+        await self._request("PATCH", table, params={column: f"eq.{value}"}, body=fields, prefer="return=minimal")
+
+_repository: Optional[SupabaseRepository] = None
+_lock = threading.Lock()
+
+def get_supabase() -> SupabaseRepository:
+    """Repositorio creado en el primer uso (no al importar): los backends SQLite no lo necesitan nunca."""
+    global _repository
+    if _repository is None:
+        with _lock:
+            if _repository is None:
+                _repository = SupabaseRepository.from_env()
+    return _repository
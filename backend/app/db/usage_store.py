@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from app.db.sqlite import LazySQLite
+from app.utils.env import load_env
+
+load_env()
+
+# Cada flush agrega filas (día, usuario, endpoint) con los incrementos del intervalo; los
+# totales se suman al leer. Así no hace falta leer-modificar-escribir ni en SQLite ni en Supabase.
+COUNTERS = ("calls", "cache_hits", "prompt_tokens", "completion_tokens", "cache_hit_tokens",
+            "cost_usd", "llm_seconds")
+
+class SQLiteUsageStore:
+    """Consumo de tokens por día, usuario y endpoint (stand-in local de la tabla de Supabase)."""
+
+    def __init__(self, path: str, retention_days: int):
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._sqlite = LazySQLite(path, (
+            "CREATE TABLE IF NOT EXISTS llm_usage ("
+            "day TEXT NOT NULL, user_id TEXT NOT NULL, endpoint TEXT NOT NULL, "
+            "calls INTEGER NOT NULL, cache_hits INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, "
+            "completion_tokens INTEGER NOT NULL, cache_hit_tokens INTEGER NOT NULL, "
+            "cost_usd REAL NOT NULL, llm_seconds REAL NOT NULL, created_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS llm_usage_day ON llm_usage (day, user_id)",
+        ))
+
+    @property
+    def _db(self):
+        return self._sqlite.connection
+
+    def _insert(self, rows: list[dict]):
+        now = time.time()
+        columns = ("day", "user_id", "endpoint", *COUNTERS)
+        with self._lock:
+            self._db.execute("DELETE FROM llm_usage WHERE created_at < ?", (now - self.retention_days * 86400,))
+            self._db.executemany(
+                f"INSERT INTO llm_usage ({', '.join(columns)}, created_at) VALUES ({', '.join('?' for _ in columns)}, ?)",
+                [(*(row[c] for c in columns), now) for row in rows],
+            )
+            self._db.commit()
+
+    def _aggregate(self, since_day: str, user_id: Optional[str]) -> list[dict]:
+        sums = ", ".join(f"SUM({c}) AS {c}" for c in COUNTERS)
+        query = f"SELECT day, user_id, endpoint, {sums} FROM llm_usage WHERE day >= ?"
+        params: list = [since_day]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        with self._lock:
+            cursor = self._db.cursor()
+            cursor.row_factory = sqlite3.Row
+            rows = cursor.execute(query + " GROUP BY day, user_id, endpoint", params).fetchall()
+        return [dict(row) for row in rows]
+
+    async def insert(self, rows: list[dict]):
+        await asyncio.to_thread(self._insert, rows)
+
+    async def aggregate(self, since_day: str, user_id: Optional[str] = None) -> list[dict]:
+        return await asyncio.to_thread(self._aggregate, since_day, user_id)
+
+class SupabaseUsageStore:
+    """Misma interfaz sobre la tabla `llm_usage` de Supabase; se lee de la vista agregada (ver supabase_setup.sql)."""
+
+    TABLE = "llm_usage"
+    VIEW = "llm_usage_daily"
+
+    @property
+    def _client(self):
+        from app.db.supabase import get_supabase
+        return get_supabase()
+
+    async def insert(self, rows: list[dict]):
+        now = time.time()
+        await self._client.insert(self.TABLE, [{**row, "created_at": now} for row in rows])
+
+    async def aggregate(self, since_day: str, user_id: Optional[str] = None) -> list[dict]:
+        filters = {"day": f"gte.{since_day}"}
+        if user_id is not None:
+            filters["user_id"] = f"eq.{user_id}"
+        return await self._client.select(self.VIEW, filters, "day,user_id,endpoint," + ",".join(COUNTERS))
+
+def create_usage_store():
+    backend = os.getenv("USAGE_STORE_BACKEND", os.getenv("DOCUMENT_STORE_BACKEND", "sqlite")).lower()
+    if backend == "supabase":
+        return SupabaseUsageStore()
+    return SQLiteUsageStore(
+        os.getenv("USAGE_STORE_SQLITE_PATH", "thesia_usage.db"),
+        retention_days=int(os.getenv("USAGE_RETENTION_DAYS", "90")),
+    )
+
+usage_store = create_usage_store()
@@ -0,0 +1,120 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+from app.utils.env import load_env
+from app.utils.metrics import WRITE_BEHIND_FLUSHES, WRITE_BEHIND_PENDING, WRITE_BEHIND_ROWS
+
+load_env()
+
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "1000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL_SECONDS", "0.5"))
+WRITE_BEHIND_MAX_BACKOFF = 30.0
+
+_queues: list["WriteBehindQueue"] = []
+
+class WriteBehindQueue:
+    """
+    Escrituras diferidas por clave: `put` vuelve al instante y un flusher en segundo plano las
+    envía en lotes. Las escrituras a la misma clave se fusionan (solo viaja el estado final) y
+    `pending` permite leer lo que aún no llegó a la base. Si hay más de `max_pending` claves
+    esperando, `put` espera (back-pressure) en lugar de acumular memoria sin límite.
+    """
+
+    def __init__(self, name: str, flush: Callable[[list[tuple[str, dict]]], Awaitable[None]],
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 interval: float = WRITE_BEHIND_INTERVAL):
+        self.name = name
+        self._flush = flush
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending: dict[str, dict] = {}
+        # Lote en vuelo: sigue visible para lecturas hasta confirmarse
+        self._inflight: dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        _queues.append(self)
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Condition()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def pending(self, key: str) -> Optional[dict]:
+        inflight, pending = self._inflight.get(key), self._pending.get(key)
+        if inflight is None and pending is None:
+            return None
+        return {**(inflight or {}), **(pending or {})}
+
+    async def put(self, key: str, fields: dict):
+        self._ensure_flusher()
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            async with self._space:
+                await self._space.wait_for(lambda: key in self._pending or len(self._pending) < self.max_pending)
+        self._pending.setdefault(key, {}).update(fields)
+        WRITE_BEHIND_PENDING.set(len(self._pending), queue=self.name)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_batch(self) -> bool:
+        keys = list(self._pending)[:self.batch_size]
+        batch = [(key, self._pending.pop(key)) for key in keys]
+        self._inflight.update(batch)
+        WRITE_BEHIND_PENDING.set(len(self._pending), queue=self.name)
+        async with self._space:
+            self._space.notify_all()
+        try:
+            await self._flush(batch)
+        except Exception:
+            WRITE_BEHIND_FLUSHES.inc(queue=self.name, outcome="error")
+            # Se reencolan por debajo de lo escrito mientras tanto (lo más reciente gana)
+            for key, fields in batch:
+                self._pending[key] = {**fields, **self._pending.get(key, {})}
+            WRITE_BEHIND_PENDING.set(len(self._pending), queue=self.name)
+            return False
+        finally:
+            for key, _ in batch:
+                self._inflight.pop(key, None)
+        WRITE_BEHIND_FLUSHES.inc(queue=self.name, outcome="ok")
+        WRITE_BEHIND_ROWS.inc(len(batch), queue=self.name)
+        return True
+
+    async def _run(self):
+        backoff = self.interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            ok = True
+            while self._pending and ok:
+                ok = await self._flush_batch()
+            # Con la base caída se espera cada vez más entre reintentos
+            backoff = self.interval if ok else min(backoff * 2, WRITE_BEHIND_MAX_BACKOFF)
+
+    async def drain(self, timeout: float = 10.0):
+        """Envía lo pendiente (al apagar la app). Lo que no se pudo escribir dentro del plazo se pierde."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._pending and loop.time() < deadline:
+            if not await self._flush_batch():
+                await asyncio.sleep(min(self.interval, max(deadline - loop.time(), 0)))
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "inflight": len(self._inflight), "max_pending": self.max_pending}
+
+async def drain_all(timeout: float = 10.0):
+    await asyncio.gather(*(queue.drain(timeout) for queue in _queues))
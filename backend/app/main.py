@@ -1,3 +1,7 @@
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,36 +10,96 @@ from app.api.thesis import router as thesis_router
 from app.api.profile import router as profile_router
 from app.api.writing import router as writing_router
 from app.api.tech import router as tech_router
-import openai
+from app.api.monitoring import router as monitoring_router
+from app.api.jobs import router as jobs_router
+from app.api.usage import router as usage_router
+from app.db.write_behind import drain_all
+from app.services.ai_service import ai_service
+from app.services.document_service import document_service
+from app.services.job_service import job_service
+from app.services.prompt_registry import prompt_registry
+from app.services.provider_router import ProviderError
+from app.services.semantic_cache_service import semantic_cache
+from app.services.scheduler_service import OverloadedError, current_user_id, llm_scheduler
+from app.services.usage_service import QuotaExceededError, usage_service
+from app.services.warmup_service import STARTUP_PREWARM, warmup_service
+from app.utils.auth import resolve_user_id
+from app.utils.errors import describe_error
+from app.utils.http_pool import http_pool
+from app.utils.metrics import HTTP_INFLIGHT, HTTP_LATENCY, HTTP_REQUESTS, end_trace, server_timing_header, start_trace
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los clientes pesados (LLM, PyMuPDF, Supabase) se crean en el primer uso; con
+    # STARTUP_PREWARM se cargan en segundo plano sin retrasar la primera petición
+    if STARTUP_PREWARM:
+        warmup_service.start()
+    yield
+    await warmup_service.shutdown()
+    await job_service.shutdown()
+    # Las escrituras diferidas pendientes (ej. el estado final de los trabajos) salen antes de cerrar el pool
+    await drain_all()
+    await usage_service.shutdown()
+    await http_pool.aclose()
+    document_service.shutdown()
 
 app = FastAPI(
     title="ThesIA API",
     description="Asesor Metodológico Inteligente para Tesis Universitarias",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
-@app.exception_handler(openai.APIStatusError)
-async def openai_exception_handler(request: Request, exc: openai.APIStatusError):
-    # Detectar error de saldo insuficiente (402)
-    if exc.status_code == 402:
-        return JSONResponse(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            content={
-                "detail": "Saldo insuficiente en DeepSeek",
-                "type": "insufficient_balance",
-                "message": "Tu cuenta de DeepSeek no tiene saldo suficiente para procesar esta solicitud profesional. Por favor, recarga créditos en el panel de DeepSeek."
-            },
-        )
-    
-    # Otros errores de API
-    return JSONResponse(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content={
-            "detail": str(exc),
-            "type": "api_error",
-            "message": "Ocurrió un error al comunicarse con el motor de IA. Por favor, intenta de nuevo más tarde."
-        },
-    )
+@app.exception_handler(ProviderError)
+@app.exception_handler(OverloadedError)
+@app.exception_handler(QuotaExceededError)
+async def ai_exception_handler(request: Request, exc: Exception):
+    # 402 saldo, 503 límite del proveedor o sobrecarga, 429 cuota diaria (ver app/utils/errors.py)
+    status_code, headers, content = describe_error(exc)
+    return JSONResponse(status_code=status_code, headers=headers, content=content)
+
+@app.middleware("http")
+async def user_context_middleware(request: Request, call_next):
+    # Identifica al usuario para los límites por usuario (JWT de Supabase verificado o IP)
+    token = current_user_id.set(resolve_user_id(request))
+    usage_token = usage_service.start_request()
+    try:
+        response = await call_next(request)
+        usage = usage_service.end_request(usage_token)
+        usage_token = None
+        if usage.get("calls"):
+            # Consumo de esta petición (en streams la respuesta sale antes de conocerlo)
+            response.headers["X-LLM-Tokens"] = str(usage["prompt_tokens"] + usage["completion_tokens"])
+            response.headers["X-LLM-Cost-USD"] = f"{usage['cost_usd']:.6f}"
+        return response
+    finally:
+        if usage_token is not None:
+            usage_service.end_request(usage_token)
+        current_user_id.reset(token)
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    HTTP_INFLIGHT.inc()
+    trace = start_trace()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        spans = end_trace(trace)
+        trace = None
+        if spans:
+            # Desglose por etapa visible en las DevTools del navegador
+            response.headers["Server-Timing"] = server_timing_header(spans)
+        return response
+    finally:
+        if trace is not None:
+            end_trace(trace)
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_INFLIGHT.dec()
+        HTTP_REQUESTS.inc(method=request.method, route=path, status=str(status_code))
+        HTTP_LATENCY.observe(time.perf_counter() - started, method=request.method, route=path)
 
 # Configuración de CORS
 app.add_middleware(
@@ -51,6 +115,9 @@ app.include_router(thesis_router)
 app.include_router(profile_router)
 app.include_router(writing_router)
 app.include_router(tech_router)
+app.include_router(monitoring_router)
+app.include_router(jobs_router)
+app.include_router(usage_router)
 
 @app.get("/")
 async def root():
@@ -59,3 +126,38 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness(warm: bool = False):
+    """Listo cuando los componentes pesados están cargados; ?warm=true espera a cargarlos."""
+    if warm:
+        await warmup_service.start()
+    body = warmup_service.status()
+    body["import_seconds"] = IMPORT_SECONDS
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if body["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=body,
+    )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**ai_service.cache.stats(), "semantic": semantic_cache.stats()}
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    return llm_scheduler.stats()
+
+@app.get("/singleflight/stats")
+async def singleflight_stats():
+    return ai_service.single_flight.stats()
+
+@app.get("/providers/stats")
+async def providers_stats():
+    return ai_service.router.stats()
+
+@app.get("/prompts/stats")
+async def prompts_stats():
+    return prompt_registry.stats()
+
+# Tiempo de importación de la app (ver benchmarks/startup_benchmark.py)
+IMPORT_SECONDS = round(time.perf_counter() - _import_started, 3)
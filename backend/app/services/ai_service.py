@@ -1,28 +1,225 @@
+import asyncio
 import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+import time
+from typing import AsyncIterator, Optional
+from pydantic import BaseModel, ValidationError
+from app.utils.env import load_env
+from app.services.cache_service import ResponseCache
+from app.services.prompt_registry import estimate_tokens, prompt_registry
+from app.services.provider_router import ProviderRouter, import_sdk
+from app.services.scheduler_service import llm_scheduler
+from app.services.singleflight_service import SingleFlight
+from app.services.usage_service import usage_service
+from app.utils.json_repair import repair_json
+from app.utils.metrics import LLM_INFLIGHT, observe_llm_call, record_cancelled_call, record_token_usage, stage
 
-load_dotenv()
+load_env()
+
+CONTINUATION_PROMPT = (
+    "Tu respuesta anterior se cortó. Continúa EXACTAMENTE desde el último carácter, "
+    "sin repetir nada y sin añadir texto fuera del JSON."
+)
 
 class AIService:
     def __init__(self):
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        # DeepSeek usa compatibilidad con OpenAI API
-        self.llm = ChatOpenAI(
-            model='deepseek-chat', 
-            openai_api_key=api_key, 
-            openai_api_base='https://api.deepseek.com/v1',
-            max_tokens=2048
-        )
+        self.max_tokens = 2048
+        # JSON mode (response_format=json_object) del proveedor; desactivable si el modelo no lo soporta
+        self.json_mode = os.getenv("LLM_JSON_MODE", "true").lower() in ("1", "true", "yes")
+        # Backends compatibles con OpenAI API (DeepSeek por defecto) con failover y hedging entre ellos
+        self.router = ProviderRouter.from_env()
+        # Las claves de caché usan el modelo principal: la respuesta no depende de qué proveedor ganó
+        self.model = self.router.primary.model
+        self.cache = ResponseCache.from_env()
+        self.single_flight = SingleFlight.from_env()
 
-    async def get_response(self, system_prompt: str, user_prompt: str):
-        messages = [
+    @staticmethod
+    def _messages(system_prompt: str, user_prompt: str):
+        # Import diferido: langchain_core no hace falta para arrancar la API
+        from langchain_core.messages import SystemMessage, HumanMessage
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=user_prompt)
         ]
-        response = await self.llm.ainvoke(messages)
-        return response.content
+
+    def _llm_kwargs(self, max_tokens: int, json_mode: bool) -> dict:
+        kwargs = {"max_tokens": max_tokens}
+        if json_mode and self.json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    def _model_tag(self, json_mode: bool) -> str:
+        return f"{self.model}+json" if json_mode and self.json_mode else self.model
+
+    async def _generate(self, messages: list, **kwargs):
+        # El router usa agenerate, que conserva el bloque `usage` del proveedor (ainvoke lo descarta)
+        return await self.router.generate(messages, **kwargs)
+
+    async def _cached_call(self, key: str, messages: list, endpoint: Optional[str],
+                           cache_enabled: bool, store: bool = True, fresh: bool = False, **kwargs) -> str:
+        if cache_enabled and not fresh:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                usage_service.record_cache_hit(endpoint)
+                return cached
+
+        # Presupuesto diario del usuario: solo cuenta lo que llega al proveedor
+        usage_service.check_quota()
+
+        async def invoke():
+            started = None
+            try:
+                async with llm_scheduler.slot(endpoint):
+                    started = time.monotonic()
+                    LLM_INFLIGHT.inc(endpoint=endpoint or "unknown")
+                    try:
+                        with stage("llm.call"):
+                            content, llm_output = await self._generate(messages, **kwargs)
+                    finally:
+                        LLM_INFLIGHT.dec(endpoint=endpoint or "unknown")
+            except asyncio.CancelledError:
+                # Cliente desconectado: la petición HTTP al proveedor se corta aquí y se libera el slot
+                record_cancelled_call(endpoint, None if started is None else time.monotonic() - started)
+                raise
+            observe_llm_call(endpoint, time.monotonic() - started, llm_output)
+            record_token_usage(endpoint, llm_output)
+            usage_service.record(endpoint, llm_output, time.monotonic() - started)
+            prompt_registry.observe(messages[0].content, llm_output)
+            if cache_enabled and store:
+                await self.cache.aset(key, content)
+            return content
+
+        # Peticiones idénticas simultáneas (doble clic, toda una clase a la vez) comparten una sola llamada;
+        # una petición `fresh` (sin caché o reintento) siempre llega al modelo
+        return await self.single_flight.run(key, invoke, shared=not fresh)
+
+    def _response_key(self, system_prompt: str, user_prompt: str, max_tokens: int, json_mode: bool) -> str:
+        return ResponseCache.make_key(self._model_tag(json_mode), max_tokens, system_prompt, user_prompt)
+
+    def _continuation_key(self, system_prompt: str, user_prompt: str, partial: str, max_tokens: int) -> str:
+        return ResponseCache.make_key(self.model, max_tokens, system_prompt, f"{user_prompt}\x00{partial}")
+
+    async def get_response(self, system_prompt: str, user_prompt: str,
+                           endpoint: Optional[str] = None, use_cache: bool = True,
+                           max_tokens: Optional[int] = None, json_mode: bool = False,
+                           store: bool = True, fresh: bool = False):
+        """
+        Con `store=False` se lee de la caché pero no se escribe: el llamador guarda con `remember` tras validar.
+        Con `fresh=True` (reintentos) no se lee la caché ni se comparte la llamada con otras idénticas.
+        """
+        max_tokens = max_tokens or self.max_tokens
+        key = self._response_key(system_prompt, user_prompt, max_tokens, json_mode)
+        await import_sdk()
+        return await self._cached_call(
+            key, self._messages(system_prompt, user_prompt), endpoint,
+            use_cache and self.cache.is_enabled(endpoint), store, fresh or not use_cache,
+            **self._llm_kwargs(max_tokens, json_mode),
+        )
+
+    async def remember(self, system_prompt: str, user_prompt: str, content: str,
+                       endpoint: Optional[str] = None, max_tokens: Optional[int] = None,
+                       json_mode: bool = False, partial: Optional[str] = None):
+        """Guarda una respuesta ya validada; con `partial`, la cola de una continuación."""
+        if not self.cache.is_enabled(endpoint):
+            return
+        max_tokens = max_tokens or self.max_tokens
+        if partial is None:
+            key = self._response_key(system_prompt, user_prompt, max_tokens, json_mode)
+        else:
+            key = self._continuation_key(system_prompt, user_prompt, partial, max_tokens)
+        # Si vino de la caché ya está guardada: no se reescribe (ni se renueva su TTL)
+        if self.cache.peek(key) != content:
+            await self.cache.aset(key, content)
+
+    async def continue_response(self, system_prompt: str, user_prompt: str, partial: str,
+                                endpoint: Optional[str] = None, use_cache: bool = True,
+                                max_tokens: Optional[int] = None, store: bool = True,
+                                fresh: bool = False) -> str:
+        """
+        Pide solo la cola que falta de una respuesta cortada: la salida parcial va como
+        mensaje del asistente y el modelo continúa desde el último carácter.
+        Sin JSON mode, porque este obligaría a abrir un objeto nuevo.
+        """
+        await import_sdk()
+        from langchain_core.messages import AIMessage, HumanMessage
+        max_tokens = max_tokens or self.max_tokens
+        messages = self._messages(system_prompt, user_prompt) + [
+            AIMessage(content=partial),
+            HumanMessage(content=CONTINUATION_PROMPT),
+        ]
+        key = self._continuation_key(system_prompt, user_prompt, partial, max_tokens)
+        return await self._cached_call(
+            key, messages, endpoint, use_cache and self.cache.is_enabled(endpoint), store,
+            fresh or not use_cache, max_tokens=max_tokens,
+        )
+
+    def admit(self, endpoint: Optional[str] = None):
+        """Cuota diaria y admisión del scheduler, para rechazar un stream con su status antes de abrirlo."""
+        usage_service.check_quota()
+        llm_scheduler.check_admission(endpoint)
+
+    async def astream(self, system_prompt: str, user_prompt: str,
+                      endpoint: Optional[str] = None, use_cache: bool = True,
+                      max_tokens: Optional[int] = None, json_mode: bool = False,
+                      schema: Optional[type[BaseModel]] = None) -> AsyncIterator[str]:
+        """
+        Emite los fragmentos de texto a medida que llegan del modelo. La respuesta completa solo se
+        guarda en caché si `schema` está dado y el JSON final (sin cortes) valida contra él.
+        """
+        max_tokens = max_tokens or self.max_tokens
+        cache_enabled = use_cache and self.cache.is_enabled(endpoint)
+        if cache_enabled:
+            key = self._response_key(system_prompt, user_prompt, max_tokens, json_mode)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                usage_service.record_cache_hit(endpoint)
+                yield cached
+                return
+
+        usage_service.check_quota()
+        await import_sdk()
+
+        def record_usage():
+            # El stream no trae el bloque `usage`: tokens estimados de lo enviado y lo recibido
+            if started is not None:
+                usage_service.record(endpoint, {"token_usage": {
+                    "prompt_tokens": estimate_tokens(system_prompt + user_prompt),
+                    "completion_tokens": estimate_tokens("".join(parts)),
+                }}, time.monotonic() - started)
+
+        parts = []
+        started = None
+        try:
+            async with llm_scheduler.slot(endpoint):
+                started = time.monotonic()
+                LLM_INFLIGHT.inc(endpoint=endpoint or "unknown")
+                try:
+                    with stage("llm.stream"):
+                        async for chunk in self.router.astream(self._messages(system_prompt, user_prompt),
+                                                             **self._llm_kwargs(max_tokens, json_mode)):
+                            if chunk.content:
+                                parts.append(chunk.content)
+                                yield chunk.content
+                finally:
+                    LLM_INFLIGHT.dec(endpoint=endpoint or "unknown")
+        except (asyncio.CancelledError, GeneratorExit):
+            # El cliente cerró el stream SSE antes de terminar
+            record_cancelled_call(endpoint, None if started is None else time.monotonic() - started)
+            record_usage()
+            raise
+
+        record_usage()
+        # La clave es la misma que lee structured_output (endpoints no-streaming): solo se guarda un
+        # stream que terminó completo y valida, nunca uno cortado o malformado
+        if cache_enabled and schema is not None:
+            content = "".join(parts)
+            result = repair_json(content)
+            if not result.ok or result.truncated:
+                return
+            try:
+                schema.model_validate(result.value)
+            except ValidationError:
+                return
+            await self.cache.aset(key, content)
 
 # Singleton instance
 ai_service = AIService()
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.db.sqlite import LazySQLite
+from app.utils.env import load_env
+
+load_env()
+
+class ResponseCache:
+    """
+    Caché de respuestas del LLM direccionada por contenido.
+    Nivel 1: LRU en memoria con TTL y límite de entradas/bytes.
+    Nivel 2 (opcional): SQLite en disco, compartido entre workers de gunicorn.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_seconds: int = 24 * 3600, sqlite_path: Optional[str] = None,
+                 disabled_endpoints: Optional[set] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disabled_endpoints = disabled_endpoints or set()
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # El disco tiene su propio lock: una escritura lenta en SQLite no bloquea la memoria
+        self._db_lock = threading.Lock()
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "evictions": 0}
+        # El archivo se abre en la primera lectura/escritura del disco (en un hilo), no al importar
+        self._sqlite = LazySQLite(sqlite_path, (
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)",
+        )) if sqlite_path else None
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        disabled = os.getenv("AI_CACHE_DISABLED_ENDPOINTS", "")
+        return cls(
+            max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "512")),
+            max_bytes=int(os.getenv("AI_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=int(os.getenv("AI_CACHE_TTL_SECONDS", str(24 * 3600))),
+            sqlite_path=os.getenv("AI_CACHE_SQLITE_PATH") or None,
+            disabled_endpoints={e.strip() for e in disabled.split(",") if e.strip()},
+            enabled=os.getenv("AI_CACHE_ENABLED", "true").lower() == "true",
+        )
+
+    @staticmethod
+    def make_key(model: str, max_tokens: int, system_prompt: str, user_prompt: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, str(max_tokens), system_prompt, user_prompt):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def is_enabled(self, endpoint: Optional[str] = None) -> bool:
+        return self.enabled and endpoint not in self.disabled_endpoints
+
+    @property
+    def _db(self):
+        return self._sqlite.connection
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                created_at, value = item
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats["hits_memory"] += 1
+                    return value
+                self._remove(key)
+        return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[str]:
+        if self._sqlite is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM ai_response_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                with self._lock:
+                    self._insert(key, row[0], row[1])
+                    self._stats["hits_disk"] += 1
+                return row[0]
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _set_disk(self, key: str, value: str, now: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO ai_response_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, now),
+            )
+            # Purga perezosa de entradas expiradas para que el archivo no crezca sin límite
+            self._db.execute(
+                "DELETE FROM ai_response_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Versión bloqueante (para hilos); desde el event loop usar `aget`."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        return value if value is not None else self._get_disk(key, now)
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._insert(key, value, now)
+        if self._sqlite is not None:
+            self._set_disk(key, value, now)
+
+    def peek(self, key: str) -> Optional[str]:
+        """Valor en memoria sin contar acierto ni renovar el LRU."""
+        with self._lock:
+            item = self._entries.get(key)
+        return item[1] if item is not None else None
+
+    async def aget(self, key: str) -> Optional[str]:
+        # La memoria se consulta en el propio loop; solo el SQLite va a un hilo
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None or self._sqlite is None:
+            if value is None:
+                with self._lock:
+                    self._stats["misses"] += 1
+            return value
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    async def aset(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._insert(key, value, now)
+        if self._sqlite is not None:
+            await asyncio.to_thread(self._set_disk, key, value, now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._sqlite is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM ai_response_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["hits_memory"] + self._stats["hits_disk"]
+            total = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+                "disk_tier": self._sqlite is not None,
+            }
+
+    # --- Helpers internos (llamar con el lock tomado) ---
+
+    def _insert(self, key: str, value: str, created_at: float):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (created_at, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
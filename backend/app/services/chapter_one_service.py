@@ -1,10 +1,16 @@
-from app.services.ai_service import ai_service
-import json
+from app.services.prompt_registry import prompt_registry
+from app.services.structured_output_service import structured_output
+from app.services.response_schemas import ChapterReviewResult
+from app.services.revision_service import revision_service
+from app.utils.metrics import traced
+from typing import Optional
+
+CONTEXT_CHARS = 300
 
 class ChapterOneService:
-    @staticmethod
-    async def review_chapter_one(title: str, problem_description: str, objectives: str, justification: str):
-        system_prompt = """
+    REVIEW_PROMPT = prompt_registry.register(
+        "thesis.chapter_one",
+        system="""
         Eres un asesor de tesis experto. Tu tarea es revisar el Capítulo I (Planteamiento del Problema) de un estudiante.
         Debes evaluar la COHERENCIA entre:
         1. El Problema descrito.
@@ -23,22 +29,128 @@ class ChapterOneService:
           ],
           "draft_suggestion": "Un párrafo sugerido que mejore la conexión de estas ideas."
         }
-        """
-        
-        user_prompt = f"""
+        """,
+        user="""
         Tesis: {title}
         Borrador del Capítulo 1:
         - Descripción del Problema: {problem_description}
         - Objetivos: {objectives}
         - Justificación: {justification}
-        """
-        
-        response = await ai_service.get_response(system_prompt, user_prompt)
-        
-        try:
-            clean_response = response.strip().replace("```json", "").replace("```", "")
-            return json.loads(clean_response)
-        except Exception as e:
-            return {"error": "Error al procesar la revisión", "raw": response}
+        """,
+        budget=6000,
+        trim=("problem_description", "justification", "objectives"),
+    )
+
+    # La evaluación anterior y los párrafos cambiados van en el mensaje de usuario, detrás del prefijo fijo
+    INCREMENTAL_PROMPT = prompt_registry.register(
+        "thesis.chapter_one.incremental",
+        system="""
+        Eres un asesor de tesis experto. Ya revisaste una versión anterior del Capítulo I (Planteamiento del Problema) de un estudiante.
+        Recibirás tu evaluación anterior, el inicio de cada sección como contexto y SOLO los párrafos que el estudiante agregó o modificó.
+
+        Actualiza la evaluación de las secciones afectadas considerando la COHERENCIA entre Problema, Objetivos y Justificación.
+        No repitas la evaluación de las secciones que no cambiaron.
+
+        Responde ÚNICAMENTE en formato JSON:
+        {
+          "feedback_general": "Resumen experto actualizado",
+          "revisions": [
+            {"section": "Problema/Objetivos/Justificación (solo las afectadas)", "evaluation": "Buena/Regular/Mejorable", "suggestions": "Tips específicos"}
+          ],
+          "draft_suggestion": "Un párrafo sugerido que mejore la conexión de estas ideas."
+        }
+        """,
+        user="""
+        Tesis: {title}
+        Evaluación anterior: {previous}
+        {changes}
+        """,
+    )
+
+    @staticmethod
+    @traced("chapter_one.review_chapter_one", endpoint="thesis.chapter_one")
+    async def review_chapter_one(title: str, problem_description: str, objectives: str, justification: str,
+                                 document_id: Optional[str] = None):
+        drafts = {"Problema": problem_description, "Objetivos": objectives, "Justificación": justification}
+        paragraphs = {section: revision_service.split_paragraphs(text) for section, text in drafts.items()}
+        hashes = {
+            section: [revision_service.paragraph_hash(p) for p in items]
+            for section, items in paragraphs.items()
+        }
+
+        previous = await revision_service.load("chapter_one", document_id)
+        if previous and previous.get("title") == title:
+            result = await ChapterOneService._review_incremental(title, paragraphs, hashes, previous)
+        else:
+            system_prompt, user_prompt = ChapterOneService.REVIEW_PROMPT.render(
+                title=title, problem_description=problem_description,
+                objectives=objectives, justification=justification,
+            )
+            result = await structured_output.generate(
+                system_prompt, user_prompt, ChapterReviewResult,
+                endpoint="thesis.chapter_one", error_message="Error al procesar la revisión",
+            )
+            if document_id and "error" not in result:
+                result["incremental"] = {
+                    "sections_changed": list(drafts),
+                    "paragraphs_sent": sum(len(h) for h in hashes.values()),
+                    "paragraphs_total": sum(len(h) for h in hashes.values()),
+                }
+
+        if document_id and "error" not in result:
+            stored = {k: v for k, v in result.items() if k != "incremental"}
+            await revision_service.save("chapter_one", document_id, {
+                "title": title, "hashes": hashes, "result": stored,
+            })
+        return result
+
+    @staticmethod
+    async def _review_incremental(title: str, paragraphs: dict, hashes: dict, previous: dict) -> dict:
+        previous_hashes = previous.get("hashes", {})
+        previous_result = previous["result"]
+        changed, removed = {}, {}
+        for section, items in paragraphs.items():
+            known = set(previous_hashes.get(section, []))
+            changed[section] = [p for p, h in zip(items, hashes[section]) if h not in known]
+            removed[section] = len(known - set(hashes[section]))
+        affected = [s for s in paragraphs if changed[s] or removed[s]]
+        meta = {
+            "sections_changed": affected,
+            "paragraphs_sent": sum(len(v) for v in changed.values()),
+            "paragraphs_total": sum(len(h) for h in hashes.values()),
+        }
+        if not affected:
+            return {**previous_result, "incremental": meta}
+
+        blocks = []
+        for section, items in paragraphs.items():
+            context = " ".join(items)[:CONTEXT_CHARS]
+            blocks.append(f"[{section}] Contexto: {context}")
+            if section in affected:
+                blocks.extend(f"  + {p}" for p in changed[section])
+                if removed[section]:
+                    blocks.append(f"  (se eliminaron {removed[section]} párrafos)")
+
+        system_prompt, user_prompt = ChapterOneService.INCREMENTAL_PROMPT.render(
+            title=title, previous=previous_result, changes="\n".join(blocks),
+        )
+        update = await structured_output.generate(
+            system_prompt, user_prompt, ChapterReviewResult,
+            endpoint="thesis.chapter_one", error_message="Error al procesar la revisión",
+        )
+        if "error" in update:
+            return update
+
+        # Las secciones sin cambios conservan su evaluación anterior
+        revisions = {r.get("section"): r for r in previous_result.get("revisions", [])}
+        for revision in update["revisions"]:
+            revisions[revision["section"]] = revision
+        return {
+            **previous_result,
+            "feedback_general": update["feedback_general"] or previous_result.get("feedback_general"),
+            "revisions": list(revisions.values()),
+            "draft_suggestion": update.get("draft_suggestion") or previous_result.get("draft_suggestion"),
+            "incremental": meta,
+        }
 
 chapter_one_service = ChapterOneService()
@@ -1,18 +1,135 @@
-import fitz  # PyMuPDF
-from fastapi import UploadFile
+from app.utils.metrics import traced
+from app.utils.uploads import SpooledUpload
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, Optional, Union
+import asyncio
+import multiprocessing
 import os
+import threading
+
+if TYPE_CHECKING:
+    import fitz
+
+# Documentos con menos páginas se procesan en un hilo: arrancar procesos no compensa
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Un PDF puede llegar como ruta en disco (subidas, ver app/utils/uploads.py) o como bytes
+PdfSource = Union[str, bytes]
+
+def _open(source: PdfSource) -> "fitz.Document":
+    # PyMuPDF se importa con el primer PDF: no hace falta para arrancar la API
+    import fitz
+    # Desde una ruta, PyMuPDF lee las páginas del archivo a demanda en lugar de cargarlo entero
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+# PyMuPDF no es thread-safe: dos subidas concurrentes extrayendo en hilos distintos tumban el proceso.
+# El lock se toma por página para que un documento grande no bloquee a los demás todo el tiempo.
+_FITZ_LOCK = threading.Lock()
+
+def _page_count(source: PdfSource) -> int:
+    with _FITZ_LOCK:
+        doc = _open(source)
+        try:
+            return doc.page_count
+        finally:
+            doc.close()
+
+def _extract_page_range(source: PdfSource, start: int, end: int) -> str:
+    # Función de módulo para que el ProcessPoolExecutor pueda serializarla.
+    # Con una ruta, a cada proceso solo viaja el string y no una copia del PDF.
+    with _FITZ_LOCK:
+        doc = _open(source)
+    try:
+        parts = []
+        for i in range(start, end):
+            with _FITZ_LOCK:
+                parts.append(doc[i].get_text())
+        return "".join(parts)
+    finally:
+        with _FITZ_LOCK:
+            doc.close()
 
 class DocumentService:
+    _executor: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            # "spawn" evita heredar hilos/locks del event loop del worker
+            cls._executor = ProcessPoolExecutor(
+                max_workers=PDF_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @staticmethod
+    @traced("pdf.extract")
+    async def extract_text_from_bytes(content: PdfSource) -> str:
+        """Acepta los bytes del PDF o la ruta del archivo ya volcado a disco."""
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(None, _page_count, content)
+        if page_count < PDF_PARALLEL_MIN_PAGES or PDF_MAX_WORKERS <= 1:
+            return await loop.run_in_executor(None, _extract_page_range, content, 0, page_count)
+
+        # Rangos de páginas contiguos, uno por worker, unidos en orden
+        step = -(-page_count // PDF_MAX_WORKERS)
+        executor = DocumentService._get_executor()
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(executor, _extract_page_range, content, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ])
+        return "".join(parts)
+
+    @staticmethod
+    async def extract_text_from_upload(upload: SpooledUpload) -> str:
+        return await DocumentService.extract_text_from_bytes(upload.path)
+
+    @staticmethod
+    def iter_pages(content: PdfSource) -> Iterator[str]:
+        with _FITZ_LOCK:
+            doc = _open(content)
+            page_count = doc.page_count
+        try:
+            for i in range(page_count):
+                with _FITZ_LOCK:
+                    text = doc[i].get_text()
+                yield text
+        finally:
+            with _FITZ_LOCK:
+                doc.close()
+
     @staticmethod
-    async def extract_text_from_pdf(file: UploadFile) -> str:
-        # Guardar temporalmente si es necesario o leer de memoria
-        content = await file.read()
-        doc = fitz.open(stream=content, filetype="pdf")
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        return text
+    async def aiter_pages(content: PdfSource) -> AsyncIterator[str]:
+        """Texto página por página sin bloquear el event loop; el consumidor puede cortar cuando quiera."""
+        loop = asyncio.get_running_loop()
+        pages = DocumentService.iter_pages(content)
+        sentinel = object()
+        pending = None
+        try:
+            while True:
+                pending = loop.run_in_executor(None, next, pages, sentinel)
+                # Si cancelan al consumidor, la página en curso sigue en su hilo hasta terminar
+                text = await asyncio.shield(pending)
+                if text is sentinel:
+                    break
+                yield text
+        finally:
+            # El generador no se puede cerrar mientras un hilo lo avanza: se espera esa página y se
+            # cierra también en un hilo (iter_pages cierra el documento bajo _FITZ_LOCK)
+            if pending is not None and not pending.done():
+                with suppress(Exception):
+                    await pending
+            await asyncio.to_thread(pages.close)
 
     @staticmethod
     def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[str]:
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import uuid
+from typing import Awaitable, Callable, Optional
+from app.utils.env import load_env
+from app.db.job_store import job_store
+from app.services.ai_service import ai_service
+from app.services.scheduler_service import OverloadedError, current_user_id
+from app.services.structured_output_service import StructuredOutputService
+from app.services.response_schemas import FullChapterResult, StructureResult
+from app.services.writing_service import WritingService, writing_service
+from app.services.structure_service import StructureService
+from app.services.usage_service import usage_service
+from app.services.regulation_service import regulation_service
+from app.utils.metrics import JOBS_QUEUED, JOBS_RUNNING, JOBS_TOTAL
+from app.utils.streaming import JsonArrayStreamer
+
+load_env()
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+class JobContext:
+    """Lo que recibe cada handler: publicar resultados parciales y consultar el trabajo."""
+
+    def __init__(self, job_id: str, payload: dict, attachment: object = None):
+        self.job_id = job_id
+        self.payload = payload
+        self.attachment = attachment
+        self.progress: dict = {}
+
+    async def report(self, **progress):
+        self.progress.update(progress)
+        await job_store.update(self.job_id, progress=self.progress)
+
+    async def add_item(self, key: str, item):
+        self.progress.setdefault(key, []).append(item)
+        await job_store.update(self.job_id, progress=self.progress)
+
+class JobService:
+    """
+    Trabajos en segundo plano para las generaciones largas: el POST devuelve un id de inmediato
+    y un pool de workers asyncio con concurrencia acotada los procesa. El estado, los resultados
+    parciales y el final se persisten en el job store, así cualquier worker puede servirlos.
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv("JOB_WORKERS", "4"))
+        self.max_queue = int(os.getenv("JOB_MAX_QUEUE", "200"))
+        self.cancel_poll_seconds = float(os.getenv("JOB_CANCEL_POLL_SECONDS", "2"))
+        self.handlers: dict[str, Callable[[JobContext], Awaitable[dict]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+        self._shutting_down = False
+        # Datos que no se persisten (ej. el PDF subido); viven solo en el worker que aceptó el trabajo
+        self._attachments: dict[str, object] = {}
+
+    def register(self, kind: str, handler: Callable[[JobContext], Awaitable[dict]]):
+        self.handlers[kind] = handler
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.workers:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, kind: str, payload: dict, attachment: object = None) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        self._ensure_workers()
+        if self._queue.full():
+            raise OverloadedError(retry_after=5, reason="job_queue_full")
+        # Sin presupuesto no se encola: el trabajo fallaría igual al llegar al LLM
+        usage_service.check_quota()
+
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "user_id": current_user_id.get(), "kind": kind,
+               "status": "queued", "payload": payload}
+        await job_store.create(job)
+        if attachment is not None:
+            self._attachments[job_id] = attachment
+        self._queue.put_nowait(job_id)
+        JOBS_QUEUED.inc()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = await job_store.get(job_id)
+        # Cada usuario solo ve sus propios trabajos
+        if job is None or job.get("user_id") != current_user_id.get():
+            return None
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        job = await self.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return job
+        if job["status"] == "queued":
+            await job_store.update(job_id, status="cancelled", cancel_requested=True)
+        else:
+            # Si corre en otro worker, este lo detecta por sondeo y se cancela allí
+            await job_store.update(job_id, cancel_requested=True)
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+        return await job_store.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            JOBS_QUEUED.dec()
+            try:
+                await self._run(job_id)
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        attachment = self._attachments.pop(job_id, None)
+        try:
+            await self._execute(job_id, attachment)
+        finally:
+            # Los adjuntos en disco (PDF subido) se borran pase lo que pase con el trabajo
+            if hasattr(attachment, "cleanup"):
+                await asyncio.to_thread(attachment.cleanup)
+
+    async def _execute(self, job_id: str, attachment: object):
+        job = await job_store.get(job_id)
+        if job is None or job["status"] != "queued" or job.get("cancel_requested"):
+            return
+
+        context = JobContext(job_id, job["payload"] or {}, attachment)
+        user_token = current_user_id.set(job.get("user_id") or "anonymous")
+        await job_store.update(job_id, status="running")
+        task = asyncio.create_task(self.handlers[job["kind"]](context))
+        self._running[job_id] = task
+        watcher = asyncio.create_task(self._watch_cancel(job_id, task))
+        JOBS_RUNNING.inc()
+        status = "failed"
+        try:
+            result = await task
+            failed = isinstance(result, dict) and "error" in result and "raw" in result
+            status = "failed" if failed else "succeeded"
+            await job_store.update(
+                job_id, status=status, result=result,
+                error=result.get("error") if failed else None,
+            )
+        except asyncio.CancelledError:
+            if self._shutting_down:
+                await job_store.update(job_id, status="failed", error="Trabajo interrumpido por reinicio del servidor")
+                raise
+            status = "cancelled"
+            await job_store.update(job_id, status=status, cancel_requested=True)
+        except Exception as exc:
+            await job_store.update(job_id, status="failed", error=str(exc))
+        finally:
+            watcher.cancel()
+            self._running.pop(job_id, None)
+            current_user_id.reset(user_token)
+            JOBS_RUNNING.dec()
+            JOBS_TOTAL.inc(kind=job["kind"], status=status)
+
+    async def _watch_cancel(self, job_id: str, task: asyncio.Task):
+        # Cancelaciones pedidas a otro worker (la petición de cancelación puede caer en cualquiera)
+        while not task.done():
+            await asyncio.sleep(self.cancel_poll_seconds)
+            job = await job_store.get(job_id)
+            if job and job.get("cancel_requested"):
+                task.cancel()
+                return
+
+    async def shutdown(self):
+        self._shutting_down = True
+        for task in list(self._running.values()):
+            task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for attachment in self._attachments.values():
+            if hasattr(attachment, "cleanup"):
+                attachment.cleanup()
+        self._attachments.clear()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len([w for w in self._workers if not w.done()]),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": len(self._running),
+        }
+
+    @staticmethod
+    async def stream_json(context: JobContext, system_prompt: str, user_prompt: str, endpoint: str,
+                          array_key: str, schema, error_message: str) -> dict:
+        """Genera por streaming y publica cada elemento de `array_key` como resultado parcial."""
+        streamer = JsonArrayStreamer(array_key)
+        async for chunk in ai_service.astream(system_prompt, user_prompt, endpoint=endpoint, json_mode=True,
+                                             schema=schema):
+            for _, value in streamer.feed(chunk):
+                await context.add_item(array_key, value)
+        data, _ = StructuredOutputService.parse(streamer.buffer, schema)
+        if data is None:
+            return {"error": error_message, "raw": streamer.buffer}
+        return data
+
+async def _full_chapter_job(context: JobContext) -> dict:
+    data, profile = context.payload["data"], context.payload["profile"]
+    if context.payload.get("parallel"):
+        return await writing_service.generate_full_chapter(
+            data, profile, parallel=True,
+            on_section=lambda section: context.add_item("sections", section),
+        )
+    system_prompt, user_prompt = WritingService._full_chapter_prompts(data, profile)
+    return await JobService.stream_json(
+        context, system_prompt, user_prompt, "writing.full_chapter",
+        "sections", FullChapterResult, "Error al generar capítulo",
+    )
+
+async def _structure_job(context: JobContext) -> dict:
+    payload = context.payload
+    system_prompt, user_prompt = await StructureService._build_prompts(
+        payload["title"], payload["objective"], payload.get("regulation_structure"), payload.get("document_hash")
+    )
+    return await JobService.stream_json(
+        context, system_prompt, user_prompt, "thesis.structure",
+        "chapters", StructureResult, "Error al generar la estructura",
+    )
+
+async def _regulations_job(context: JobContext) -> dict:
+    upload = context.attachment
+    return await regulation_service.analyze_regulation_content(
+        upload.path, document_hash=upload.sha256,
+        on_progress=lambda progress: context.report(**progress),
+    )
+
+job_service = JobService()
+job_service.register("writing.full_chapter", _full_chapter_job)
+job_service.register("thesis.structure", _structure_job)
+job_service.register("analysis.regulations", _regulations_job)
@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from pydantic import BaseModel
 
 class ProfileConfig(BaseModel):
@@ -14,51 +14,76 @@ class ProfileValidationResult(BaseModel):
     errors: List[str]
     requirements: List[str]
 
+# Reglas por grado: requisitos fijos y, por nivel de investigación, ("warning" | "error", mensaje)
+GRADE_RULES = {
+    "Bachiller": (
+        ["Extensión marco teórico: 15-25 páginas", "Referencias mínimas: 20-30 fuentes"],
+        {"Explicativo": ("warning", "Investigación explicativa es avanzada para nivel de Bachiller. Te recomendamos nivel Descriptivo o Correlacional.")},
+    ),
+    "Título Profesional": (
+        ["Extensión marco teórico: 25-40 páginas", "Referencias mínimas: 30-50 fuentes",
+         "Requiere validación de la solución propuesta"],
+        {},
+    ),
+    "Maestría": (
+        ["Extensión marco teórico: 40-60 páginas", "Referencias mínimas: 50-80 fuentes",
+         "Análisis comparativo con estado del arte obligatorio"],
+        {level: ("warning", "Para maestría se espera un nivel Correlacional, Explicativo o Aplicado.")
+         for level in ("Exploratorio", "Descriptivo")},
+    ),
+    "Doctorado": (
+        ["Extensión marco teórico: 60-100 páginas", "Referencias mínimas: 80-150+ fuentes",
+         "Contribución científica novedosa obligatoria"],
+        {level: ("error", "Una tesis doctoral debe tener nivel Explicativo o proponer un modelo/metodología original.")
+         for level in ("Exploratorio", "Descriptivo")},
+    ),
+}
+
+# Reglas por área (subcadena del área): requisitos y (nivel esperado, aviso si el nivel es otro)
+AREA_RULES = [
+    ("Deep Learning",
+     ["Sección obligatoria: Arquitectura del Modelo", "Métricas obligatorias: Accuracy, Precision, Recall, F1-Score"],
+     ("Aplicado-Tecnológico", "Deep Learning requiere implementación práctica. Se sugiere nivel Aplicado-Tecnológico.")),
+]
+
+def _build_rule_table(levels: list[str]) -> dict:
+    """(grado, nivel) -> (requisitos, warnings, errors). Nivel None: nivel fuera de la lista conocida."""
+    table = {}
+    for grade, (requirements, by_level) in GRADE_RULES.items():
+        for level in [*levels, None]:
+            kind, message = by_level.get(level, (None, None))
+            table[(grade, level)] = (
+                tuple(requirements),
+                (message,) if kind == "warning" else (),
+                (message,) if kind == "error" else (),
+            )
+    return table
+
 class ProfileService:
     GRADES = ["Bachiller", "Título Profesional", "Maestría", "Doctorado"]
     LEVELS = ["Exploratorio", "Descriptivo", "Correlacional", "Explicativo", "Aplicado-Tecnológico"]
-    
+    # Precalculada al importar: validar un perfil es una búsqueda en un dict, no una cadena de if/elif
+    RULE_TABLE = _build_rule_table(LEVELS)
+    EMPTY_RULE = ((), (), ())
+
     @staticmethod
     def validate_profile(config: ProfileConfig) -> ProfileValidationResult:
-        warnings = []
-        errors = []
-        requirements = []
-        is_valid = True
-
-        # 1. Validación Grado vs Nivel
-        if config.grado == "Bachiller":
-            requirements.append("Extensión marco teórico: 15-25 páginas")
-            requirements.append("Referencias mínimas: 20-30 fuentes")
-            if config.nivel in ["Explicativo"]:
-                warnings.append("Investigación explicativa es avanzada para nivel de Bachiller. Te recomendamos nivel Descriptivo o Correlacional.")
-        
-        elif config.grado == "Título Profesional":
-            requirements.append("Extensión marco teórico: 25-40 páginas")
-            requirements.append("Referencias mínimas: 30-50 fuentes")
-            requirements.append("Requiere validación de la solución propuesta")
-
-        elif config.grado == "Maestría":
-            requirements.append("Extensión marco teórico: 40-60 páginas")
-            requirements.append("Referencias mínimas: 50-80 fuentes")
-            requirements.append("Análisis comparativo con estado del arte obligatorio")
-            if config.nivel in ["Exploratorio", "Descriptivo"]:
-                warnings.append("Para maestría se espera un nivel Correlacional, Explicativo o Aplicado.")
-
-        elif config.grado == "Doctorado":
-            requirements.append("Extensión marco teórico: 60-100 páginas")
-            requirements.append("Referencias mínimas: 80-150+ fuentes")
-            requirements.append("Contribución científica novedosa obligatoria")
-            if config.nivel in ["Exploratorio", "Descriptivo"]:
-                errors.append("Una tesis doctoral debe tener nivel Explicativo o proponer un modelo/metodología original.")
-                is_valid = False
+        table = ProfileService.RULE_TABLE
+        requirements, warnings, errors = (
+            table.get((config.grado, config.nivel))
+            or table.get((config.grado, None))
+            or ProfileService.EMPTY_RULE
+        )
+        requirements, warnings, errors = list(requirements), list(warnings), list(errors)
 
         # 2. Validación Tecnología (Deep Learning ejemplo)
-        if "Deep Learning" in config.area:
-            requirements.append("Sección obligatoria: Arquitectura del Modelo")
-            requirements.append("Métricas obligatorias: Accuracy, Precision, Recall, F1-Score")
-            if config.nivel != "Aplicado-Tecnológico":
-                warnings.append("Deep Learning requiere implementación práctica. Se sugiere nivel Aplicado-Tecnológico.")
+        for keyword, area_requirements, (expected_level, warning) in AREA_RULES:
+            if keyword in config.area:
+                requirements.extend(area_requirements)
+                if config.nivel != expected_level:
+                    warnings.append(warning)
 
+        is_valid = not errors
         verdict = "Configuración válida" if is_valid else "Configuración no permitida"
         
         return ProfileValidationResult(
@@ -69,4 +94,9 @@ class ProfileService:
             requirements=requirements
         )
 
+    @staticmethod
+    def validate_batch(configs: list[ProfileConfig]) -> Iterator[tuple[int, ProfileValidationResult]]:
+        for index, config in enumerate(configs):
+            yield index, ProfileService.validate_profile(config)
+
 profile_service = ProfileService()
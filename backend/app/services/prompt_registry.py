@@ -0,0 +1,142 @@
+import json
+import textwrap
+import threading
+from typing import Optional
+from app.utils.metrics import PROMPT_CACHE_TOKENS, PROMPT_TRIMMED
+
+# Estimación barata sin tokenizador: el español ronda 3.5-4 caracteres por token
+CHARS_PER_TOKEN = 3.5
+TRIM_MARKER = "\n[...]\n"
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text or "") / CHARS_PER_TOKEN) + 1
+
+def _compact(text: str) -> str:
+    # Las plantillas se escriben indentadas dentro de las clases; la indentación solo gasta tokens
+    return textwrap.dedent(text).strip()
+
+def _to_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return str(value)
+
+def shrink(text: str, max_tokens: int) -> str:
+    """
+    Reduce un texto a ~max_tokens. Con varios párrafos hace un resumen extractivo (se conserva
+    el inicio de cada párrafo en proporción a su tamaño); si no alcanza, corta por el medio
+    conservando inicio y final.
+    """
+    max_chars = max(int(max_tokens * CHARS_PER_TOKEN), 0)
+    if len(text) <= max_chars:
+        return text
+    paragraphs = [p for p in text.split("\n") if p.strip()]
+    if len(paragraphs) > 1:
+        ratio = max_chars / len(text)
+        parts = []
+        for paragraph in paragraphs:
+            share = int(len(paragraph) * ratio)
+            cut = paragraph[:share]
+            # Se corta en el último fin de oración dentro de la cuota, si lo hay
+            boundary = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+            parts.append(cut[:boundary + 1] if boundary > share // 2 else cut)
+        summary = "\n".join(p for p in parts if p.strip())
+        if summary and len(summary) <= max_chars:
+            return summary
+    head = max_chars * 2 // 3
+    tail = max(max_chars - head - len(TRIM_MARKER), 0)
+    return text[:head] + TRIM_MARKER + (text[-tail:] if tail else "")
+
+class PromptTemplate:
+    """
+    Plantilla compilada una sola vez: el system prompt es texto fijo (prefijo estable que la
+    caché de prefijos del proveedor reutiliza entre peticiones) y los datos de cada petición
+    van siempre al final, en el mensaje de usuario.
+    """
+
+    def __init__(self, name: str, system: str, user: str, budget: Optional[int] = None,
+                 trim: tuple = ()):
+        self.name = name
+        self.system = _compact(system)
+        self.user = _compact(user)
+        # Presupuesto de tokens de la parte variable y campos que se pueden recortar (en ese orden)
+        self.budget = budget
+        self.trim = trim
+        self.prefix_tokens = estimate_tokens(self.system)
+
+    def render(self, **values) -> tuple[str, str]:
+        values = {key: _to_text(value) for key, value in values.items()}
+        user = self.user.format(**values).strip()
+        if self.budget and estimate_tokens(user) > self.budget:
+            PROMPT_TRIMMED.inc(template=self.name)
+            for field in self.trim:
+                excess = estimate_tokens(user) - self.budget
+                if excess <= 0:
+                    break
+                current = estimate_tokens(values[field])
+                values[field] = shrink(values[field], max(current - excess, 0))
+                user = self.user.format(**values).strip()
+        return self.system, user
+
+class PromptRegistry:
+    """Registro de plantillas por nombre, con el uso de la caché de prefijos del proveedor por plantilla."""
+
+    def __init__(self):
+        self.templates: dict[str, PromptTemplate] = {}
+        # system prompt -> plantilla: así la llamada al LLM se atribuye sin pasar el nombre por todas las capas
+        self._by_system: dict[str, PromptTemplate] = {}
+        self._usage: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, system: str, user: str, budget: Optional[int] = None,
+                 trim: tuple = ()) -> PromptTemplate:
+        template = PromptTemplate(name, system, user, budget, trim)
+        self.templates[name] = template
+        self._by_system[template.system] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self.templates[name]
+
+    def render(self, name: str, **values) -> tuple[str, str]:
+        return self.templates[name].render(**values)
+
+    @staticmethod
+    def _cache_hit_tokens(usage: dict) -> int:
+        # DeepSeek informa prompt_cache_hit_tokens; OpenAI, prompt_tokens_details.cached_tokens
+        if usage.get("prompt_cache_hit_tokens") is not None:
+            return int(usage["prompt_cache_hit_tokens"])
+        details = usage.get("prompt_tokens_details") or {}
+        return int(details.get("cached_tokens") or 0)
+
+    def observe(self, system_prompt: str, llm_output: Optional[dict]):
+        template = self._by_system.get(system_prompt)
+        usage = (llm_output or {}).get("token_usage") or {}
+        if template is None or not usage.get("prompt_tokens"):
+            return
+        prompt_tokens = int(usage["prompt_tokens"])
+        hit = min(self._cache_hit_tokens(usage), prompt_tokens)
+        PROMPT_CACHE_TOKENS.inc(hit, template=template.name, kind="hit")
+        PROMPT_CACHE_TOKENS.inc(prompt_tokens - hit, template=template.name, kind="miss")
+        with self._lock:
+            entry = self._usage.setdefault(template.name, {"calls": 0, "prompt_tokens": 0, "cache_hit_tokens": 0})
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["cache_hit_tokens"] += hit
+
+    def stats(self) -> dict:
+        with self._lock:
+            usage = {name: dict(entry) for name, entry in self._usage.items()}
+        result = {}
+        for name, template in self.templates.items():
+            entry = usage.get(name, {"calls": 0, "prompt_tokens": 0, "cache_hit_tokens": 0})
+            entry["prefix_tokens_est"] = template.prefix_tokens
+            entry["budget"] = template.budget
+            entry["cache_hit_ratio"] = (
+                round(entry["cache_hit_tokens"] / entry["prompt_tokens"], 3) if entry["prompt_tokens"] else None
+            )
+            result[name] = entry
+        return result
+
+prompt_registry = PromptRegistry()
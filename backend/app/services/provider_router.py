@@ -0,0 +1,384 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import suppress
+from typing import AsyncIterator, Optional
+from app.utils.env import load_env
+from app.utils.http_pool import http_pool, timeout as http_timeout
+from app.utils.metrics import LLM_FAILOVERS, LLM_HEDGES, LLM_PROVIDER_REQUESTS
+
+load_env()
+
+# Errores ante los que se prueba otro proveedor: sin saldo, límite de tasa, caídas y timeouts
+FAILOVER_STATUS = {402, 429}
+
+def _import_sdk():
+    import langchain_core.messages  # noqa: F401
+    import openai  # noqa: F401
+    import langchain_openai  # noqa: F401
+
+_sdk_imported = False
+
+async def import_sdk():
+    """
+    openai + langchain tardan ~1 s en importarse: si el pre-calentamiento no lo hizo, la primera
+    petición los importa en un hilo en lugar de bloquear el event loop (y a las demás peticiones).
+    """
+    global _sdk_imported
+    if not _sdk_imported:
+        await asyncio.to_thread(_import_sdk)
+        _sdk_imported = True
+
+class ProviderError(Exception):
+    """
+    Error HTTP definitivo del proveedor (tras agotar el failover). Envuelve al de openai para
+    que main.py pueda manejarlo sin importar el SDK al arrancar.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def _final_error(exc: BaseException) -> BaseException:
+    import openai
+    if isinstance(exc, openai.APIStatusError):
+        retry_after = exc.response.headers.get("retry-after") if exc.response is not None else None
+        error = ProviderError(str(exc), exc.status_code, retry_after)
+        error.__cause__ = exc
+        return error
+    return exc
+
+def _should_failover(exc: BaseException) -> bool:
+    # Import diferido: el SDK de openai pesa ~1s al arrancar y solo hace falta cuando algo falla
+    import openai
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in FAILOVER_STATUS or exc.status_code >= 500
+    return isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError))
+
+class Provider:
+    """Backend compatible con la API de OpenAI, con su historial de latencias y estado de salud."""
+
+    def __init__(self, name: str, model: str, api_key: Optional[str], api_base: str,
+                 json_mode: bool = True, timeout: float = 120.0, max_tokens: int = 2048, window: int = 200):
+        self.name = name
+        self.model = model
+        self.json_mode = json_mode
+        self._client_config = {"api_key": api_key, "api_base": api_base, "timeout": timeout, "max_tokens": max_tokens}
+        self._llm = None
+        # Cliente HTTP con el que se creó self._llm (None si el LLM se asignó desde fuera)
+        self._http_client = None
+        self.latency_ewma: Optional[float] = None
+        self.ttft_ewma: Optional[float] = None
+        self._latencies: deque = deque(maxlen=window)
+        self._ttfts: deque = deque(maxlen=window)
+        self.cooldown_until = 0.0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "Provider":
+        prefix = f"LLM_PROVIDER_{name.upper()}_"
+        if name == "deepseek":
+            # Compatibilidad con la configuración original (DEEPSEEK_*)
+            defaults = {
+                "API_KEY": os.getenv("DEEPSEEK_API_KEY"),
+                "API_BASE": os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1"),
+                "MODEL": os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),
+            }
+        else:
+            defaults = {"API_KEY": None, "API_BASE": None, "MODEL": None}
+        return cls(
+            name=name,
+            model=os.getenv(prefix + "MODEL", defaults["MODEL"]),
+            api_key=os.getenv(prefix + "API_KEY", defaults["API_KEY"]),
+            api_base=os.getenv(prefix + "API_BASE", defaults["API_BASE"]),
+            json_mode=os.getenv(prefix + "JSON_MODE", "true").lower() == "true",
+            timeout=float(os.getenv(prefix + "TIMEOUT", os.getenv("LLM_REQUEST_TIMEOUT", "120"))),
+        )
+
+    @property
+    def llm(self):
+        # El cliente (y langchain_openai) se crea en la primera llamada o en el pre-calentamiento,
+        # y se vuelve a crear si el pool HTTP compartido cambió (cerrado, otro event loop)
+        if self._llm is None or (self._http_client is not None and self._http_client is not http_pool.client()):
+            import openai
+            from langchain_openai import ChatOpenAI
+            config = self._client_config
+            self._http_client = http_pool.client()
+            request_timeout = http_timeout(read=config["timeout"])
+            # Sin reintentos internos: el router decide si reintenta en otro proveedor
+            async_client = openai.AsyncOpenAI(
+                api_key=config["api_key"],
+                base_url=config["api_base"],
+                timeout=request_timeout,
+                max_retries=0,
+                http_client=self._http_client,
+            )
+            self._llm = ChatOpenAI(
+                model=self.model,
+                openai_api_key=config["api_key"],
+                openai_api_base=config["api_base"],
+                max_tokens=config["max_tokens"],
+                request_timeout=request_timeout,
+                max_retries=0,
+                async_client=async_client.chat.completions,
+            )
+        return self._llm
+
+    @llm.setter
+    def llm(self, value):
+        self._llm = value
+        self._http_client = None
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    @staticmethod
+    def _p90(samples: deque) -> Optional[float]:
+        if len(samples) < 5:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(0.9 * (len(ordered) - 1))]
+
+    def hedge_delay(self, streaming: bool) -> Optional[float]:
+        return self._p90(self._ttfts if streaming else self._latencies)
+
+    def record_success(self, seconds: float, ttft: Optional[float] = None):
+        self.failures = 0
+        self._latencies.append(seconds)
+        self.latency_ewma = seconds if self.latency_ewma is None else self.latency_ewma + 0.2 * (seconds - self.latency_ewma)
+        if ttft is not None:
+            self._ttfts.append(ttft)
+            self.ttft_ewma = ttft if self.ttft_ewma is None else self.ttft_ewma + 0.2 * (ttft - self.ttft_ewma)
+
+    def record_failure(self, exc: BaseException, cooldowns: dict):
+        self.failures += 1
+        status = getattr(exc, "status_code", None)
+        if status == 402:
+            # Sin saldo: no tiene sentido volver a intentarlo pronto
+            delay = cooldowns["402"]
+        elif status == 429:
+            response = getattr(exc, "response", None)
+            retry_after = response.headers.get("retry-after") if response is not None else None
+            try:
+                delay = float(retry_after) if retry_after else cooldowns["429"]
+            except ValueError:
+                delay = cooldowns["429"]
+        else:
+            # Caídas puntuales: enfriamiento creciente con los fallos seguidos
+            delay = min(cooldowns["error"] * self.failures, 60.0)
+        self.cooldown_until = time.monotonic() + delay
+
+    def kwargs_for(self, kwargs: dict) -> dict:
+        if not self.json_mode:
+            return {k: v for k, v in kwargs.items() if k != "response_format"}
+        return kwargs
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "available": self.available,
+            "cooldown_seconds": max(0.0, round(self.cooldown_until - time.monotonic(), 1)),
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latency_p90": self.hedge_delay(False),
+            "ttft_ewma": round(self.ttft_ewma, 3) if self.ttft_ewma is not None else None,
+            "ttft_p90": self.hedge_delay(True),
+            "consecutive_failures": self.failures,
+        }
+
+class ProviderRouter:
+    """
+    Enruta las llamadas entre varios backends OpenAI-compatibles:
+    - failover automático ante 402/429/5xx/timeouts (con enfriamiento del proveedor que falló),
+    - hedging: si el primero no respondió (o no emitió el primer token) dentro de su p90,
+      se lanza el siguiente y gana el que termine primero.
+    """
+
+    def __init__(self, providers: list[Provider], hedging: bool = True, max_hedges: int = 1,
+                 routing: str = "priority", cooldowns: Optional[dict] = None):
+        if not providers:
+            raise ValueError("Se necesita al menos un proveedor de LLM")
+        self.providers = providers
+        self.hedging = hedging
+        self.max_hedges = max_hedges
+        self.routing = routing
+        self.cooldowns = cooldowns or {"402": 600.0, "429": 10.0, "error": 5.0}
+
+    @classmethod
+    def from_env(cls) -> "ProviderRouter":
+        names = [n.strip().lower() for n in os.getenv("LLM_PROVIDERS", "deepseek").split(",") if n.strip()]
+        return cls(
+            providers=[Provider.from_env(name) for name in names],
+            hedging=os.getenv("LLM_HEDGING_ENABLED", "true").lower() == "true",
+            max_hedges=int(os.getenv("LLM_MAX_HEDGES", "1")),
+            routing=os.getenv("LLM_ROUTING", "priority").lower(),
+            cooldowns={
+                "402": float(os.getenv("LLM_COOLDOWN_402_SECONDS", "600")),
+                "429": float(os.getenv("LLM_COOLDOWN_429_SECONDS", "10")),
+                "error": float(os.getenv("LLM_COOLDOWN_ERROR_SECONDS", "5")),
+            },
+        )
+
+    def warm(self):
+        """Crea los clientes de todos los proveedores (ver /ready)."""
+        for provider in self.providers:
+            provider.llm
+
+    @property
+    def primary(self) -> Provider:
+        return self.providers[0]
+
+    def candidates(self) -> list[Provider]:
+        available = [p for p in self.providers if p.available]
+        if self.routing == "latency":
+            # Sin historial se conserva el orden configurado
+            available.sort(key=lambda p: p.latency_ewma if p.latency_ewma is not None else float("inf"))
+        # Si todos están enfriándose se intenta igual, empezando por el que antes se recupera
+        return available or sorted(self.providers, key=lambda p: p.cooldown_until)
+
+    async def _call(self, provider: Provider, messages: list, kwargs: dict):
+        started = time.monotonic()
+        try:
+            result = await provider.llm.agenerate([messages], **provider.kwargs_for(kwargs))
+        except asyncio.CancelledError:
+            LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="cancelled")
+            raise
+        except Exception as exc:
+            LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="error")
+            if _should_failover(exc):
+                provider.record_failure(exc, self.cooldowns)
+            raise
+        provider.record_success(time.monotonic() - started)
+        LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="ok")
+        llm_output = dict(result.llm_output or {})
+        llm_output["provider"] = provider.name
+        return result.generations[0][0].text, llm_output
+
+    async def generate(self, messages: list, **kwargs) -> tuple[str, dict]:
+        candidates = self.candidates()
+        tasks: dict[asyncio.Task, Provider] = {}
+        hedges = 0
+        last_error: Optional[BaseException] = None
+
+        def launch(provider: Provider):
+            tasks[asyncio.create_task(self._call(provider, messages, kwargs))] = provider
+
+        launch(candidates.pop(0))
+        try:
+            while tasks:
+                newest = list(tasks.values())[-1]
+                delay = newest.hedge_delay(streaming=False)
+                can_hedge = self.hedging and candidates and hedges < self.max_hedges and delay is not None
+                done, _ = await asyncio.wait(
+                    set(tasks), timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # El más reciente superó su p90: se lanza el siguiente en paralelo
+                    hedges += 1
+                    LLM_HEDGES.inc(provider=candidates[0].name)
+                    launch(candidates.pop(0))
+                    continue
+                for task in sorted(done, key=lambda t: t.exception() is not None):
+                    provider = tasks.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    if not _should_failover(last_error):
+                        raise _final_error(last_error)
+                    if candidates and not tasks:
+                        LLM_FAILOVERS.inc(provider=provider.name, reason=str(getattr(last_error, "status_code", "error")))
+                        launch(candidates.pop(0))
+            raise _final_error(last_error)
+        finally:
+            # El perdedor del hedge (o todos, si nos cancelaron) se corta aquí
+            for task in tasks:
+                task.cancel()
+
+    async def _first_chunk(self, provider: Provider, stream: AsyncIterator):
+        started = time.monotonic()
+        try:
+            chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            # Respuesta vacía: cuenta como terminada
+            return None, time.monotonic() - started
+        except Exception as exc:
+            LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="error")
+            if _should_failover(exc):
+                provider.record_failure(exc, self.cooldowns)
+            raise
+        return chunk, time.monotonic() - started
+
+    async def astream(self, messages: list, **kwargs) -> AsyncIterator:
+        """Hedging sobre el primer token; una vez elegido el proveedor, el stream sigue solo con él."""
+        candidates = self.candidates()
+        streams: dict[asyncio.Task, tuple[Provider, AsyncIterator, float]] = {}
+        hedges = 0
+        last_error: Optional[BaseException] = None
+
+        def launch(provider: Provider):
+            stream = provider.llm.astream(messages, **provider.kwargs_for(kwargs)).__aiter__()
+            task = asyncio.create_task(self._first_chunk(provider, stream))
+            streams[task] = (provider, stream, time.monotonic())
+
+        winner = None
+        launch(candidates.pop(0))
+        try:
+            while streams and winner is None:
+                newest = list(streams.values())[-1][0]
+                delay = newest.hedge_delay(streaming=True)
+                can_hedge = self.hedging and candidates and hedges < self.max_hedges and delay is not None
+                done, _ = await asyncio.wait(
+                    set(streams), timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedges += 1
+                    LLM_HEDGES.inc(provider=candidates[0].name)
+                    launch(candidates.pop(0))
+                    continue
+                # Primero los que respondieron: con un ganador, el error de otro stream del mismo lote no cuenta
+                for task in sorted(done, key=lambda t: t.exception() is not None):
+                    provider, stream, started = streams.pop(task)
+                    if task.exception() is None and winner is None:
+                        winner = (provider, stream, started, *task.result())
+                        continue
+                    if task.exception() is None or winner is not None:
+                        with suppress(BaseException):
+                            await stream.aclose()
+                        continue
+                    last_error = task.exception()
+                    if not _should_failover(last_error):
+                        raise _final_error(last_error)
+                    if candidates and not streams:
+                        LLM_FAILOVERS.inc(provider=provider.name, reason=str(getattr(last_error, "status_code", "error")))
+                        launch(candidates.pop(0))
+            if winner is None:
+                raise _final_error(last_error)
+        finally:
+            for task, (_, stream, _) in streams.items():
+                task.cancel()
+                with suppress(BaseException):
+                    await stream.aclose()
+
+        provider, stream, started, first_chunk, ttft = winner
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+                async for chunk in stream:
+                    yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="cancelled")
+            raise
+        finally:
+            with suppress(BaseException):
+                await stream.aclose()
+        provider.record_success(time.monotonic() - started, ttft)
+        LLM_PROVIDER_REQUESTS.inc(provider=provider.name, outcome="ok")
+
+    def stats(self) -> dict:
+        return {
+            "routing": self.routing,
+            "hedging": self.hedging,
+            "providers": {p.name: p.stats() for p in self.providers},
+        }
@@ -1,22 +1,54 @@
-from app.services.ai_service import ai_service
-from app.services.document_service import document_service
-from fastapi import UploadFile
-import json
+from app.services.prompt_registry import prompt_registry
+from app.services.structured_output_service import structured_output
+from app.services.response_schemas import RegulationFragment
+from app.utils.metrics import traced
+from app.services.document_service import PdfSource, document_service
+from app.services.retrieval_service import RetrievalIndex, retrieval_service
+from app.db.document_store import document_store
+from app.utils.uploads import SpooledUpload
+from collections import Counter
+from typing import Callable, Optional
+import asyncio
+import hashlib
+import os
+import re
+import unicodedata
+
+# Palabras (sin tildes) que indican que un fragmento habla de estructura o formato
+STRUCTURE_KEYWORDS = re.compile(
+    r"\b(capitulo|seccion|estructura|esquema|indice|formato|apa|ieee|vancouver|iso 690|"
+    r"citacion|referencias|bibliografia|margen|margenes|interlineado|fuente|tipografia|"
+    r"times new roman|arial|tamano|introduccion|marco teorico|metodologia|resultados|"
+    r"conclusiones|anexos|caratula|resumen|abstract)\b"
+)
+
+STRUCTURE_QUERY = (
+    "estructura capítulos secciones esquema de tesis índice formato fuente tamaño "
+    "interlineado márgenes norma de citación APA IEEE referencias bibliográficas"
+)
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
 
 class RegulationService:
-    @staticmethod
-    async def analyze_regulations(pdf_file: UploadFile):
-        # 1. Extraer texto del PDF
-        text = await document_service.extract_text_from_pdf(pdf_file)
-        
-        # 2. Enviar a DeepSeek para extraer estructura
-        system_prompt = """
+    CHUNK_SIZE = int(os.getenv("REGULATION_CHUNK_SIZE", "6000"))
+    CHUNK_OVERLAP = int(os.getenv("REGULATION_CHUNK_OVERLAP", "400"))
+    MAP_CONCURRENCY = int(os.getenv("REGULATION_MAP_CONCURRENCY", "6"))
+    MAP_MAX_TOKENS = int(os.getenv("REGULATION_MAP_MAX_TOKENS", "1024"))
+    MAX_MAP_CHUNKS = int(os.getenv("REGULATION_MAX_MAP_CHUNKS", "24"))
+
+    PROMPT = prompt_registry.register(
+        "analysis.regulations",
+        system="""
         Eres un experto en metodología de investigación y normativa universitaria.
-        Tu tarea es analizar el reglamento de tesis proporcionado y extraer la ESTRUCTURA FORMAL requerida (capítulos, secciones, requisitos).
+        Recibirás UN FRAGMENTO de un reglamento de tesis. Extrae únicamente la ESTRUCTURA FORMAL requerida (capítulos, secciones, requisitos) y el formato que aparezcan EN ESTE FRAGMENTO.
+        Si un dato no aparece en el fragmento, usa null o una lista vacía. No inventes información.
         Debes responder ÚNICAMENTE con un objeto JSON estructurado con el siguiente formato:
         {
-          "universidad": "Nombre",
-          "facultad": "Nombre",
+          "universidad": "Nombre o null",
+          "facultad": "Nombre o null",
           "estructura": [
             {
               "capitulo": "Título",
@@ -24,26 +56,180 @@ class RegulationService:
             }
           ],
           "formato": {
-             "fuente": "tipo",
-             "tamano": "puntos",
-             "norma_citacion": "APA/IEEE/etc"
+             "fuente": "tipo o null",
+             "tamano": "puntos o null",
+             "norma_citacion": "APA/IEEE/etc o null"
           }
         }
+        """,
+        user="""
+        Fragmento {number} de {total} del reglamento:
+
+        {chunk}
+        """,
+        budget=4000,
+        trim=("chunk",),
+    )
+
+    @staticmethod
+    def select_relevant_chunks(chunks: list[str]) -> list[tuple[int, str]]:
+        # El primer fragmento se conserva siempre: suele traer universidad y facultad
+        return [
+            (i, chunk) for i, chunk in enumerate(chunks)
+            if i == 0 or STRUCTURE_KEYWORDS.search(_normalize(chunk))
+        ]
+
+    @staticmethod
+    def limit_chunks(relevant: list[tuple[int, str]]) -> list[tuple[int, str]]:
+        """Si el reglamento es enorme, solo se envían los fragmentos mejor rankeados por BM25."""
+        limit = RegulationService.MAX_MAP_CHUNKS
+        if len(relevant) <= limit:
+            return relevant
+        index = RetrievalIndex.build([chunk for _, chunk in relevant[1:]])
+        top = index.search(STRUCTURE_QUERY, k=limit - 1)
+        keep = sorted(i + 1 for i, _ in top)
+        return [relevant[0]] + [relevant[i] for i in keep]
+
+    @staticmethod
+    async def _map_chunk(index: int, chunk: str, total: int, semaphore: asyncio.Semaphore):
+        system_prompt, user_prompt = RegulationService.PROMPT.render(number=index + 1, total=total, chunk=chunk)
+        async with semaphore:
+            result = await structured_output.generate(
+                system_prompt, user_prompt, RegulationFragment,
+                endpoint="analysis.regulations", error_message="Error al analizar fragmento",
+                max_tokens=RegulationService.MAP_MAX_TOKENS,
+            )
+        return None if "error" in result else result
+
+    @staticmethod
+    def merge_fragments(fragments: list[dict]) -> dict:
+        """Fusión local y determinista de los resultados parciales (en orden de fragmento)."""
+        def most_common(values):
+            values = [v.strip() for v in values if isinstance(v, str) and v.strip() and v.strip().lower() != "null"]
+            if not values:
+                return None
+            counts = Counter(_normalize(v) for v in values)
+            best = max(counts.values())
+            # Empate: gana el que apareció primero en el documento
+            return next(v for v in values if counts[_normalize(v)] == best)
+
+        chapters: dict[str, dict] = {}
+        seen_sections: dict[str, set] = {}
+        for fragment in fragments:
+            for chapter in fragment.get("estructura") or []:
+                if not isinstance(chapter, dict):
+                    continue
+                title = (chapter.get("capitulo") or "").strip()
+                key = _normalize(title)
+                if not key:
+                    continue
+                if key not in chapters:
+                    chapters[key] = {"capitulo": title, "secciones": []}
+                    seen_sections[key] = set()
+                for section in chapter.get("secciones") or []:
+                    if not isinstance(section, str):
+                        continue
+                    section_key = _normalize(section)
+                    if section_key and section_key not in seen_sections[key]:
+                        seen_sections[key].add(section_key)
+                        chapters[key]["secciones"].append(section.strip())
+
+        formats = [f.get("formato") or {} for f in fragments]
+        formats = [f for f in formats if isinstance(f, dict)]
+        format_keys = ["fuente", "tamano", "norma_citacion"]
+        format_keys += [k for f in formats for k in f if k not in format_keys]
+        return {
+            "universidad": most_common([f.get("universidad") for f in fragments]),
+            "facultad": most_common([f.get("facultad") for f in fragments]),
+            "estructura": list(chapters.values()),
+            "formato": {
+                k: most_common([str(f[k]) for f in formats if f.get(k) is not None])
+                for k in dict.fromkeys(format_keys)
+            },
+        }
+
+    @staticmethod
+    async def get_cached_analysis(document_hash: str) -> Optional[dict]:
+        record = await document_store.get(document_hash)
+        if record and record.get("regulation"):
+            return {**record["regulation"], "document_hash": document_hash}
+        return None
+
+    @staticmethod
+    async def analyze_regulations(upload: SpooledUpload):
+        # El hash ya se calculó mientras el PDF se escribía a disco
+        return await RegulationService.analyze_regulation_content(upload.path, document_hash=upload.sha256)
+
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    @traced("regulation.analyze_regulations", endpoint="analysis.regulations")
+    async def analyze_regulation_content(content: PdfSource, on_progress: Optional[Callable] = None,
+                                         document_hash: Optional[str] = None):
+        """
+        `content` son los bytes del PDF o la ruta del archivo ya en disco.
+        `on_progress` (async) recibe el avance de la fase map, para los trabajos en segundo plano.
         """
-        
-        # Limitamos el texto para no exceder tokens de contexto si el reglamento es muy largo
-        # (En una fase posterior usaríamos RAG para esto)
-        sample_text = text[:8000] 
-        
-        user_prompt = f"Aquí está el contenido del reglamento:\n\n{sample_text}"
-        
-        response = await ai_service.get_response(system_prompt, user_prompt)
-        
-        try:
-            # Limpiar respuesta por si incluye backticks de markdown
-            clean_response = response.strip().replace("```json", "").replace("```", "")
-            return json.loads(clean_response)
-        except Exception as e:
-            return {"error": "No se pudo procesar la respuesta de la IA", "raw": response}
+        if document_hash is None:
+            if isinstance(content, str):
+                document_hash = await asyncio.to_thread(RegulationService._file_sha256, content)
+            else:
+                document_hash = await asyncio.to_thread(lambda: hashlib.sha256(content).hexdigest())
+
+        # 0. Mismo PDF ya analizado (ej. el reglamento de la facultad): respuesta inmediata
+        record = await document_store.get(document_hash)
+        if record and record.get("regulation"):
+            return {**record["regulation"], "document_hash": document_hash}
+
+        # 1. Extraer texto del PDF (o reutilizar el ya extraído)
+        if record and record.get("text") is not None and record.get("chunks") is not None:
+            chunks = record["chunks"]
+        else:
+            text = await document_service.extract_text_from_bytes(content)
+            chunks = document_service.chunk_text(
+                text, RegulationService.CHUNK_SIZE, RegulationService.CHUNK_OVERLAP
+            )
+            await document_store.save(document_hash, text=text, chunks=chunks)
+            # Índice de recuperación persistido para la generación de estructura posterior
+            await retrieval_service.get_index(document_hash, text)
+
+        # 2. Map: extracción concurrente por fragmento (solo los que hablan de estructura/formato)
+        relevant = RegulationService.select_relevant_chunks(chunks)
+        relevant = RegulationService.limit_chunks(relevant)
+        semaphore = asyncio.Semaphore(RegulationService.MAP_CONCURRENCY)
+        done = 0
+
+        async def map_with_progress(i: int, chunk: str):
+            nonlocal done
+            result = await RegulationService._map_chunk(i, chunk, len(chunks), semaphore)
+            done += 1
+            if on_progress:
+                await on_progress({"stage": "map", "chunks_done": done, "chunks_total": len(relevant)})
+            return result
+
+        results = await asyncio.gather(*[map_with_progress(i, chunk) for i, chunk in relevant])
+        fragments = [r for r in results if isinstance(r, dict)]
+
+        if not fragments:
+            return {"error": "No se pudo procesar la respuesta de la IA", "raw": None, "document_hash": document_hash}
+
+        # 3. Reduce: fusión local sin otra llamada al modelo
+        merged = RegulationService.merge_fragments(fragments)
+        merged["analysis_meta"] = {
+            "chunks_total": len(chunks),
+            "chunks_analyzed": len(relevant),
+            "chunks_failed": len(relevant) - len(fragments),
+        }
+        # Solo se persisten análisis completos; si algún fragmento falló se reintentará
+        if not merged["analysis_meta"]["chunks_failed"]:
+            await document_store.save(document_hash, regulation=merged)
+        merged["document_hash"] = document_hash
+        return merged
 
 regulation_service = RegulationService()
@@ -0,0 +1,103 @@
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, Union
+
+# Esquemas de las respuestas JSON del modelo. Son tolerantes (extra="allow", valores
+# por defecto en lo secundario) pero exigen las claves sin las que la respuesta no sirve.
+
+class LLMModel(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+class ViabilityAnalysis(LLMModel):
+    strengths: list[str] = []
+    weaknesses: list[str] = []
+    recommendations: list[str] = []
+
+class ViabilityResult(LLMModel):
+    score: Union[int, float]
+    verdict: str
+    analysis: ViabilityAnalysis = ViabilityAnalysis()
+    methodological_advice: Optional[str] = None
+
+class ViabilityBatchResult(LLMModel):
+    # Cada elemento se valida aparte con ViabilityResult: una idea mal formada no invalida el lote
+    results: list[dict]
+
+class StructureSection(LLMModel):
+    name: str
+    description: Optional[str] = None
+
+class StructureChapter(LLMModel):
+    title: str
+    sections: list[StructureSection] = []
+
+class StructureResult(LLMModel):
+    thesis_title: Optional[str] = None
+    chapters: list[StructureChapter]
+
+class ChapterRevision(LLMModel):
+    section: str
+    evaluation: Optional[str] = None
+    suggestions: Union[str, list[str], None] = None
+
+class ChapterReviewResult(LLMModel):
+    feedback_general: str
+    revisions: list[ChapterRevision] = []
+    draft_suggestion: Optional[str] = None
+
+class WritingIssue(LLMModel):
+    match: str
+    problem: Optional[str] = None
+    suggestion: Optional[str] = None
+
+class WritingAnalysisResult(LLMModel):
+    has_issues: bool
+    issues: list[WritingIssue] = []
+    improved_text: Optional[str] = None
+
+class ParagraphRewrite(LLMModel):
+    index: int
+    improved_text: str
+    issues: list[WritingIssue] = []
+
+class ParagraphRewriteResult(LLMModel):
+    paragraphs: list[ParagraphRewrite]
+
+class VersionsResult(LLMModel):
+    v1_formal: str
+    v2_statistical: str
+    v3_theoretical: str
+
+class VersionText(LLMModel):
+    text: str
+
+class ChapterSection(LLMModel):
+    id: Optional[str] = None
+    title: Optional[str] = None
+    content: str
+    citations_count: Optional[int] = None
+    academic_tone_score: Optional[Union[int, float]] = None
+
+class FullChapterResult(LLMModel):
+    sections: list[ChapterSection]
+    citations_count: Optional[int] = None
+    academic_tone_score: Optional[Union[int, float]] = None
+
+class ArchitectureLayer(LLMModel):
+    layer: str
+    config: Union[str, dict, None] = None
+
+class ArchitectureResult(LLMModel):
+    architecture_title: str
+    description: str
+    layers_breakdown: list[ArchitectureLayer] = []
+    rationale: Optional[str] = None
+
+class RegulationChapter(LLMModel):
+    capitulo: Optional[str] = None
+    secciones: list[Optional[str]] = []
+
+class RegulationFragment(LLMModel):
+    universidad: Optional[str] = None
+    facultad: Optional[str] = None
+    estructura: list[RegulationChapter] = []
+    formato: Optional[dict] = None
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Optional
+import numpy as np
+from app.db.document_store import document_store
+from app.services.document_service import document_service
+
+SPANISH_STOPWORDS = {
+    "a", "al", "algo", "ante", "como", "con", "cual", "de", "del", "desde", "donde", "el", "ella",
+    "en", "entre", "es", "esta", "este", "esto", "fue", "ha", "hay", "la", "las", "le", "lo", "los",
+    "mas", "no", "o", "para", "pero", "por", "que", "se", "ser", "si", "sin", "sobre", "son", "su",
+    "sus", "tambien", "un", "una", "uno", "y", "ya",
+}
+
+def tokenize(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return [t for t in re.findall(r"[a-z0-9]+", text) if len(t) > 1 and t not in SPANISH_STOPWORDS]
+
+class HashingEmbedder:
+    """
+    Embedding local sin modelo: bolsa de palabras y bigramas proyectada con
+    feature hashing a un vector de dimensión fija, normalizado L2.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _bucket(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.dim
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+            for feature, count in Counter(features).items():
+                matrix[row, self._bucket(feature)] += 1.0 + np.log(count)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+class RetrievalIndex:
+    """Índice invertido BM25 (postings en formato CSR) con matriz de embeddings opcional."""
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, vocab: dict, offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_lens: np.ndarray, embeddings: Optional[np.ndarray] = None):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.embeddings = embeddings
+        n = len(doc_lens)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        self.avgdl = float(doc_lens.mean()) if n else 0.0
+
+    @classmethod
+    def build(cls, chunks: list[str], embedder: Optional[HashingEmbedder] = None) -> "RetrievalIndex":
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_lens = np.zeros(len(chunks), dtype=np.float32)
+        for doc_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            doc_lens[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        vocab = {term: i for i, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for term, i in vocab.items():
+            offsets[i + 1] = len(postings[term])
+        offsets = np.cumsum(offsets)
+        doc_ids = np.zeros(offsets[-1], dtype=np.int32)
+        tfs = np.zeros(offsets[-1], dtype=np.float32)
+        for term, i in vocab.items():
+            entries = postings[term]
+            doc_ids[offsets[i]:offsets[i + 1]] = [d for d, _ in entries]
+            tfs[offsets[i]:offsets[i + 1]] = [tf for _, tf in entries]
+
+        embeddings = embedder.embed(chunks) if embedder else None
+        return cls(vocab, offsets, doc_ids, tfs, doc_lens, embeddings)
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.doc_lens), dtype=np.float32)
+        if not len(self.doc_lens):
+            return scores
+        for term in set(tokenize(query)):
+            i = self.vocab.get(term)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            norm = self.K1 * (1 - self.B + self.B * self.doc_lens[docs] / (self.avgdl or 1.0))
+            scores[docs] += self.idf[i] * tf * (self.K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 4, embedder: Optional[HashingEmbedder] = None,
+               embedding_weight: float = 0.5) -> list[tuple[int, float]]:
+        scores = self.bm25_scores(query)
+        if self.embeddings is not None and embedder is not None and len(scores):
+            # Búsqueda híbrida: BM25 normalizado + similitud coseno
+            if scores.max() > 0:
+                scores = scores / scores.max()
+            cosine = self.embeddings @ embedder.embed([query])[0]
+            scores = (1 - embedding_weight) * scores + embedding_weight * cosine
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path: str, passages: list[str]):
+        arrays = {
+            "vocab": np.frombuffer(json.dumps(list(self.vocab)).encode("utf-8"), dtype=np.uint8),
+            "passages": np.frombuffer(json.dumps(passages, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+            "offsets": self.offsets, "doc_ids": self.doc_ids, "tfs": self.tfs, "doc_lens": self.doc_lens,
+        }
+        if self.embeddings is not None:
+            arrays["embeddings"] = self.embeddings
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> tuple["RetrievalIndex", list[str]]:
+        with np.load(path) as data:
+            terms = json.loads(data["vocab"].tobytes().decode("utf-8"))
+            passages = json.loads(data["passages"].tobytes().decode("utf-8"))
+            index = cls(
+                {term: i for i, term in enumerate(terms)},
+                data["offsets"], data["doc_ids"], data["tfs"], data["doc_lens"],
+                data["embeddings"] if "embeddings" in data.files else None,
+            )
+        return index, passages
+
+class RetrievalService:
+    def __init__(self):
+        self.index_dir = os.getenv("RETRIEVAL_INDEX_DIR", "retrieval_indexes")
+        self.top_k = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+        self.chunk_size = int(os.getenv("RETRIEVAL_CHUNK_SIZE", "1000"))
+        self.chunk_overlap = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200"))
+        self.max_memory_indexes = int(os.getenv("RETRIEVAL_MAX_MEMORY_INDEXES", "32"))
+        self.embedder = HashingEmbedder(int(os.getenv("RETRIEVAL_EMBEDDING_DIM", "512"))) \
+            if os.getenv("RETRIEVAL_EMBEDDINGS", "false").lower() == "true" else None
+        self._indexes: "OrderedDict[str, tuple[RetrievalIndex, list[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, document_hash: str) -> str:
+        return os.path.join(self.index_dir, f"{document_hash}.npz")
+
+    def _load_or_build(self, document_hash: str, text: Optional[str]):
+        path = self._path(document_hash)
+        if os.path.exists(path):
+            index, passages = RetrievalIndex.load(path)
+            # Un índice guardado sin embeddings se reconstruye si ahora están activados
+            if self.embedder is None or index.embeddings is not None or text is None:
+                return index, passages
+        if text is None:
+            return None
+        passages = document_service.chunk_text(text, self.chunk_size, self.chunk_overlap)
+        index = RetrievalIndex.build(passages, self.embedder)
+        os.makedirs(self.index_dir, exist_ok=True)
+        index.save(path, passages)
+        return index, passages
+
+    async def get_index(self, document_hash: str, text: Optional[str] = None):
+        # El hash llega del cliente y se usa como nombre de archivo
+        if not re.fullmatch(r"[0-9a-f]{64}", document_hash or ""):
+            return None
+        with self._lock:
+            if document_hash in self._indexes:
+                self._indexes.move_to_end(document_hash)
+                return self._indexes[document_hash]
+
+        if text is None and not os.path.exists(self._path(document_hash)):
+            record = await document_store.get(document_hash)
+            text = (record or {}).get("text")
+            if not text:
+                return None
+
+        loaded = await asyncio.to_thread(self._load_or_build, document_hash, text)
+        if loaded is None:
+            return None
+        with self._lock:
+            self._indexes[document_hash] = loaded
+            while len(self._indexes) > self.max_memory_indexes:
+                self._indexes.popitem(last=False)
+        return loaded
+
+    async def search(self, document_hash: str, query: str, k: Optional[int] = None) -> list[dict]:
+        loaded = await self.get_index(document_hash)
+        if loaded is None:
+            return []
+        index, passages = loaded
+        hits = index.search(query, k or self.top_k, self.embedder)
+        return [{"chunk_id": i, "score": round(score, 4), "text": passages[i]} for i, score in hits]
+
+retrieval_service = RetrievalService()
@@ -0,0 +1,56 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+from app.utils.env import load_env
+from app.services.cache_service import ResponseCache
+from app.services.scheduler_service import current_user_id
+
+load_env()
+
+class RevisionService:
+    """
+    Guarda el último análisis de cada documento (por usuario) para las re-revisiones
+    incrementales: solo los párrafos nuevos o modificados vuelven al modelo.
+    Reutiliza el LRU + SQLite de la caché de respuestas en una instancia (y archivo) propia,
+    para que la purga por TTL de la caché no borre revisiones.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("REVISION_ENABLED", "true").lower() == "true"
+        self.store = ResponseCache(
+            max_entries=int(os.getenv("REVISION_MAX_DOCUMENTS", "2000")),
+            max_bytes=int(os.getenv("REVISION_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl_seconds=int(os.getenv("REVISION_TTL_SECONDS", str(7 * 24 * 3600))),
+            sqlite_path=os.getenv("REVISION_SQLITE_PATH") or None,
+        )
+
+    @staticmethod
+    def paragraph_hash(paragraph: str) -> str:
+        # Los cambios de espacios o saltos de línea no cuentan como edición
+        normalized = re.sub(r"\s+", " ", paragraph).strip()
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def split_paragraphs(text: str) -> list[str]:
+        return [p.strip() for p in re.split(r"\n\s*\n|\n", text or "") if p.strip()]
+
+    @staticmethod
+    def _key(kind: str, document_id: str) -> str:
+        return f"revision:{kind}:{current_user_id.get()}:{document_id}"
+
+    async def load(self, kind: str, document_id: Optional[str]) -> Optional[dict]:
+        if not (self.enabled and document_id):
+            return None
+        raw = await asyncio.to_thread(self.store.get, self._key(kind, document_id))
+        return json.loads(raw) if raw else None
+
+    async def save(self, kind: str, document_id: Optional[str], state: dict):
+        if not (self.enabled and document_id):
+            return
+        raw = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+        await asyncio.to_thread(self.store.set, self._key(kind, document_id), raw)
+
+revision_service = RevisionService()
@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+from app.utils.env import load_env
+from app.utils.metrics import record_stage
+
+load_env()
+
+# Usuario de la petición en curso (lo fija el middleware en main.py)
+current_user_id: ContextVar[str] = ContextVar("current_user_id", default="anonymous")
+
+# Menor número = mayor prioridad. Las llamadas baratas pasan antes que las generaciones largas.
+ENDPOINT_PRIORITIES = {
+    "writing.analyze": 0,
+    "thesis.viability": 1,
+    "thesis.chapter_one": 1,
+    "tech.architecture": 2,
+    "writing.versions": 2,
+    "thesis.structure": 2,
+    "analysis.regulations": 3,
+    "writing.full_chapter": 4,
+}
+DEFAULT_PRIORITY = 2
+
+class OverloadedError(Exception):
+    """La espera estimada en cola supera el plazo: se rechaza pronto con 503 + Retry-After."""
+
+    def __init__(self, retry_after: float, reason: str = "queue_full"):
+        super().__init__(reason)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self) -> float:
+        """Consume un token; si no hay, devuelve los segundos hasta el próximo."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class LLMScheduler:
+    """
+    Control de admisión para las llamadas salientes al LLM: límite de concurrencia
+    global y por usuario, token bucket según la cuota del proveedor y cola con prioridad.
+    """
+
+    def __init__(self, max_concurrency: int = 16, per_user_concurrency: int = 6,
+                 rate_per_second: float = 0.0, burst: int = 10, queue_deadline: float = 30.0,
+                 max_queue: int = 500):
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.queue_deadline = queue_deadline
+        self.max_queue = max_queue
+        self._inflight = 0
+        self._inflight_by_user: dict[str, int] = {}
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._wakeup_handle: Optional[asyncio.TimerHandle] = None
+        # EWMA del tiempo de servicio de una llamada (segundos)
+        self._service_time = 5.0
+        self._stats = {"admitted": 0, "rejected": 0, "completed": 0}
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+            per_user_concurrency=int(os.getenv("LLM_PER_USER_CONCURRENCY", "6")),
+            rate_per_second=float(os.getenv("LLM_RATE_PER_SECOND", "0")),
+            burst=int(os.getenv("LLM_RATE_BURST", "10")),
+            queue_deadline=float(os.getenv("LLM_QUEUE_DEADLINE_SECONDS", "30")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "500")),
+        )
+
+    def estimated_wait(self, priority: int) -> float:
+        ahead = sum(1 for entry in self._queue if entry[0] <= priority)
+        backlog = self._inflight + ahead - self.max_concurrency + 1
+        if backlog <= 0:
+            return 0.0
+        return math.ceil(backlog / self.max_concurrency) * self._service_time
+
+    @asynccontextmanager
+    async def slot(self, endpoint: Optional[str] = None, user_id: Optional[str] = None):
+        user_id = user_id or current_user_id.get()
+        priority = ENDPOINT_PRIORITIES.get(endpoint, DEFAULT_PRIORITY)
+        queued_at = time.monotonic()
+        await self._acquire(priority, user_id)
+        started = time.monotonic()
+        record_stage("llm.queue", started - queued_at)
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+            self._release(user_id)
+
+    def check_admission(self, endpoint: Optional[str] = None, priority: Optional[int] = None):
+        """Rechaza sin encolar; los streams la llaman antes de enviar el 200."""
+        if priority is None:
+            priority = ENDPOINT_PRIORITIES.get(endpoint, DEFAULT_PRIORITY)
+        if len(self._queue) >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise OverloadedError(self._service_time, "queue_full")
+        wait = self.estimated_wait(priority)
+        if wait > self.queue_deadline:
+            self._stats["rejected"] += 1
+            raise OverloadedError(wait, "deadline_exceeded")
+
+    async def _acquire(self, priority: int, user_id: str):
+        self.check_admission(priority=priority)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), user_id, future)
+        heapq.heappush(self._queue, entry)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Se le asignó el slot justo antes de cancelarse: devolverlo
+                self._release(user_id)
+            elif entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            raise
+        self._stats["admitted"] += 1
+
+    def _release(self, user_id: str):
+        self._inflight -= 1
+        remaining = self._inflight_by_user.get(user_id, 1) - 1
+        if remaining:
+            self._inflight_by_user[user_id] = remaining
+        else:
+            self._inflight_by_user.pop(user_id, None)
+        self._stats["completed"] += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Asigna slots libres a las entradas de mayor prioridad que respeten el límite por usuario."""
+        deferred = []
+        while self._queue and self._inflight < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            _, _, user_id, future = entry
+            if future.done():
+                continue
+            if self._inflight_by_user.get(user_id, 0) >= self.per_user_concurrency:
+                deferred.append(entry)
+                continue
+            delay = self.bucket.try_take()
+            if delay > 0:
+                deferred.append(entry)
+                self._schedule_wakeup(delay)
+                break
+            self._inflight += 1
+            self._inflight_by_user[user_id] = self._inflight_by_user.get(user_id, 0) + 1
+            future.set_result(None)
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup_handle is None or self._wakeup_handle.cancelled():
+            def wakeup():
+                self._wakeup_handle = None
+                self._dispatch()
+            self._wakeup_handle = asyncio.get_running_loop().call_later(delay, wakeup)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "inflight": self._inflight,
+            "queued": len(self._queue),
+            "service_time_ewma": round(self._service_time, 3),
+            "max_concurrency": self.max_concurrency,
+        }
+
+llm_scheduler = LLMScheduler.from_env()
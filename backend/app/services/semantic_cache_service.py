@@ -0,0 +1,225 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from app.services.retrieval_service import tokenize
+from app.services.scheduler_service import current_user_id
+from app.utils.env import load_env
+from app.utils.metrics import SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_SIMILARITY
+
+load_env()
+
+# Hash universal (a*x + b) mod p con p primo de 31 bits: el producto cabe en uint64 sin desbordar
+_PRIME = np.uint64((1 << 31) - 1)
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*\s*%?")
+_SENTENCE_RE = re.compile(r"[.!?;:\n]+")
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+def anchors(text: str) -> frozenset[str]:
+    """
+    Lo que el MinHash no distingue y cambia el significado: cifras (con su %) y nombres propios
+    (palabras en mayúscula que no abren una oración, siglas). "45%" y "62%", o "Tacna" y "Piura",
+    dejan el Jaccard casi igual pero no son la misma petición.
+    """
+    found = {re.sub(r"\s+", "", number) for number in _NUMBER_RE.findall(text or "")}
+    for sentence in _SENTENCE_RE.split(text or ""):
+        words = _WORD_RE.findall(sentence)
+        for position, word in enumerate(words):
+            if (position and word[0].isupper()) or (len(word) > 1 and word.isupper()):
+                found.add(word)
+    return frozenset(found)
+
+def _parse_thresholds(raw: str) -> dict[str, float]:
+    thresholds = {}
+    for item in raw.split(","):
+        if ":" in item:
+            endpoint, value = item.rsplit(":", 1)
+            thresholds[endpoint.strip()] = float(value)
+    return thresholds
+
+class SemanticCache:
+    """
+    Caché de respuestas por similitud, 100% local. Cada texto se normaliza (tildes, mayúsculas,
+    stopwords), se convierte en el conjunto de sus palabras y bigramas y se resume en una firma
+    MinHash. Las firmas viven en una matriz NumPy de tamaño fijo y un índice LSH por bandas
+    devuelve los candidatos; la similitud (Jaccard estimado) se verifica sobre la matriz.
+    Solo se reutiliza una respuesta si supera el umbral del endpoint, es del mismo usuario y sus
+    cifras y nombres propios coinciden exactamente (ver `anchors`). Desactivada por defecto.
+    """
+
+    def __init__(self, thresholds: dict[str, float], num_perm: int = 64, bands: int = 16,
+                 max_entries: int = 2048, ttl_seconds: int = 7 * 24 * 3600, enabled: bool = False,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser múltiplo de bands")
+        self.enabled = enabled
+        self.thresholds = thresholds
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._signatures = np.zeros((max_entries, num_perm), dtype=np.uint32)
+        # slot -> (endpoint, namespace, created_at, value, claves LSH, anclas); el orden es el de uso (LRU)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._buckets: dict[tuple, set[int]] = {}
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+        self._evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        return cls(
+            thresholds=_parse_thresholds(
+                os.getenv("SEMANTIC_CACHE_THRESHOLDS", "thesis.viability:0.8,writing.analyze:0.9")
+            ),
+            num_perm=int(os.getenv("SEMANTIC_CACHE_NUM_PERM", "64")),
+            bands=int(os.getenv("SEMANTIC_CACHE_BANDS", "16")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048")),
+            ttl_seconds=int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true",
+        )
+
+    def is_enabled(self, endpoint: Optional[str]) -> bool:
+        return self.enabled and endpoint in self.thresholds
+
+    @staticmethod
+    def namespace(*parts) -> str:
+        """Lo que no es texto libre (modelo, plantilla, max_tokens) debe coincidir exactamente."""
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()[:16]
+
+    @staticmethod
+    def _scoped(namespace: str) -> str:
+        # Cada usuario tiene su propio espacio: nunca se sirve la respuesta de otro estudiante
+        return f"{current_user_id.get()}:{namespace}"
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        tokens = tokenize(text)
+        shingles = set(tokens) | {f"{a}_{b}" for a, b in zip(tokens, tokens[1:])}
+        if not shingles:
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        ) % _PRIME
+        # (num_perm, n_shingles) -> mínimo por permutación
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, namespace: str, signature: np.ndarray) -> list[tuple]:
+        return [
+            (namespace, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def _best_match(self, namespace: str, signature: np.ndarray, now: float,
+                    required: frozenset[str]) -> tuple[Optional[int], float]:
+        candidates = set()
+        for key in self._band_keys(namespace, signature):
+            candidates.update(self._buckets.get(key, ()))
+        for slot in [s for s in candidates if now - self._entries[s][2] > self.ttl_seconds]:
+            self._remove(slot)
+            candidates.discard(slot)
+        candidates = {s for s in candidates if self._entries[s][5] == required}
+        if not candidates:
+            return None, 0.0
+        slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarities = (self._signatures[slots] == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        return int(slots[best]), float(similarities[best])
+
+    def _counter(self, endpoint: str) -> dict:
+        return self._stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+
+    def lookup(self, endpoint: str, namespace: str, text: str) -> Optional[str]:
+        if not self.is_enabled(endpoint):
+            return None
+        signature = self.signature(text)
+        namespace = self._scoped(namespace)
+        with self._lock:
+            slot, similarity = (None, 0.0) if signature is None else self._best_match(
+                namespace, signature, time.time(), anchors(text)
+            )
+            if slot is not None:
+                SEMANTIC_CACHE_SIMILARITY.observe(similarity, endpoint=endpoint)
+            if slot is None or similarity < self.thresholds[endpoint]:
+                self._counter(endpoint)["misses"] += 1
+                SEMANTIC_CACHE_LOOKUPS.inc(endpoint=endpoint, result="miss")
+                return None
+            self._entries.move_to_end(slot)
+            self._counter(endpoint)["hits"] += 1
+            SEMANTIC_CACHE_LOOKUPS.inc(endpoint=endpoint, result="hit")
+            return self._entries[slot][3]
+
+    def add(self, endpoint: str, namespace: str, text: str, value: str):
+        if not self.is_enabled(endpoint):
+            return
+        signature = self.signature(text)
+        if signature is None:
+            return
+        now = time.time()
+        namespace, required = self._scoped(namespace), anchors(text)
+        with self._lock:
+            slot, similarity = self._best_match(namespace, signature, now, required)
+            if slot is not None and similarity == 1.0:
+                # Mismo texto normalizado (ej. dos peticiones simultáneas): se reemplaza, no se duplica
+                self._remove(slot)
+            if not self._free:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+            slot = self._free.pop()
+            keys = self._band_keys(namespace, signature)
+            self._signatures[slot] = signature
+            self._entries[slot] = (endpoint, namespace, now, value, keys, required)
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(slot)
+
+    def clear(self):
+        with self._lock:
+            for slot in list(self._entries):
+                self._remove(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for endpoint, counts in self._stats.items():
+                total = counts["hits"] + counts["misses"]
+                endpoints[endpoint] = {
+                    **counts,
+                    "threshold": self.thresholds.get(endpoint),
+                    "hit_ratio": round(counts["hits"] / total, 4) if total else 0.0,
+                }
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "endpoints": endpoints,
+            }
+
+    # --- Helpers internos (llamar con el lock tomado) ---
+
+    def _remove(self, slot: int):
+        keys = self._entries.pop(slot)[4]
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del self._buckets[key]
+        self._free.append(slot)
+
+semantic_cache = SemanticCache.from_env()
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+from app.db.sqlite import LazySQLite
+from app.utils.env import load_env
+
+load_env()
+
+class SingleFlight:
+    """
+    Deduplica llamadas idénticas en curso: los llamadores concurrentes con la misma
+    clave esperan un único futuro compartido. Con `sqlite_path`, una tabla local de
+    locks/resultados extiende la deduplicación a todos los workers de gunicorn.
+    Solo se comparte con quien ya esperaba: una llamada que empieza después de que el
+    líder terminó vuelve a llamar al modelo (nunca recibe un resultado viejo de la tabla).
+    """
+
+    def __init__(self, enabled: bool = True, sqlite_path: Optional[str] = None,
+                 stale_seconds: float = 120.0, result_ttl: float = 30.0, poll_interval: float = 0.2):
+        self.enabled = enabled
+        self.stale_seconds = stale_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._owner = uuid.uuid4().hex
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        self._stats = {"leaders": 0, "coalesced_local": 0, "coalesced_remote": 0, "remote_fallbacks": 0}
+        self._lock = threading.Lock()
+        self._sqlite = LazySQLite(sqlite_path, (
+            "CREATE TABLE IF NOT EXISTS ai_singleflight ("
+            "key TEXT PRIMARY KEY, owner TEXT NOT NULL, started_at REAL NOT NULL, "
+            "result TEXT, finished_at REAL)",
+        )) if sqlite_path else None
+
+    @classmethod
+    def from_env(cls) -> "SingleFlight":
+        return cls(
+            enabled=os.getenv("AI_SINGLEFLIGHT_ENABLED", "true").lower() == "true",
+            sqlite_path=os.getenv("AI_SINGLEFLIGHT_SQLITE_PATH") or os.getenv("AI_CACHE_SQLITE_PATH") or None,
+            stale_seconds=float(os.getenv("AI_SINGLEFLIGHT_STALE_SECONDS", "120")),
+        )
+
+    @property
+    def _db(self):
+        return self._sqlite.connection
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[str]], shared: bool = True) -> str:
+        """Con `shared=False` (sin caché, reintentos) se llama siempre, sin sumarse a nadie."""
+        if not self.enabled or not shared:
+            return await factory()
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced_local"] += 1
+            return await self._wait(key, task)
+
+        # La tarea se registra antes de consultar la tabla compartida (en un hilo): las
+        # peticiones locales que lleguen mientras tanto se suman a ella
+        task = asyncio.ensure_future(self._lead(key, factory))
+        self._inflight[key] = task
+        return await self._wait(key, task)
+
+    async def _lead(self, key: str, factory: Callable[[], Awaitable[str]]) -> str:
+        try:
+            if self._sqlite is not None:
+                claimed = await asyncio.to_thread(self._try_claim, key)
+                if not claimed:
+                    result = await self._wait_remote(key)
+                    if result is not None:
+                        self._stats["coalesced_remote"] += 1
+                        return result
+                    # El líder remoto falló o tardó demasiado: esta petición llama ella misma
+                    self._stats["remote_fallbacks"] += 1
+
+            self._stats["leaders"] += 1
+            try:
+                result = await factory()
+            except BaseException:
+                await asyncio.to_thread(self._release_claim, key)
+                raise
+            await asyncio.to_thread(self._publish, key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _wait(self, key: str, task: asyncio.Task) -> str:
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Si ya nadie espera el resultado, se cancela la llamada compartida
+            if self._waiters.get(key, 0) <= 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            remaining = self._waiters.get(key, 1) - 1
+            if remaining:
+                self._waiters[key] = remaining
+            else:
+                self._waiters.pop(key, None)
+
+    # --- Tabla compartida entre workers (se llaman vía asyncio.to_thread) ---
+
+    def _try_claim(self, key: str) -> bool:
+        """True si esta llamada queda como líder; False si otro worker ya está llamando al modelo."""
+        now = time.time()
+        with self._lock:
+            # Un resultado ya publicado es para quienes esperaban a ese líder, no para llamadas
+            # nuevas (un reintento recibiría la misma respuesta inválida): se reemplaza
+            self._db.execute(
+                "DELETE FROM ai_singleflight WHERE key = ? AND (result IS NOT NULL OR started_at < ?)",
+                (key, now - self.stale_seconds),
+            )
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO ai_singleflight (key, owner, started_at) VALUES (?, ?, ?)",
+                (key, self._owner, now),
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    async def _wait_remote(self, key: str) -> Optional[str]:
+        deadline = time.monotonic() + self.stale_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            row = await asyncio.to_thread(self._read_result, key)
+            if row is None:
+                return None
+            if row[0] is not None:
+                return row[0]
+        return None
+
+    def _read_result(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            return self._db.execute("SELECT result FROM ai_singleflight WHERE key = ?", (key,)).fetchone()
+
+    def _publish(self, key: str, result: str):
+        if self._sqlite is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE ai_singleflight SET result = ?, finished_at = ? WHERE key = ? AND owner = ?",
+                (result, now, key, self._owner),
+            )
+            self._db.execute(
+                "DELETE FROM ai_singleflight WHERE result IS NOT NULL AND finished_at < ?",
+                (now - self.result_ttl,),
+            )
+            self._db.commit()
+
+    def _release_claim(self, key: str):
+        if self._sqlite is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM ai_singleflight WHERE key = ? AND owner = ? AND result IS NULL",
+                (key, self._owner),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "inflight": len(self._inflight),
+            "cross_worker": self._sqlite is not None,
+        }
@@ -1,10 +1,20 @@
 from app.services.ai_service import ai_service
+from app.services.prompt_registry import prompt_registry
+from app.services.structured_output_service import structured_output
+from app.services.response_schemas import StructureResult
+from app.utils.metrics import traced
+from app.services.retrieval_service import retrieval_service, tokenize
+from app.db.document_store import document_store
+from app.utils.streaming import llm_stream_to_sse
 import json
 
+# Palabras que aparecen en casi todo título de capítulo y no sirven para emparejarlo con un pasaje
+GENERIC_TITLE_WORDS = {"capitulo", "seccion", "parte", "titulo"}
+
 class StructureService:
-    @staticmethod
-    async def generate_structure(title: str, objective: str, regulation_structure: list = None):
-        system_prompt = """
+    PROMPT = prompt_registry.register(
+        "thesis.structure",
+        system="""
         Eres un experto en metodología de investigación. Tu tarea es generar la TABLA DE CONTENIDOS (Estructura) detallada para una tesis.
         
         Si se proporciona una estructura de reglamento, DEBES seguirla estrictamente, pero desglosando los subpuntos necesarios para el tema específico.
@@ -23,22 +33,90 @@ class StructureService:
             }
           ]
         }
-        """
-
-        regulation_info = f"Estructura del Reglamento a seguir: {json.dumps(regulation_structure)}" if regulation_structure else "No hay reglamento cargado, usa estándar APA/Metodológico."
-        
-        user_prompt = f"""
+        """,
+        user="""
         Tema de Tesis: {title}
         Objetivo: {objective}
-        {regulation_info}
-        """
+        {regulation}
+        {excerpts}
+        """,
+        budget=6000,
+        # Primero se resumen los fragmentos recuperados; la estructura del reglamento es lo último que se toca
+        trim=("excerpts", "regulation", "objective"),
+    )
 
-        response = await ai_service.get_response(system_prompt, user_prompt)
-        
-        try:
-            clean_response = response.strip().replace("```json", "").replace("```", "")
-            return json.loads(clean_response)
-        except Exception as e:
-            return {"error": "Error al generar la estructura", "raw": response}
+    @staticmethod
+    def _structure_prompts(title: str, objective: str, regulation_structure: list = None,
+                           passages: list[dict] = None) -> tuple[str, str]:
+        # JSON compacto y sin escapes unicode: mismo contenido con menos tokens
+        regulation_info = f"Estructura del Reglamento a seguir: {json.dumps(regulation_structure, ensure_ascii=False, separators=(',', ':'))}" if regulation_structure else "No hay reglamento cargado, usa estándar APA/Metodológico."
+        excerpts = ""
+        if passages:
+            if not regulation_structure:
+                # El reglamento llega solo por sus fragmentos
+                regulation_info = ""
+            excerpts = "Fragmentos relevantes del reglamento:\n" + "\n---\n".join(p["text"].strip() for p in passages)
+        return StructureService.PROMPT.render(
+            title=title, objective=objective, regulation=regulation_info, excerpts=excerpts,
+        )
+
+    @staticmethod
+    async def _build_prompts(title: str, objective: str, regulation_structure: list = None,
+                             document_hash: str = None) -> tuple[str, str]:
+        passages = None
+        if document_hash:
+            if not regulation_structure:
+                record = await document_store.get(document_hash)
+                regulation_structure = ((record or {}).get("regulation") or {}).get("estructura")
+            # Solo los top-k pasajes relevantes al tema, no el reglamento completo
+            chapter_titles = " ".join(
+                c.get("capitulo", "") for c in regulation_structure or [] if isinstance(c, dict)
+            )
+            passages = await retrieval_service.search(document_hash, f"{title} {objective} {chapter_titles}")
+            if passages:
+                # Solo los pasajes y los capítulos que aparecen en ellos, no la estructura completa
+                regulation_structure = StructureService._matching_chapters(regulation_structure, passages)
+        return StructureService._structure_prompts(title, objective, regulation_structure, passages)
+
+    @staticmethod
+    def _matching_chapters(regulation_structure: list, passages: list[dict]) -> list:
+        """Capítulos del reglamento cuyo título aparece (al menos la mitad de sus palabras) en los pasajes."""
+        passage_words = set()
+        for passage in passages:
+            passage_words.update(tokenize(passage["text"]))
+        matched = []
+        for chapter in regulation_structure or []:
+            if not isinstance(chapter, dict):
+                continue
+            words = set(tokenize(chapter.get("capitulo", ""))) - GENERIC_TITLE_WORDS
+            if words and 2 * len(words & passage_words) >= len(words):
+                matched.append(chapter)
+        return matched
+
+    @staticmethod
+    @traced("structure.generate_structure", endpoint="thesis.structure")
+    async def generate_structure(title: str, objective: str, regulation_structure: list = None,
+                                 document_hash: str = None):
+        system_prompt, user_prompt = await StructureService._build_prompts(
+            title, objective, regulation_structure, document_hash
+        )
+        return await structured_output.generate(
+            system_prompt, user_prompt, StructureResult,
+            endpoint="thesis.structure", error_message="Error al generar la estructura",
+        )
+
+    @staticmethod
+    async def stream_structure(title: str, objective: str, regulation_structure: list = None,
+                               document_hash: str = None):
+        system_prompt, user_prompt = await StructureService._build_prompts(
+            title, objective, regulation_structure, document_hash
+        )
+        async for event in llm_stream_to_sse(
+            ai_service.astream(system_prompt, user_prompt, endpoint="thesis.structure", json_mode=True,
+                              schema=StructureResult),
+            array_key="chapters",
+            error_message="Error al generar la estructura",
+        ):
+            yield event
 
 structure_service = StructureService()
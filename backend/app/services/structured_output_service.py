@@ -0,0 +1,88 @@
+from app.services.ai_service import ai_service
+from app.services.semantic_cache_service import SemanticCache, semantic_cache
+from app.services.usage_service import usage_service
+from app.utils.json_repair import RepairResult, repair_json
+from app.utils.metrics import STRUCTURED_OUTPUT
+from pydantic import BaseModel, ValidationError
+from typing import Optional
+import json
+import os
+
+class StructuredOutputService:
+    """
+    Motor de salida estructurada: JSON mode del proveedor, reparación tolerante del JSON
+    (fences, comas finales, salida truncada), validación con el esquema Pydantic y,
+    si nada de eso basta, una petición de continuación solo por la cola que falta.
+    """
+    MAX_CONTINUATIONS = int(os.getenv("LLM_MAX_CONTINUATIONS", "1"))
+
+    @staticmethod
+    def parse(raw: str, schema: type[BaseModel]) -> tuple[Optional[dict], RepairResult]:
+        result = repair_json(raw)
+        if not result.ok:
+            return None, result
+        try:
+            return schema.model_validate(result.value).model_dump(), result
+        except ValidationError:
+            return None, result
+
+    @staticmethod
+    async def generate(system_prompt: str, user_prompt: str, schema: type[BaseModel],
+                       endpoint: str, error_message: str,
+                       use_cache: bool = True, max_tokens: Optional[int] = None,
+                       semantic_text: Optional[str] = None, fresh: bool = False) -> dict:
+        """
+        `semantic_text` es el texto libre de la petición (sin la plantilla): si una petición casi
+        igual ya se respondió, se reutiliza su resultado validado (ver semantic_cache_service.py).
+        `fresh=True` (reintentos) siempre llama al modelo; un resultado válido sí se guarda.
+        """
+        semantic = use_cache and not fresh and semantic_text is not None and semantic_cache.is_enabled(endpoint)
+        if semantic:
+            namespace = SemanticCache.namespace(ai_service.model, max_tokens or ai_service.max_tokens, system_prompt)
+            cached = semantic_cache.lookup(endpoint, namespace, semantic_text)
+            if cached is not None:
+                usage_service.record_cache_hit(endpoint)
+                return json.loads(cached)
+
+        # La caché de respuestas se escribe solo si el resultado valida contra el esquema:
+        # una respuesta malformada no se vuelve a servir
+        response = await ai_service.get_response(
+            system_prompt, user_prompt, endpoint=endpoint,
+            use_cache=use_cache, max_tokens=max_tokens, json_mode=True, store=False, fresh=fresh,
+        )
+        first = response
+        data, result = StructuredOutputService.parse(response, schema)
+
+        continuations = []
+        # Salida cortada por max_tokens: si la reparación local ya dio un objeto válido se usa tal
+        # cual; solo cuando no basta se pide la cola que falta en lugar de regenerar todo.
+        # Un JSON completo pero inválido no se arregla así.
+        while data is None and result.truncated and len(continuations) < StructuredOutputService.MAX_CONTINUATIONS:
+            tail = await ai_service.continue_response(
+                system_prompt, user_prompt, response,
+                endpoint=endpoint, use_cache=use_cache, max_tokens=max_tokens, store=False, fresh=fresh,
+            )
+            continuations.append((response, tail))
+            response = response + tail
+            data, result = StructuredOutputService.parse(response, schema)
+
+        if data is None:
+            STRUCTURED_OUTPUT.inc(endpoint=endpoint, outcome="failed")
+            return {"error": error_message, "raw": response}
+        outcome = "continued" if continuations else "repaired" if result.repaired else "ok"
+        STRUCTURED_OUTPUT.inc(endpoint=endpoint, outcome=outcome)
+        # Un resultado salvado cerrando una salida cortada (result.truncated) es válido pero incompleto:
+        # se devuelve, pero no se guarda en ninguna caché
+        complete = not result.truncated
+        if use_cache and complete:
+            await ai_service.remember(system_prompt, user_prompt, first, endpoint=endpoint,
+                                      max_tokens=max_tokens, json_mode=True)
+            for partial, tail in continuations:
+                await ai_service.remember(system_prompt, user_prompt, tail, endpoint=endpoint,
+                                          max_tokens=max_tokens, partial=partial)
+        if semantic and complete:
+            # Solo entran resultados completos y ya validados contra el esquema
+            semantic_cache.add(endpoint, namespace, semantic_text, json.dumps(data, ensure_ascii=False))
+        return data
+
+structured_output = StructuredOutputService()
@@ -0,0 +1,142 @@
+import re
+from typing import Optional
+
+# Léxico de estilo académico: forma -> reemplazo sugerido (None si hay que reformular la frase).
+# Solo palabras completas que casi nunca son correctas en una tesis: nada de formas que también son
+# español académico normal ("puesto que", "de hecho", "hace diez años", "bastante evidencia", "pues")
+FIRST_PERSON = {
+    "yo": None, "me": None, "mi": None, "mis": None, "nosotros": None, "nosotras": None,
+    "nuestro": None, "nuestra": None, "nuestros": None, "nuestras": None, "nos": None,
+    "considero": "se considera", "consideramos": "se considera", "creo": "se estima",
+    "creemos": "se estima", "pienso": "se plantea", "pensamos": "se plantea",
+    "propongo": "se propone", "proponemos": "se propone", "planteo": "se plantea",
+    "planteamos": "se plantea", "observamos": "se observa", "analizamos": "se analiza",
+    "concluimos": "se concluye", "realizamos": "se realizó", "hemos": None, "he": None,
+    "podemos": "es posible", "queremos": "se busca", "buscamos": "se busca",
+    "decidimos": "se decidió", "obtuvimos": "se obtuvo", "utilizamos": "se utilizó",
+    "usamos": "se utilizó", "desarrollamos": "se desarrolló", "vamos": None,
+    "hice": "se realizó", "hicimos": "se realizó", "haremos": "se realizará", "tenemos": "se cuenta con",
+    "encontramos": "se encontró", "aplicamos": "se aplicó", "elaboramos": "se elaboró",
+    "diseñamos": "se diseñó", "implementamos": "se implementó", "notamos": "se advierte",
+}
+
+INFORMAL = {
+    "o sea": "es decir", "un montón de": "numerosos", "súper": "muy", "chévere": None,
+    "básicamente": None, "obviamente": "evidentemente", "obvio": "evidente",
+    "cosa": "aspecto", "cosas": "aspectos",
+    "a nivel de": "en cuanto a", "hoy en día": "actualmente", "mucho muy": "muy",
+    "ok": None, "okey": None, "xq": "porque",
+}
+
+VAGUE_VERBS = {
+    "hacer": "realizar / elaborar / ejecutar", "hacen": "realizan / elaboran",
+    "hizo": "realizó / elaboró", "hicieron": "realizaron / elaboraron", "haciendo": "realizando / elaborando",
+    "crear": "diseñar / desarrollar / construir", "crea": "diseña / desarrolla", "crean": "diseñan / desarrollan",
+    "creó": "diseñó / desarrolló", "creado": "diseñado / desarrollado",
+    "poner": "establecer / implementar / ubicar", "pone": "establece / implementa", "ponen": "establecen / implementan",
+    "puso": "estableció / implementó",
+    "sacar": "obtener / extraer", "saca": "obtiene / extrae", "sacaron": "obtuvieron / extrajeron",
+}
+
+# categoría -> (léxico, problema, sugerencia por defecto)
+CATEGORIES = {
+    "first_person": (FIRST_PERSON, "Uso de primera persona; la redacción científica usa forma impersonal.",
+                     "Reformular en forma impersonal (ej. \"se analiza\")"),
+    "informal": (INFORMAL, "Lenguaje coloquial o informal.", "Eliminar o usar un conector formal"),
+    "vague_verb": (VAGUE_VERBS, "Verbo impreciso; conviene un verbo más específico.", "Usar un verbo específico"),
+}
+
+def _trie_regex(words) -> str:
+    """Convierte un léxico en una expresión regular con forma de trie (prefijos compartidos)."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if end else body
+
+    return build(trie)
+
+def _compile(lexicon: dict) -> re.Pattern:
+    # \b sobre texto unicode reconoce letras acentuadas; el trie evita probar cada palabra por separado
+    return re.compile(r"(?<!\w)(?:" + _trie_regex(lexicon) + r")(?!\w)", re.IGNORECASE)
+
+class StyleRulesService:
+    PATTERNS = {name: _compile(entry[0]) for name, entry in CATEGORIES.items()}
+    PARAGRAPH_SPLIT = re.compile(r"\n\s*\n|\n")
+
+    @staticmethod
+    def split_paragraphs(text: str) -> list[tuple[int, int]]:
+        """Rangos (inicio, fin) de cada párrafo no vacío dentro del texto original."""
+        spans, start = [], 0
+        for match in StyleRulesService.PARAGRAPH_SPLIT.finditer(text):
+            if text[start:match.start()].strip():
+                spans.append((start, match.start()))
+            start = match.end()
+        if text[start:].strip():
+            spans.append((start, len(text)))
+        return spans
+
+    @staticmethod
+    def find_issues(text: str, offset: int = 0) -> list[dict]:
+        issues = []
+        for category, pattern in StyleRulesService.PATTERNS.items():
+            lexicon, problem, default = CATEGORIES[category]
+            for match in pattern.finditer(text):
+                word = match.group(0)
+                entry = lexicon.get(word.lower())
+                issues.append({
+                    "match": word,
+                    "problem": problem,
+                    "suggestion": entry or default,
+                    "category": category,
+                    "start": offset + match.start(),
+                    "end": offset + match.end(),
+                    "source": "rules",
+                })
+        issues.sort(key=lambda i: i["start"])
+        return issues
+
+    @staticmethod
+    def apply_replacements(text: str, issues: list[dict], offset: int = 0) -> str:
+        """Aplica solo los reemplazos directos de registro informal (ej. "o sea" -> "es decir"); el resto requiere reformular."""
+        parts, cursor = [], 0
+        for issue in sorted(issues, key=lambda i: i["start"]):
+            start, end = issue["start"] - offset, issue["end"] - offset
+            replacement: Optional[str] = CATEGORIES[issue["category"]][0].get(issue["match"].lower())
+            if not replacement or issue["category"] != "informal" or start < cursor:
+                continue
+            if issue["match"][:1].isupper():
+                replacement = replacement[:1].upper() + replacement[1:]
+            parts += [text[cursor:start], replacement]
+            cursor = end
+        parts.append(text[cursor:])
+        return "".join(parts)
+
+    @staticmethod
+    def scan(text: str) -> list[dict]:
+        """Issues por párrafo, con offsets absolutos sobre el texto original."""
+        return [
+            {"start": start, "end": end, "issues": StyleRulesService.find_issues(text[start:end], offset=start)}
+            for start, end in StyleRulesService.split_paragraphs(text)
+        ]
+
+    @staticmethod
+    def analyze(text: str) -> dict:
+        """Análisis completamente local (milisegundos): mismo formato que la respuesta del modelo."""
+        issues = [issue for p in StyleRulesService.scan(text) for issue in p["issues"]]
+        return {
+            "has_issues": bool(issues),
+            "issues": issues,
+            "improved_text": StyleRulesService.apply_replacements(text, issues),
+        }
+
+style_rules_service = StyleRulesService()
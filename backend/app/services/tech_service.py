@@ -1,32 +1,61 @@
 from app.services.ai_service import ai_service
-import json
+from app.services.prompt_registry import prompt_registry
+from app.services.structured_output_service import structured_output
+from app.services.response_schemas import ArchitectureResult
+from app.utils.metrics import traced
+from app.utils.streaming import llm_stream_to_sse
 
 class TechService:
-    @staticmethod
-    async def generate_architecture_description(model_type: str, framework: str, task_description: str):
-        system_prompt = f"""
+    # Framework y tipo de modelo iban dentro del system prompt; ahora son datos al final del prompt
+    PROMPT = prompt_registry.register(
+        "tech.architecture",
+        system="""
         Eres un arquitecto senior de Deep Learning. Tu tarea es generar la sección "3.4 Arquitectura del Modelo Propuesto" para una tesis de ingeniería.
         Debes usar terminología técnica precisa (layers, activation functions, pooling, etc.) y seguir un tono académico formal.
-        Framework a utilizar: {framework}. Tipo de modelo: {model_type}.
+        Usa el framework y el tipo de modelo que indique el usuario.
         
         Responde ÚNICAMENTE en JSON:
-        {{
+        {
           "architecture_title": "Nombre sugerido de la arquitectura",
           "description": "Texto académico fluido...",
           "layers_breakdown": [
-            {{"layer": "Nombre capa", "config": "Detalles técnicos"}}
+            {"layer": "Nombre capa", "config": "Detalles técnicos"}
           ],
           "rationale": "Justificación técnica de esta elección"
-        }}
-        """
-        
-        user_prompt = f"Descripción de la tarea del modelo: {task_description}"
-        
-        response = await ai_service.get_response(system_prompt, user_prompt)
-        try:
-            return json.loads(response.strip().replace("```json", "").replace("```", ""))
-        except:
-            return {"error": "Error al generar arquitectura", "raw": response}
+        }
+        """,
+        user="""
+        Framework a utilizar: {framework}. Tipo de modelo: {model_type}.
+        Descripción de la tarea del modelo: {task_description}
+        """,
+        budget=2000,
+        trim=("task_description",),
+    )
+
+    @staticmethod
+    def _architecture_prompts(model_type: str, framework: str, task_description: str) -> tuple[str, str]:
+        return TechService.PROMPT.render(
+            model_type=model_type, framework=framework, task_description=task_description,
+        )
+
+    @staticmethod
+    @traced("tech.generate_architecture_description", endpoint="tech.architecture")
+    async def generate_architecture_description(model_type: str, framework: str, task_description: str):
+        system_prompt, user_prompt = TechService._architecture_prompts(model_type, framework, task_description)
+        return await structured_output.generate(
+            system_prompt, user_prompt, ArchitectureResult,
+            endpoint="tech.architecture", error_message="Error al generar arquitectura",
+        )
+
+    @staticmethod
+    def stream_architecture_description(model_type: str, framework: str, task_description: str):
+        system_prompt, user_prompt = TechService._architecture_prompts(model_type, framework, task_description)
+        return llm_stream_to_sse(
+            ai_service.astream(system_prompt, user_prompt, endpoint="tech.architecture", json_mode=True,
+                              schema=ArchitectureResult),
+            array_key="layers_breakdown",
+            error_message="Error al generar arquitectura",
+        )
 
     @staticmethod
     def estimate_resources(params_millions: float, batch_size: int = 32):
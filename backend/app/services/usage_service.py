@@ -0,0 +1,235 @@
+import asyncio
+import math
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+from app.db.usage_store import COUNTERS, usage_store
+from app.services.scheduler_service import current_user_id
+from app.utils.env import load_env
+from app.utils.metrics import LLM_COST, QUOTA_REJECTIONS
+
+load_env()
+
+# Precios por millón de tokens (por defecto, los de deepseek-chat)
+PRICE_PROMPT = float(os.getenv("LLM_PRICE_PROMPT_PER_MTOK", "0.27"))
+PRICE_PROMPT_CACHE_HIT = float(os.getenv("LLM_PRICE_PROMPT_CACHE_HIT_PER_MTOK", "0.07"))
+PRICE_COMPLETION = float(os.getenv("LLM_PRICE_COMPLETION_PER_MTOK", "1.10"))
+
+# Consumo de la petición HTTP en curso (lo abre el middleware de main.py)
+_request_usage: ContextVar[Optional[dict]] = ContextVar("request_usage", default=None)
+
+def _today() -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+def _seconds_until_reset() -> float:
+    return 86400 - time.time() % 86400
+
+class QuotaExceededError(Exception):
+    """El usuario agotó su presupuesto diario: se rechaza con 429 hasta el cambio de día (UTC)."""
+
+    def __init__(self, reason: str, limit: float, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.limit = limit
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class UsageService:
+    """
+    Contabilidad de tokens, coste y segundos de LLM por usuario y endpoint. Todo se acumula en
+    memoria y un flusher lo escribe por lotes en el usage store; los presupuestos diarios se
+    comprueban contra contadores en memoria (sin ir a la base en cada petición). Los totales
+    se resincronizan con la base en cada flush, así las cuotas cuentan lo gastado en otros workers.
+    """
+
+    def __init__(self, daily_tokens: int = 0, daily_cost: float = 0.0, daily_seconds: float = 0.0,
+                 exempt_users: Optional[set] = None, flush_interval: float = 30.0):
+        # 0 = sin límite
+        self.limits = {"tokens": daily_tokens, "cost_usd": daily_cost, "llm_seconds": daily_seconds}
+        self.exempt_users = exempt_users or set()
+        self.flush_interval = flush_interval
+        # (día, usuario, endpoint) -> contadores aún no escritos
+        self._pending: dict[tuple, dict] = {}
+        # usuario -> gasto de hoy (base + pendiente); se reinicia al cambiar de día
+        self._spent: dict[str, dict] = {}
+        self._spent_day = _today()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "UsageService":
+        exempt = os.getenv("USAGE_QUOTA_EXEMPT_USERS", "")
+        return cls(
+            daily_tokens=int(os.getenv("USAGE_DAILY_TOKEN_QUOTA", "0")),
+            daily_cost=float(os.getenv("USAGE_DAILY_COST_QUOTA_USD", "0")),
+            daily_seconds=float(os.getenv("USAGE_DAILY_LLM_SECONDS_QUOTA", "0")),
+            exempt_users={u.strip() for u in exempt.split(",") if u.strip()},
+            flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "30")),
+        )
+
+    @staticmethod
+    def cost(prompt_tokens: int, completion_tokens: int, cache_hit_tokens: int = 0) -> float:
+        cache_hit_tokens = min(cache_hit_tokens, prompt_tokens)
+        return (
+            (prompt_tokens - cache_hit_tokens) * PRICE_PROMPT
+            + cache_hit_tokens * PRICE_PROMPT_CACHE_HIT
+            + completion_tokens * PRICE_COMPLETION
+        ) / 1_000_000
+
+    def _user_spent(self, user_id: str) -> dict:
+        today = _today()
+        if today != self._spent_day:
+            self._spent, self._spent_day = {}, today
+        return self._spent.setdefault(user_id, {"tokens": 0, "cost_usd": 0.0, "llm_seconds": 0.0})
+
+    def check_quota(self, user_id: Optional[str] = None):
+        """O(1): solo diccionarios en memoria. Se llama antes de cada llamada real al LLM."""
+        user_id = user_id or current_user_id.get()
+        if user_id in self.exempt_users:
+            return
+        spent = self._user_spent(user_id)
+        for kind, limit in self.limits.items():
+            if limit and spent[kind] >= limit:
+                QUOTA_REJECTIONS.inc(reason=kind)
+                raise QuotaExceededError(kind, limit, _seconds_until_reset())
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = asyncio.create_task(self._run())
+
+    def _add(self, endpoint: Optional[str], increments: dict):
+        user_id = current_user_id.get()
+        key = (_today(), user_id, endpoint or "unknown")
+        entry = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        for counter, value in increments.items():
+            entry[counter] += value
+        spent = self._user_spent(user_id)
+        spent["tokens"] += increments.get("prompt_tokens", 0) + increments.get("completion_tokens", 0)
+        spent["cost_usd"] += increments.get("cost_usd", 0.0)
+        spent["llm_seconds"] += increments.get("llm_seconds", 0.0)
+        request = _request_usage.get()
+        if request is not None:
+            for counter, value in increments.items():
+                request[counter] = request.get(counter, 0) + value
+        self._ensure_flusher()
+
+    def record(self, endpoint: Optional[str], llm_output: Optional[dict], seconds: float):
+        usage = (llm_output or {}).get("token_usage") or {}
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        details = usage.get("prompt_tokens_details") or {}
+        cache_hit_tokens = int(usage.get("prompt_cache_hit_tokens") or details.get("cached_tokens") or 0)
+        cost = self.cost(prompt_tokens, completion_tokens, cache_hit_tokens)
+        LLM_COST.inc(cost, endpoint=endpoint or "unknown")
+        self._add(endpoint, {
+            "calls": 1, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "cache_hit_tokens": cache_hit_tokens, "cost_usd": cost, "llm_seconds": seconds,
+        })
+
+    def record_cache_hit(self, endpoint: Optional[str]):
+        self._add(endpoint, {"cache_hits": 1})
+
+    def start_request(self) -> object:
+        return _request_usage.set({})
+
+    def end_request(self, token) -> dict:
+        usage = _request_usage.get() or {}
+        _request_usage.reset(token)
+        return usage
+
+    async def flush(self):
+        if self._pending:
+            batch, self._pending = self._pending, {}
+            rows = [{"day": day, "user_id": user, "endpoint": endpoint, **counters}
+                    for (day, user, endpoint), counters in batch.items()]
+            try:
+                await usage_store.insert(rows)
+            except Exception:
+                # Se conservan para el próximo flush (sumados a lo registrado mientras tanto)
+                for key, counters in batch.items():
+                    entry = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                    for counter, value in counters.items():
+                        entry[counter] += value
+                raise
+        await self._resync()
+
+    async def _resync(self):
+        # Gasto de hoy según la base (todos los workers) más lo que este aún no escribió
+        today = _today()
+        spent: dict[str, dict] = {}
+        rows = await usage_store.aggregate(today)
+        pending = [{"user_id": user, **counters} for (day, user, _), counters in self._pending.items() if day == today]
+        for row in rows + pending:
+            entry = spent.setdefault(row["user_id"], {"tokens": 0, "cost_usd": 0.0, "llm_seconds": 0.0})
+            entry["tokens"] += (row["prompt_tokens"] or 0) + (row["completion_tokens"] or 0)
+            entry["cost_usd"] += row["cost_usd"] or 0.0
+            entry["llm_seconds"] += row["llm_seconds"] or 0.0
+        self._spent, self._spent_day = spent, today
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                pass
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pending:
+            try:
+                await self.flush()
+            except Exception:
+                pass
+
+    async def report(self, days: int = 7, group_by: str = "endpoint", user_id: Optional[str] = None) -> dict:
+        """Consumo agregado desde hace `days` días, ordenado por coste (incluye lo aún no escrito)."""
+        since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - (days - 1) * 86400))
+        rows = await usage_store.aggregate(since, user_id)
+        rows += [
+            {"day": day, "user_id": user, "endpoint": endpoint, **counters}
+            for (day, user, endpoint), counters in self._pending.items()
+            if day >= since and (user_id is None or user == user_id)
+        ]
+        groups: dict[str, dict] = {}
+        totals = dict.fromkeys(COUNTERS, 0)
+        for row in rows:
+            entry = groups.setdefault(row[group_by], {group_by: row[group_by], **dict.fromkeys(COUNTERS, 0)})
+            for counter in COUNTERS:
+                entry[counter] += row[counter] or 0
+                totals[counter] += row[counter] or 0
+        for entry in [*groups.values(), totals]:
+            entry["cost_usd"] = round(entry["cost_usd"], 6)
+            entry["avg_latency_seconds"] = round(entry["llm_seconds"] / entry["calls"], 3) if entry["calls"] else None
+            entry["llm_seconds"] = round(entry["llm_seconds"], 3)
+        return {
+            "since": since,
+            "group_by": group_by,
+            "rows": sorted(groups.values(), key=lambda e: e["cost_usd"], reverse=True),
+            "totals": totals,
+        }
+
+    def summary(self, user_id: Optional[str] = None) -> dict:
+        """Gasto de hoy del usuario y lo que le queda de cada presupuesto (desde memoria)."""
+        user_id = user_id or current_user_id.get()
+        spent = dict(self._user_spent(user_id))
+        spent["cost_usd"] = round(spent["cost_usd"], 6)
+        spent["llm_seconds"] = round(spent["llm_seconds"], 3)
+        return {
+            "user_id": user_id,
+            "day": self._spent_day,
+            "spent": spent,
+            "limits": {kind: limit or None for kind, limit in self.limits.items()},
+            "remaining": {
+                kind: max(limit - spent[kind], 0) if limit else None for kind, limit in self.limits.items()
+            },
+            "exempt": user_id in self.exempt_users,
+            "resets_in_seconds": math.ceil(_seconds_until_reset()),
+        }
+
+usage_service = UsageService.from_env()
@@ -1,10 +1,21 @@
-from app.services.ai_service import ai_service
-import json
+from app.services.structured_output_service import structured_output
+from app.services.prompt_registry import prompt_registry
+from app.services.response_schemas import ViabilityBatchResult, ViabilityResult
+from app.utils.metrics import traced
+from pydantic import ValidationError
+from typing import AsyncIterator, Union
+import asyncio
+import os
 
 class ViabilityService:
-    @staticmethod
-    async def evaluate_thesis_idea(title: str, objective: str, variables: list[str], scope: str):
-        system_prompt = """
+    # Lotes (/thesis/evaluate-viability/batch): varias ideas por llamada, varias llamadas a la vez
+    BATCH_PACK_SIZE = int(os.getenv("VIABILITY_BATCH_PACK_SIZE", "5"))
+    BATCH_CONCURRENCY = int(os.getenv("VIABILITY_BATCH_CONCURRENCY", "4"))
+    BATCH_TOKENS_PER_IDEA = int(os.getenv("VIABILITY_BATCH_TOKENS_PER_IDEA", "600"))
+
+    PROMPT = prompt_registry.register(
+        "thesis.viability",
+        system="""
         Eres un experto metodológico de investigación universitaria de alto nivel. 
         Tu tarea es evaluar la VIABILIDAD de una idea de tesis basada en los datos proporcionados por el estudiante.
         
@@ -25,22 +36,136 @@ class ViabilityService:
           },
           "methodological_advice": "Breve consejo experto"
         }
-        """
-        
-        user_prompt = f"""
+        """,
+        user="""
         Idea de Tesis:
         Título: {title}
         Objetivo General: {objective}
-        Variables: {", ".join(variables)}
+        Variables: {variables}
         Alcance: {scope}
+        """,
+        budget=1500,
+        trim=("scope", "objective", "variables"),
+    )
+
+    BATCH_PROMPT = prompt_registry.register(
+        "thesis.viability.batch",
+        system="""
+        Eres un experto metodológico de investigación universitaria de alto nivel.
+        Tu tarea es evaluar la VIABILIDAD de VARIAS ideas de tesis, cada una de un estudiante distinto.
+        Evalúa cada idea de forma independiente: no compares ni mezcles las ideas entre sí.
+
+        Para cada idea debes analizar:
+        1. Claridad del tema.
+        2. Relación lógica entre variables.
+        3. Factibilidad del alcance (tiempo, recursos, acceso a datos).
+        4. Rigurosidad académica inicial.
+
+        Responde ÚNICAMENTE en formato JSON, con un elemento por idea y el mismo "index" que la idea:
+        {
+          "results": [
+            {
+              "index": 0,
+              "score": 0-100,
+              "verdict": "Viable / Viable con ajustes / No viable",
+              "analysis": {
+                "strengths": ["punto fuerte 1", ...],
+                "weaknesses": ["punto débil 1", ...],
+                "recommendations": ["mejora 1", ...]
+              },
+              "methodological_advice": "Breve consejo experto"
+            }
+          ]
+        }
+        """,
+        user="{ideas}",
+    )
+
+    @staticmethod
+    @traced("viability.evaluate_thesis_idea", endpoint="thesis.viability")
+    async def evaluate_thesis_idea(title: str, objective: str, variables: list[str], scope: str):
+        system_prompt, user_prompt = ViabilityService.PROMPT.render(
+            title=title, objective=objective, variables=", ".join(variables), scope=scope,
+        )
+        return await structured_output.generate(
+            system_prompt, user_prompt, ViabilityResult,
+            endpoint="thesis.viability", error_message="Error al procesar la evaluación",
+            # Cohortes que envían la misma idea con otras palabras reutilizan la evaluación
+            semantic_text="\n".join([title, objective, ", ".join(variables), scope]),
+        )
+
+    @staticmethod
+    def _format_idea(index: int, idea: dict) -> str:
+        _, block = ViabilityService.PROMPT.render(
+            title=idea["title"], objective=idea["objective"],
+            variables=", ".join(idea["variables"]), scope=idea["scope"],
+        )
+        return f"[{index}]\n{block}"
+
+    @staticmethod
+    @traced("viability.evaluate_pack")
+    async def _evaluate_pack(pack: list[tuple[int, dict]]) -> list[tuple[int, Union[dict, Exception]]]:
+        """Una llamada para todo el pack; las ideas que el modelo omite o devuelve mal se evalúan solas."""
+        if len(pack) == 1:
+            # Idea suelta: prompt individual (comparte caché con /evaluate-viability)
+            return [(pack[0][0], await ViabilityService.evaluate_thesis_idea(**pack[0][1]))]
+        system_prompt, user_prompt = ViabilityService.BATCH_PROMPT.render(
+            ideas="\n\n".join(ViabilityService._format_idea(i, idea) for i, (_, idea) in enumerate(pack))
+        )
+        response = await structured_output.generate(
+            system_prompt, user_prompt, ViabilityBatchResult,
+            endpoint="thesis.viability", error_message="Error al procesar la evaluación",
+            max_tokens=ViabilityService.BATCH_TOKENS_PER_IDEA * len(pack),
+        )
+        results = {}
+        for item in response.get("results") or []:
+            position = item.get("index")
+            if not isinstance(position, int) or not 0 <= position < len(pack) or position in results:
+                continue
+            try:
+                validated = ViabilityResult.model_validate(
+                    {k: v for k, v in item.items() if k != "index"}
+                ).model_dump()
+            except ValidationError:
+                continue
+            results[position] = validated
+
+        missing = [i for i in range(len(pack)) if i not in results]
+        # Un reintento que falla no tira las ideas que el pack ya resolvió
+        retries = await asyncio.gather(*[
+            ViabilityService.evaluate_thesis_idea(**pack[i][1]) for i in missing
+        ], return_exceptions=True)
+        results.update(zip(missing, retries))
+        return [(pack[i][0], results[i]) for i in range(len(pack))]
+
+    @staticmethod
+    async def evaluate_batch(ideas: list[dict]) -> AsyncIterator[tuple[int, Union[dict, Exception]]]:
         """
-        
-        response = await ai_service.get_response(system_prompt, user_prompt)
-        
+        Evalúa una cohorte completa: empaqueta BATCH_PACK_SIZE ideas por llamada y corre hasta
+        BATCH_CONCURRENCY packs a la vez. Emite (índice, resultado) a medida que termina cada pack.
+        Si un pack falla (proveedor, sobrecarga, cuota), sus ideas se emiten con la excepción en
+        lugar del resultado, como gather(return_exceptions=True): el resto de los packs sigue.
+        """
+        indexed = list(enumerate(ideas))
+        size = max(ViabilityService.BATCH_PACK_SIZE, 1)
+        packs = [indexed[i:i + size] for i in range(0, len(indexed), size)]
+        semaphore = asyncio.Semaphore(ViabilityService.BATCH_CONCURRENCY)
+
+        async def run(pack: list[tuple[int, dict]]):
+            try:
+                async with semaphore:
+                    return await ViabilityService._evaluate_pack(pack)
+            except Exception as exc:
+                return [(index, exc) for index, _ in pack]
+
+        tasks = [asyncio.create_task(run(pack)) for pack in packs]
         try:
-            clean_response = response.strip().replace("```json", "").replace("```", "")
-            return json.loads(clean_response)
-        except Exception as e:
-            return {"error": "Error al procesar la evaluación", "raw": response}
+            for finished in asyncio.as_completed(tasks):
+                for item in await finished:
+                    yield item
+        finally:
+            # El cliente cortó el stream: los packs pendientes no se pagan
+            for task in tasks:
+                task.cancel()
 
 viability_service = ViabilityService()
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from app.db.document_store import SupabaseDocumentStore, document_store
+from app.db.job_store import SupabaseJobStore, job_store
+from app.services.ai_service import ai_service
+from app.utils.http_pool import http_pool
+
+# Pre-calentar al arrancar (por defecto): la API acepta peticiones enseguida y los componentes
+# pesados se cargan en segundo plano. Sin pre-calentamiento se cargan en su primer uso, con los
+# imports del SDK en un hilo (ver provider_router.import_sdk).
+STARTUP_PREWARM = os.getenv("STARTUP_PREWARM", "true").lower() == "true"
+
+def _import_langchain():
+    import langchain_core.messages  # noqa: F401
+
+def _import_pdf():
+    import fitz  # noqa: F401
+
+def _open_http_pool():
+    http_pool.client()
+
+def _connect_supabase():
+    if isinstance(document_store, SupabaseDocumentStore) or isinstance(job_store, SupabaseJobStore):
+        from app.db.supabase import get_supabase
+        get_supabase()
+
+class WarmupService:
+    """Inicializa los componentes que ya no se cargan al importar y mide cuánto tarda cada uno."""
+
+    COMPONENTS = (
+        ("llm_clients", lambda: ai_service.router.warm()),
+        ("langchain", _import_langchain),
+        ("pdf", _import_pdf),
+        ("http_pool", _open_http_pool),
+        ("supabase", _connect_supabase),
+    )
+
+    def __init__(self):
+        self.components: dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return len(self.components) == len(self.COMPONENTS) and all(
+            c["status"] == "ok" for c in self.components.values()
+        )
+
+    async def _run(self):
+        for name, init in self.COMPONENTS:
+            if self.components.get(name, {}).get("status") == "ok":
+                continue
+            started = time.perf_counter()
+            try:
+                # Los imports bloquean: se hacen en un hilo para no frenar el event loop
+                await asyncio.to_thread(init)
+                self.components[name] = {"status": "ok"}
+            except Exception as exc:
+                self.components[name] = {"status": "error", "error": str(exc)}
+            self.components[name]["seconds"] = round(time.perf_counter() - started, 3)
+
+    def start(self) -> asyncio.Task:
+        """Lanza el pre-calentamiento (una sola vez a la vez) y devuelve su tarea."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def shutdown(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "warming": self._task is not None and not self._task.done(),
+            "components": self.components,
+        }
+
+warmup_service = WarmupService()
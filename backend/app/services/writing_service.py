@@ -1,10 +1,68 @@
 from app.services.ai_service import ai_service
+from app.services.prompt_registry import prompt_registry
+from app.services.structured_output_service import structured_output
+from app.services.response_schemas import (
+    ChapterSection, FullChapterResult, ParagraphRewriteResult, VersionsResult, VersionText, WritingAnalysisResult
+)
+from app.services.style_rules_service import style_rules_service
+from app.services.revision_service import revision_service
+from app.services.semantic_cache_service import SemanticCache, semantic_cache
+from app.utils.metrics import traced
+from app.utils.errors import error_event
+from app.utils.streaming import llm_stream_to_sse, sse_event
+from typing import AsyncIterator, Callable, Optional
+import asyncio
 import json
+import os
+
+CHAPTER_ONE_SECTIONS = [
+    ("1.1", "Realidad Problemática", "Descripción de la Realidad Problemática (Contexto local, nacional e internacional)."),
+    ("1.2", "Formulación del Problema", "Formulación del Problema (General y específicos)."),
+    ("1.3", "Objetivos", "Objetivos de la Investigación."),
+    ("1.4", "Justificación", "Justificación (Teórica, práctica y metodológica)."),
+    ("1.5", "Delimitación", "Delimitación (Espacial, temporal y social)."),
+]
+
+# Estilos de generate_versions: clave en la respuesta y descripción para el modelo
+VERSION_STYLES = {
+    "formal": ("v1_formal", "MODO FORMAL: Lenguaje académico estándar, objetivo y fluido."),
+    "statistical": ("v2_statistical", "MODO ESTADÍSTICO/TÉCNICO: Enfocado en datos, precisión y métricas."),
+    "theoretical": ("v3_theoretical", "MODO MARCO TEÓRICO: Integra conceptos y fundamentación científica."),
+}
 
 class WritingService:
-    @staticmethod
-    async def analyze_writing(text: str):
-        system_prompt = """
+    # Modo paralelo de generate_full_chapter: una llamada por sección
+    SECTION_CONCURRENCY = int(os.getenv("CHAPTER_SECTION_CONCURRENCY", "5"))
+    SECTION_RETRIES = int(os.getenv("CHAPTER_SECTION_RETRIES", "2"))
+    SECTION_MAX_TOKENS = int(os.getenv("CHAPTER_SECTION_MAX_TOKENS", "1200"))
+    # Modo paralelo de generate_versions: una llamada por estilo, cada una con su propio presupuesto
+    VERSION_MAX_TOKENS = int(os.getenv("WRITING_VERSION_MAX_TOKENS", "700"))
+
+    REWRITE_PROMPT = prompt_registry.register(
+        "writing.rewrite_paragraphs",
+        system="""
+        Eres un revisor de estilo académico experto. Recibirás párrafos numerados de un texto científico,
+        cada uno con los problemas que un analizador automático ya detectó (primera persona, lenguaje
+        coloquial, verbos imprecisos).
+
+        Para cada párrafo:
+        1. Reescríbelo corrigiendo esos problemas, en tercera persona y con tono académico formal.
+        2. Corrige también cualquier falta de objetividad que encuentres.
+        3. En "issues" incluye SOLO problemas adicionales que no estén en la lista detectada.
+
+        Responde ÚNICAMENTE en JSON con esta estructura:
+        {
+          "paragraphs": [
+            {"index": 0, "improved_text": "Párrafo corregido", "issues": [{"match": "texto original", "problem": "descripción", "suggestion": "reemplazo sugerido"}]}
+          ]
+        }
+        """,
+        user="{paragraphs}",
+    )
+
+    ANALYZE_PROMPT = prompt_registry.register(
+        "writing.analyze",
+        system="""
         Eres un revisor de estilo académico experto. Analiza el texto del estudiante y detecta problemas de redacción científica.
         
         Debes buscar:
@@ -21,17 +79,15 @@ class WritingService:
           ],
           "improved_text": "Versión corregida completa"
         }
-        """
-        
-        response = await ai_service.get_response(system_prompt, text)
-        try:
-            return json.loads(response.strip().replace("```json", "").replace("```", ""))
-        except:
-            return {"error": "Error al analizar texto", "raw": response}
+        """,
+        user="{text}",
+        budget=12000,
+        trim=("text",),
+    )
 
-    @staticmethod
-    async def generate_versions(context_info: str, style_request: str):
-        system_prompt = """
+    VERSIONS_PROMPT = prompt_registry.register(
+        "writing.versions",
+        system="""
         Eres un redactor académico de élite. Basándote en la información "en bruto" del estudiante, genera TRES versiones profesionales:
         1. MODO FORMAL: Lenguaje académico estándar, objetivo y fluido.
         2. MODO ESTADÍSTICO/TÉCNICO: Enfocado en datos, precisión y métricas.
@@ -43,29 +99,42 @@ class WritingService:
           "v2_statistical": "Texto...",
           "v3_theoretical": "Texto..."
         }
-        """
-        
-        user_prompt = f"Información del estudiante: {context_info}\nContexto adicional: {style_request}"
-        
-        response = await ai_service.get_response(system_prompt, user_prompt)
-        try:
-            return json.loads(response.strip().replace("```json", "").replace("```", ""))
-        except:
-            return {"error": "Error al generar versiones", "raw": response}
+        """,
+        user="""
+        Información del estudiante: {context_info}
+        Contexto adicional: {style_request}
+        """,
+        budget=3000,
+        trim=("context_info", "style_request"),
+    )
 
-    @staticmethod
-    async def generate_full_chapter(data: dict, profile: dict):
-        system_prompt = f"""
+    # Las llamadas por estilo comparten system prompt e información del estudiante; el estilo va al final
+    VERSION_PROMPT = prompt_registry.register(
+        "writing.version",
+        system="""
+        Eres un redactor académico de élite. Basándote en la información "en bruto" del estudiante,
+        genera UNA versión profesional en el estilo que se indica.
+
+        Responde ÚNICAMENTE en JSON:
+        {"text": "Texto..."}
+        """,
+        user="""
+        Información del estudiante: {context_info}
+        Contexto adicional: {style_request}
+
+        Estilo: {style}
+        """,
+        budget=3000,
+        trim=("context_info", "style_request"),
+    )
+
+    # Perfil y datos del estudiante iban dentro del system prompt; ahora van al final del mensaje de usuario
+    FULL_CHAPTER_PROMPT = prompt_registry.register(
+        "writing.full_chapter",
+        system="""
         Eres un asesor de tesis de élite especializado en Ingeniería de Sistemas. 
-        Tu tarea es generar un borrador EXTENSO y COMPLETO del CAPÍTULO I (Planteamiento del Problema).
-        
-        Debes seguir este perfil académico:
-        - Grado: {profile.get('grado')}
-        - Área: {profile.get('area')}
-        - Nivel: {profile.get('nivel')}
-        
-        Usa la siguiente información clave del estudiante:
-        {json.dumps(data, indent=2)}
+        Tu tarea es generar un borrador EXTENSO y COMPLETO del CAPÍTULO I (Planteamiento del Problema)
+        a partir del perfil académico y la información clave que proporcione el estudiante.
         
         Estructura obligatoria del borrador:
         1.1 Descripción de la Realidad Problemática (Contexto local, nacional e internacional).
@@ -80,23 +149,382 @@ class WritingService:
         - Citas: Incluye citas simuladas (ej: Smith, 2023) relevantes al área.
 
         Responde ÚNICAMENTE en JSON:
-        {{
+        {
           "sections": [
-            {{"id": "1.1", "title": "Realidad Problemática", "content": "..."}},
-            {{"id": "1.2", "title": "Formulación del Problema", "content": "..."}},
-            {{"id": "1.3", "title": "Objetivos", "content": "..."}},
-            {{"id": "1.4", "title": "Justificación", "content": "..."}},
-            {{"id": "1.5", "title": "Delimitación", "content": "..."}}
+            {"id": "1.1", "title": "Realidad Problemática", "content": "..."},
+            {"id": "1.2", "title": "Formulación del Problema", "content": "..."},
+            {"id": "1.3", "title": "Objetivos", "content": "..."},
+            {"id": "1.4", "title": "Justificación", "content": "..."},
+            {"id": "1.5", "title": "Delimitación", "content": "..."}
           ],
           "citations_count": 15,
           "academic_tone_score": 95
-        }}
+        }
+        """,
+        user="""
+        Perfil académico:
+        - Grado: {grado}
+        - Área: {area}
+        - Nivel: {nivel}
+
+        Información clave del estudiante:
+        {data}
+
+        Generar borrador completo del Capítulo I.
+        """,
+        budget=4000,
+        trim=("data",),
+    )
+
+    # Las 5 llamadas del modo paralelo comparten system prompt, perfil y datos; la sección va al final
+    SECTION_PROMPT = prompt_registry.register(
+        "writing.section",
+        system="""
+        Eres un asesor de tesis de élite especializado en Ingeniería de Sistemas.
+        Tu tarea es redactar UNA sección del CAPÍTULO I (Planteamiento del Problema) de una tesis,
+        a partir del perfil académico y la información clave que proporcione el estudiante.
+
+        Reglas:
+        - Tono: Académico formal, tercera persona.
+        - Extensión: Redacta la sección de forma detallada y autocontenida.
+        - Citas: Incluye citas simuladas (ej: Smith, 2023) relevantes al área.
+
+        Responde ÚNICAMENTE en JSON:
+        {"id": "x.x", "title": "Título", "content": "...", "citations_count": 3, "academic_tone_score": 95}
+        """,
+        user="""
+        Perfil académico:
+        - Grado: {grado}
+        - Área: {area}
+        - Nivel: {nivel}
+
+        Información clave del estudiante:
+        {data}
+
+        Redacta la sección {section_id} {title}: {description}
+        """,
+        budget=4000,
+        trim=("data",),
+    )
+
+    @staticmethod
+    @traced("writing.analyze_writing", endpoint="writing.analyze")
+    async def analyze_writing(text: str, mode: str = "hybrid", document_id: Optional[str] = None):
+        """
+        Modos:
+        - rules: solo el analizador local (milisegundos, sin tokens).
+        - hybrid: reglas locales + una única llamada al modelo con los párrafos marcados.
+        - llm: el texto completo al modelo (comportamiento original).
+        Con `document_id` el análisis es incremental: los párrafos ya analizados en el envío
+        anterior se reutilizan y solo los nuevos o modificados van al modelo.
         """
+        if mode == "llm" and not document_id:
+            return await WritingService._analyze_writing_llm(text)
+
+        paragraphs = style_rules_service.scan(text)
+        for paragraph in paragraphs:
+            paragraph["hash"] = revision_service.paragraph_hash(text[paragraph["start"]:paragraph["end"]])
+        previous = {}
+        if mode != "rules":
+            previous = (await revision_service.load("writing", document_id) or {}).get("paragraphs", {})
+
+        # En modo llm incremental cada párrafo cambiado va al modelo, no solo los marcados
+        pending = [
+            p for p in paragraphs
+            if (p["issues"] or mode == "llm") and p["hash"] not in previous
+        ] if mode != "rules" else []
+
+        records, llm_error = {}, None
+        # Párrafos casi idénticos a otros ya reescritos (plantillas, texto repetido entre estudiantes)
+        semantic = semantic_cache.is_enabled("writing.analyze")
+        namespace = SemanticCache.namespace(ai_service.model, WritingService.REWRITE_PROMPT.system)
+        if semantic:
+            remaining = []
+            for paragraph in pending:
+                original = text[paragraph["start"]:paragraph["end"]]
+                hit = semantic_cache.lookup("writing.analyze", namespace, original)
+                if hit is None:
+                    remaining.append(paragraph)
+                    continue
+                record = json.loads(hit)
+                records[paragraph["hash"]] = WritingService._paragraph_record(
+                    original, record["improved_text"], record["issues"]
+                )
+            pending = remaining
+        cached = len(records)
+        if pending:
+            rewrite = await WritingService._rewrite_paragraphs(text, pending)
+            if "error" in rewrite:
+                # Se degrada al resultado local en lugar de fallar la petición
+                llm_error = rewrite["error"]
+            else:
+                for item in rewrite["paragraphs"]:
+                    if not 0 <= item["index"] < len(pending):
+                        continue
+                    paragraph = pending[item["index"]]
+                    original = text[paragraph["start"]:paragraph["end"]]
+                    records[paragraph["hash"]] = WritingService._paragraph_record(
+                        original, item["improved_text"], item["issues"]
+                    )
+                    if semantic:
+                        semantic_cache.add("writing.analyze", namespace, original, json.dumps(
+                            {"improved_text": item["improved_text"], "issues": item["issues"]}, ensure_ascii=False
+                        ))
+
+        issues = [issue for p in paragraphs for issue in p["issues"]]
+        improved, cursor, reused = [], 0, 0
+        for paragraph in paragraphs:
+            start, end = paragraph["start"], paragraph["end"]
+            improved.append(text[cursor:start])
+            record = records.get(paragraph["hash"])
+            if record is None and paragraph["hash"] in previous:
+                record = previous[paragraph["hash"]]
+                reused += 1
+            if record is not None:
+                improved.append(record["improved_text"])
+                for extra in record["issues"]:
+                    position = extra["position"]
+                    issues.append({
+                        **{k: v for k, v in extra.items() if k != "position"},
+                        "category": "llm",
+                        "start": start + position if position >= 0 else None,
+                        "end": start + position + len(extra["match"]) if position >= 0 else None,
+                        "source": "llm",
+                    })
+            elif paragraph["issues"]:
+                improved.append(style_rules_service.apply_replacements(
+                    text[start:end], paragraph["issues"], offset=start
+                ))
+            else:
+                improved.append(text[start:end])
+            cursor = end
+        improved.append(text[cursor:])
+
+        if document_id and mode != "rules":
+            # Solo se conservan los párrafos presentes en esta versión del documento
+            state = {p["hash"]: records.get(p["hash"]) or previous.get(p["hash"]) for p in paragraphs}
+            await revision_service.save("writing", document_id, {
+                "paragraphs": {h: r for h, r in state.items() if r is not None}
+            })
+
+        issues.sort(key=lambda i: (i["start"] is None, i["start"] or 0))
+        result = {
+            "has_issues": bool(issues),
+            "issues": issues,
+            "improved_text": "".join(improved),
+            "mode": mode,
+            "paragraphs_total": len(paragraphs),
+            "paragraphs_sent": len(pending),
+            "paragraphs_cached": cached,
+            "paragraphs_reused": reused,
+        }
+        if llm_error:
+            result["llm_error"] = llm_error
+        return result
+
+    @staticmethod
+    def _paragraph_record(original: str, improved_text: str, issues: list[dict]) -> dict:
+        return {
+            "improved_text": improved_text,
+            "issues": [
+                {**extra, "position": original.find(extra["match"]) if extra["match"] else -1}
+                for extra in issues
+            ],
+        }
+
+    @staticmethod
+    async def _rewrite_paragraphs(text: str, flagged: list[dict]) -> dict:
+        blocks = []
+        for index, paragraph in enumerate(flagged):
+            detected = ", ".join(dict.fromkeys(i["match"] for i in paragraph["issues"])) or "ninguno"
+            blocks.append(f"[{index}] {text[paragraph['start']:paragraph['end']].strip()}\nDetectado: {detected}")
+        system_prompt, user_prompt = WritingService.REWRITE_PROMPT.render(paragraphs="\n\n".join(blocks))
+        return await structured_output.generate(
+            system_prompt, user_prompt, ParagraphRewriteResult,
+            endpoint="writing.analyze", error_message="Error al reescribir párrafos",
+        )
+
+    @staticmethod
+    async def _analyze_writing_llm(text: str):
+        system_prompt, user_prompt = WritingService.ANALYZE_PROMPT.render(text=text)
+        return await structured_output.generate(
+            system_prompt, user_prompt, WritingAnalysisResult,
+            endpoint="writing.analyze", error_message="Error al analizar texto",
+            semantic_text=text,
+        )
+
+    @staticmethod
+    @traced("writing.generate_versions", endpoint="writing.versions")
+    async def generate_versions(context_info: str, style_request: str,
+                                styles: Optional[list[str]] = None, parallel: bool = False):
+        """
+        Sin `styles` ni `parallel`, una sola llamada devuelve las tres versiones. Con `parallel`
+        (o pidiendo solo algunos estilos) cada estilo es una llamada concurrente más corta.
+        """
+        styles = list(dict.fromkeys(styles or VERSION_STYLES))
+        if parallel or len(styles) < len(VERSION_STYLES):
+            return await WritingService._generate_versions_parallel(context_info, style_request, styles)
+
+        system_prompt, user_prompt = WritingService.VERSIONS_PROMPT.render(
+            context_info=context_info, style_request=style_request,
+        )
         
-        response = await ai_service.get_response(system_prompt, "Generar borrador completo del Capítulo I.")
+        return await structured_output.generate(
+            system_prompt, user_prompt, VersionsResult,
+            endpoint="writing.versions", error_message="Error al generar versiones",
+        )
+
+    @staticmethod
+    async def _generate_version(context_info: str, style_request: str, style: str) -> tuple[str, dict]:
+        _, description = VERSION_STYLES[style]
+        system_prompt, user_prompt = WritingService.VERSION_PROMPT.render(
+            context_info=context_info, style_request=style_request, style=description,
+        )
+        return style, await structured_output.generate(
+            system_prompt, user_prompt, VersionText,
+            endpoint="writing.versions", error_message="Error al generar versión",
+            max_tokens=WritingService.VERSION_MAX_TOKENS,
+        )
+
+    @staticmethod
+    async def iter_versions(context_info: str, style_request: str, styles: list[str]) -> AsyncIterator[tuple[str, dict]]:
+        """(estilo, resultado) en el orden en que terminan; cortar la iteración cancela los pendientes."""
+        tasks = [
+            asyncio.create_task(WritingService._generate_version(context_info, style_request, style))
+            for style in styles
+        ]
         try:
-            return json.loads(response.strip().replace("```json", "").replace("```", ""))
-        except:
-            return {"error": "Error al generar capítulo", "raw": response}
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _merge_versions(results: dict[str, dict]) -> dict:
+        merged = {
+            VERSION_STYLES[style][0]: results[style]["text"]
+            for style in VERSION_STYLES if style in results and "error" not in results[style]
+        }
+        merged["failed_styles"] = [style for style, result in results.items() if "error" in result]
+        return merged
+
+    @staticmethod
+    async def _generate_versions_parallel(context_info: str, style_request: str, styles: list[str]) -> dict:
+        results = {}
+        async for style, result in WritingService.iter_versions(context_info, style_request, styles):
+            results[style] = result
+        if all("error" in result for result in results.values()):
+            return {"error": "Error al generar versiones", "raw": [result.get("raw") for result in results.values()]}
+        return WritingService._merge_versions(results)
+
+    @staticmethod
+    async def stream_versions(context_info: str, style_request: str, styles: Optional[list[str]] = None) -> AsyncIterator[str]:
+        """
+        SSE del modo paralelo: un evento `item` por estilo apenas termina (o `error` si falló)
+        y `done` con todas las versiones juntas.
+        """
+        yield ": stream-open\n\n"
+        results = {}
+        try:
+            async for style, result in WritingService.iter_versions(
+                context_info, style_request, list(dict.fromkeys(styles or VERSION_STYLES))
+            ):
+                results[style] = result
+                if "error" in result:
+                    yield sse_event("error", {"style": style, **result})
+                else:
+                    yield sse_event("item", {"key": VERSION_STYLES[style][0], "style": style, "value": result["text"]})
+        except Exception as exc:
+            # Error del proveedor/cuota: se informa y se cierra con lo que ya se generó
+            yield sse_event("error", error_event(exc, {"error": "Error al generar versiones"}))
+        yield sse_event("done", WritingService._merge_versions(results))
+
+    @staticmethod
+    def _full_chapter_prompts(data: dict, profile: dict) -> tuple[str, str]:
+        return WritingService.FULL_CHAPTER_PROMPT.render(
+            grado=profile.get('grado'), area=profile.get('area'), nivel=profile.get('nivel'), data=data,
+        )
+
+    @staticmethod
+    @traced("writing.generate_full_chapter", endpoint="writing.full_chapter")
+    async def generate_full_chapter(data: dict, profile: dict, parallel: bool = False,
+                                    on_section: Optional[Callable] = None):
+        if parallel:
+            return await WritingService._generate_full_chapter_parallel(data, profile, on_section)
+
+        system_prompt, user_prompt = WritingService._full_chapter_prompts(data, profile)
+        return await structured_output.generate(
+            system_prompt, user_prompt, FullChapterResult,
+            endpoint="writing.full_chapter", error_message="Error al generar capítulo",
+        )
+
+    @staticmethod
+    def _section_prompts(data: dict, profile: dict, section: tuple[str, str, str]) -> tuple[str, str]:
+        section_id, title, description = section
+        return WritingService.SECTION_PROMPT.render(
+            grado=profile.get('grado'), area=profile.get('area'), nivel=profile.get('nivel'), data=data,
+            section_id=section_id, title=title, description=description,
+        )
+
+    @staticmethod
+    async def _generate_section(data: dict, profile: dict, section: tuple[str, str, str],
+                                semaphore: asyncio.Semaphore) -> dict:
+        section_id, title, _ = section
+        system_prompt, user_prompt = WritingService._section_prompts(data, profile, section)
+        result = None
+        for attempt in range(WritingService.SECTION_RETRIES + 1):
+            async with semaphore:
+                # Una respuesta que no valida no queda en caché, y el reintento (`fresh`) tampoco se suma
+                # a otra llamada idéntica: siempre vuelve a llamar al modelo
+                result = await structured_output.generate(
+                    system_prompt, user_prompt, ChapterSection,
+                    endpoint="writing.full_chapter", error_message="Error al generar sección",
+                    max_tokens=WritingService.SECTION_MAX_TOKENS, fresh=attempt > 0,
+                )
+            if "error" not in result:
+                result["id"] = section_id
+                result["title"] = result.get("title") or title
+                return result
+        return {"id": section_id, "title": title, **result}
+
+    @staticmethod
+    async def _generate_full_chapter_parallel(data: dict, profile: dict, on_section: Optional[Callable] = None):
+        semaphore = asyncio.Semaphore(WritingService.SECTION_CONCURRENCY)
+
+        async def generate(section: tuple[str, str, str]) -> dict:
+            result = await WritingService._generate_section(data, profile, section, semaphore)
+            if on_section:
+                # Resultado parcial: cada sección se publica apenas termina
+                await on_section(result)
+            return result
+
+        sections = await asyncio.gather(*[generate(section) for section in CHAPTER_ONE_SECTIONS])
+
+        ok_sections = [s for s in sections if "error" not in s]
+        scores = [s.get("academic_tone_score") for s in ok_sections
+                  if isinstance(s.get("academic_tone_score"), (int, float))]
+        return {
+            "sections": [
+                {k: v for k, v in s.items() if k not in ("citations_count", "academic_tone_score")}
+                for s in sections
+            ],
+            "citations_count": sum(
+                s.get("citations_count", 0) for s in ok_sections
+                if isinstance(s.get("citations_count"), int)
+            ),
+            "academic_tone_score": round(sum(scores) / len(scores)) if scores else None,
+            "failed_sections": [s["id"] for s in sections if "error" in s],
+        }
+
+    @staticmethod
+    def stream_full_chapter(data: dict, profile: dict):
+        system_prompt, user_prompt = WritingService._full_chapter_prompts(data, profile)
+        return llm_stream_to_sse(
+            ai_service.astream(system_prompt, user_prompt, endpoint="writing.full_chapter", json_mode=True,
+                              schema=FullChapterResult),
+            array_key="sections",
+            error_message="Error al generar capítulo",
+        )
 
 writing_service = WritingService()
@@ -0,0 +1,64 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Optional
+from fastapi import Request
+from app.utils.env import load_env
+
+load_env()
+
+# Secreto JWT del proyecto de Supabase (Settings > API > JWT Secret): sin él no se aceptan tokens
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+# Credencial de los reportes globales (X-Admin-Token); vacía = nadie es administrador
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+def verify_supabase_jwt(token: str) -> Optional[dict]:
+    """Claims de un access token de Supabase (HS256) si la firma, `exp` y `aud` son válidos; si no, None."""
+    if not SUPABASE_JWT_SECRET:
+        return None
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        if header.get("alg") != "HS256":
+            return None
+        expected = hmac.new(
+            SUPABASE_JWT_SECRET.encode("utf-8"), f"{header_b64}.{payload_b64}".encode("ascii"), hashlib.sha256
+        ).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature_b64)):
+            return None
+        claims = json.loads(_b64decode(payload_b64))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(claims, dict):
+        return None
+    now = time.time()
+    if not isinstance(claims.get("exp"), (int, float)) or claims["exp"] < now:
+        return None
+    audience = claims.get("aud")
+    if SUPABASE_JWT_AUDIENCE and SUPABASE_JWT_AUDIENCE not in (audience if isinstance(audience, list) else [audience]):
+        return None
+    return claims
+
+def resolve_user_id(request: Request) -> str:
+    """
+    Identidad para límites, cuotas y propiedad de trabajos: el `sub` de un JWT de Supabase
+    verificado o, sin él, la IP del cliente. Nunca una cabecera que el cliente pueda inventar
+    (detrás de un proxy, uvicorn --proxy-headers resuelve la IP real).
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        claims = verify_supabase_jwt(authorization[7:].strip())
+        if claims and claims.get("sub"):
+            return str(claims["sub"])
+    return request.client.host if request.client else "anonymous"
+
+def is_admin(request: Request) -> bool:
+    token = request.headers.get("x-admin-token", "")
+    return bool(ADMIN_API_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_API_TOKEN.encode("utf-8"))
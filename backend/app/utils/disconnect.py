@@ -0,0 +1,58 @@
+import asyncio
+from contextlib import suppress
+from typing import Callable
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.types import Receive
+from app.utils.metrics import CLIENT_DISCONNECTS
+
+# Código no estándar (nginx) para "el cliente cerró la conexión"; nadie lo recibe, solo queda en métricas
+CLIENT_CLOSED_REQUEST = 499
+
+async def _wait_for_disconnect(receive: Receive, body_consumed: asyncio.Event):
+    # Solo se escucha después de leer el cuerpo, para no robarle mensajes al handler
+    await body_consumed.wait()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+class CancelOnDisconnectRoute(APIRoute):
+    """
+    Ruta que cancela el handler si el cliente se va (cierra la pestaña) antes de la respuesta.
+    La cancelación llega a AIService y a los gather de las fan-outs: se corta la llamada al
+    proveedor y se libera el slot del scheduler en lugar de pagar una respuesta que nadie leerá.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route_path = self.path
+
+        async def route_handler(request: Request) -> Response:
+            receive = request._receive
+            body_consumed = asyncio.Event()
+
+            async def tracking_receive():
+                message = await receive()
+                if message["type"] == "http.disconnect" or not message.get("more_body", False):
+                    body_consumed.set()
+                return message
+
+            request._receive = tracking_receive
+            handler_task = asyncio.ensure_future(handler(request))
+            watcher = asyncio.ensure_future(_wait_for_disconnect(receive, body_consumed))
+            try:
+                await asyncio.wait({handler_task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if handler_task.done():
+                    return handler_task.result()
+                handler_task.cancel()
+                CLIENT_DISCONNECTS.inc(route=route_path)
+                with suppress(asyncio.CancelledError):
+                    await handler_task
+                return Response(status_code=CLIENT_CLOSED_REQUEST)
+            finally:
+                watcher.cancel()
+                if not handler_task.done():
+                    handler_task.cancel()
+
+        return route_handler
@@ -0,0 +1,10 @@
+from dotenv import load_dotenv
+
+_loaded = False
+
+def load_env():
+    """Carga el .env una sola vez por proceso (antes cada módulo repetía la búsqueda del archivo)."""
+    global _loaded
+    if not _loaded:
+        load_dotenv()
+        _loaded = True
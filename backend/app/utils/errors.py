@@ -0,0 +1,54 @@
+from typing import Optional
+
+def describe_error(exc: BaseException) -> tuple[int, dict, dict]:
+    """
+    (status, cabeceras, cuerpo) de los errores conocidos del pipeline de IA. Lo usan los
+    exception handlers de main.py y los streams, que ya enviaron el 200 y lo informan
+    como evento `error`.
+    """
+    # Imports diferidos: este módulo lo importan utilidades que no deben cargar los servicios
+    from app.services.provider_router import ProviderError
+    from app.services.scheduler_service import OverloadedError
+    from app.services.usage_service import QuotaExceededError
+
+    if isinstance(exc, ProviderError):
+        # Detectar error de saldo insuficiente (402)
+        if exc.status_code == 402:
+            return 402, {}, {
+                "detail": "Saldo insuficiente en DeepSeek",
+                "type": "insufficient_balance",
+                "message": "Tu cuenta de DeepSeek no tiene saldo suficiente para procesar esta solicitud profesional. Por favor, recarga créditos en el panel de DeepSeek."
+            }
+        # Límite de tasa del proveedor: el cliente puede reintentar más tarde
+        if exc.status_code == 429:
+            return 503, {"Retry-After": exc.retry_after or "5"}, {
+                "detail": str(exc),
+                "type": "rate_limited",
+                "message": "El motor de IA está recibiendo demasiadas solicitudes. Por favor, intenta de nuevo en unos segundos."
+            }
+    if isinstance(exc, OverloadedError):
+        return 503, {"Retry-After": str(exc.retry_after)}, {
+            "detail": exc.reason,
+            "type": "overloaded",
+            "message": "Hay muchas solicitudes en cola en este momento. Por favor, intenta de nuevo en unos segundos."
+        }
+    if isinstance(exc, QuotaExceededError):
+        return 429, {"Retry-After": str(exc.retry_after)}, {
+            "detail": exc.reason,
+            "type": "quota_exceeded",
+            "message": "Alcanzaste tu límite diario de uso del motor de IA. Podrás continuar cuando se renueve tu cuota."
+        }
+    # Otros errores de API
+    return 500, {}, {
+        "detail": str(exc),
+        "type": "api_error",
+        "message": "Ocurrió un error al comunicarse con el motor de IA. Por favor, intenta de nuevo más tarde."
+    }
+
+def error_event(exc: BaseException, extra: Optional[dict] = None) -> dict:
+    """Cuerpo del evento/línea de error de un stream: mismo contenido que la respuesta HTTP, más el status."""
+    status_code, headers, content = describe_error(exc)
+    event = {**(extra or {}), **content, "status": status_code}
+    if "Retry-After" in headers:
+        event["retry_after"] = headers["Retry-After"]
+    return event
@@ -0,0 +1,73 @@
+import asyncio
+import importlib.util
+import os
+from typing import TYPE_CHECKING, Optional
+from app.utils.env import load_env
+
+if TYPE_CHECKING:
+    import httpx
+
+load_env()
+
+# Un único pool de conexiones por proceso para el LLM y Supabase: las conexiones TLS se
+# reutilizan entre peticiones (keep-alive) en lugar de abrir una por cliente.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "30"))
+# Espera máxima por una conexión libre del pool
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+# HTTP/2 multiplexa las llamadas concurrentes sobre pocas conexiones; requiere el paquete h2
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+
+def timeout(read: float) -> "httpx.Timeout":
+    """Timeouts explícitos: conectar falla rápido; leer espera lo que tarde la generación."""
+    import httpx
+    return httpx.Timeout(connect=HTTP_CONNECT_TIMEOUT, read=read, write=HTTP_WRITE_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+
+class HttpPool:
+    """httpx.AsyncClient compartido, creado en el primer uso y cerrado al apagar la app."""
+
+    def __init__(self):
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def client(self) -> "httpx.AsyncClient":
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Desde un hilo (pre-calentamiento) sirve el cliente actual; se liga al loop en su primer uso
+            loop = self._loop
+        if self._loop is None:
+            self._loop = loop
+        # Las conexiones pertenecen al event loop que las abrió: con otro loop hace falta otro cliente
+        if self._client is None or self._client.is_closed or loop is not self._loop:
+            import httpx
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_ENABLED,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=timeout(read=float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            "http2": HTTP2_ENABLED,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive": HTTP_MAX_KEEPALIVE,
+            "open": self._client is not None and not self._client.is_closed,
+        }
+
+http_pool = HttpPool()
@@ -0,0 +1,147 @@
+import json
+from typing import Any, Optional
+
+class RepairResult:
+    def __init__(self, value: Any = None, ok: bool = False, repaired: bool = False, truncated: bool = False):
+        self.value = value
+        self.ok = ok
+        self.repaired = repaired
+        self.truncated = truncated
+
+def _strip_fences(text: str) -> str:
+    return text.strip().replace("```json", "").replace("```", "")
+
+def repair_json(text: str) -> RepairResult:
+    """
+    Parser tolerante de una sola pasada para las respuestas del modelo:
+    - elimina fences de markdown y texto antes del primer '{' o '[',
+    - quita comas finales antes de '}' o ']',
+    - escapa saltos de línea crudos dentro de strings,
+    - si la salida está truncada, cierra el string abierto (si es un valor), descarta
+      el último elemento incompleto y cierra los contenedores pendientes. El punto de corte
+      es siempre el final del último valor completo: un contenedor recién abierto no cuenta
+      (si no, `[{"x": 1}, {"x": 2` quedaría como `[{"x": 1}, {}]`).
+    """
+    text = _strip_fences(text or "")
+    try:
+        return RepairResult(json.loads(text), ok=True)
+    except ValueError:
+        pass
+
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return RepairResult()
+    i, n = min(starts), len(text)
+
+    out: list[str] = []
+    stack: list[list] = []   # [tipo, lo_que_se_espera]
+    safe = None              # (longitud de out, copia del stack) tras el último valor completo
+    in_string = escape = string_is_key = False
+    repaired = False
+
+    def mark_safe():
+        nonlocal safe
+        safe = (len(out), [list(entry) for entry in stack])
+
+    def after_value():
+        if stack:
+            stack[-1][1] = "comma"
+        mark_safe()
+
+    def drop_trailing_comma():
+        nonlocal repaired
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+            repaired = True
+
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == '"':
+                in_string = False
+                out.append(ch)
+                if string_is_key:
+                    stack[-1][1] = "colon"
+                else:
+                    after_value()
+            elif ch in "\n\r\t":
+                out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}[ch])
+                repaired = True
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1][0] == "{" and stack[-1][1] == "key"
+            out.append(ch)
+        elif ch in "{[":
+            stack.append([ch, "key" if ch == "{" else "value"])
+            out.append(ch)
+        elif ch in "}]":
+            drop_trailing_comma()
+            if not stack:
+                break
+            opener = stack.pop()[0]
+            out.append("}" if opener == "{" else "]")
+            if not stack:
+                mark_safe()
+                break
+            after_value()
+        elif ch == ",":
+            out.append(ch)
+            if stack:
+                stack[-1][1] = "key" if stack[-1][0] == "{" else "value"
+        elif ch == ":":
+            out.append(ch)
+            if stack:
+                stack[-1][1] = "value"
+        elif ch.isspace():
+            out.append(ch)
+        else:
+            # Número o literal (true/false/null): se lee hasta el siguiente delimitador
+            j = i
+            while j < n and text[j] not in ',}]' and not text[j].isspace():
+                j += 1
+            out.append(text[i:j])
+            if j < n:
+                after_value()
+            i = j
+            continue
+        i += 1
+
+    truncated = bool(stack)
+    if truncated:
+        repaired = True
+        if in_string and not string_is_key:
+            # Valor de texto cortado: se conserva lo generado hasta ahí
+            if escape:
+                out.pop()
+            out.append('"')
+            after_value()
+        if safe is None:
+            return RepairResult(truncated=True)
+        length, stack = safe
+        del out[length:]
+        drop_trailing_comma()
+        for opener, _ in reversed(stack):
+            drop_trailing_comma()
+            out.append("}" if opener == "{" else "]")
+
+    try:
+        return RepairResult(json.loads("".join(out)), ok=True, repaired=repaired, truncated=truncated)
+    except ValueError:
+        return RepairResult(truncated=truncated)
+
+def loads_tolerant(text: str) -> Optional[Any]:
+    result = repair_json(text)
+    return result.value if result.ok else None
@@ -0,0 +1,250 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._values.items()]
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Función que actualiza gauges justo antes de exportar (ej. stats de la caché)."""
+        self._collectors.append(collector)
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter("thesia_http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram("thesia_http_request_duration_seconds", "Latencia HTTP por ruta", ("method", "route"))
+HTTP_INFLIGHT = registry.gauge("thesia_http_requests_in_flight", "Peticiones HTTP en curso")
+STAGE_LATENCY = registry.histogram("thesia_stage_duration_seconds", "Latencia por etapa del pipeline", ("stage",))
+LLM_TOKENS = registry.counter("thesia_llm_tokens_total", "Tokens reportados por el proveedor", ("endpoint", "kind"))
+LLM_INFLIGHT = registry.gauge("thesia_llm_calls_in_flight", "Llamadas al LLM en curso", ("endpoint",))
+JSON_PARSE = registry.counter("thesia_llm_json_parse_total", "Resultados de parseo del JSON del modelo", ("endpoint", "result"))
+STRUCTURED_OUTPUT = registry.counter("thesia_llm_structured_output_total", "Salidas estructuradas: ok, reparadas, continuadas o fallidas", ("endpoint", "outcome"))
+LLM_CANCELLED = registry.counter("thesia_llm_cancelled_total", "Llamadas al LLM canceladas antes de terminar", ("endpoint", "stage"))
+LLM_SAVED_TOKENS = registry.counter("thesia_llm_saved_tokens_total", "Tokens estimados que no se pagaron por cancelación", ("endpoint",))
+LLM_SAVED_SECONDS = registry.counter("thesia_llm_saved_seconds_total", "Segundos de LLM estimados liberados por cancelación", ("endpoint",))
+CLIENT_DISCONNECTS = registry.counter("thesia_http_client_disconnects_total", "Peticiones abortadas porque el cliente se desconectó", ("route",))
+JOBS_TOTAL = registry.counter("thesia_jobs_total", "Trabajos en segundo plano terminados", ("kind", "status"))
+JOBS_QUEUED = registry.gauge("thesia_jobs_queued", "Trabajos esperando un worker")
+JOBS_RUNNING = registry.gauge("thesia_jobs_running", "Trabajos en ejecución")
+LLM_PROVIDER_REQUESTS = registry.counter("thesia_llm_provider_requests_total", "Llamadas por proveedor de LLM y resultado", ("provider", "outcome"))
+LLM_HEDGES = registry.counter("thesia_llm_hedges_total", "Peticiones duplicadas (hedge) lanzadas a otro proveedor", ("provider",))
+LLM_FAILOVERS = registry.counter("thesia_llm_failovers_total", "Reintentos en otro proveedor tras un error", ("provider", "reason"))
+PROMPT_CACHE_TOKENS = registry.counter("thesia_prompt_cache_tokens_total", "Tokens de prompt por plantilla: servidos desde la caché de prefijos del proveedor (hit) o no (miss)", ("template", "kind"))
+PROMPT_TRIMMED = registry.counter("thesia_prompt_trimmed_total", "Prompts recortados por exceder el presupuesto de tokens de la plantilla", ("template",))
+SEMANTIC_CACHE_LOOKUPS = registry.counter("thesia_semantic_cache_lookups_total", "Búsquedas en la caché semántica por endpoint y resultado", ("endpoint", "result"))
+SEMANTIC_CACHE_SIMILARITY = registry.histogram("thesia_semantic_cache_similarity", "Similitud del mejor candidato de la caché semántica", ("endpoint",), buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0))
+WRITE_BEHIND_PENDING = registry.gauge("thesia_write_behind_pending", "Escrituras diferidas esperando al flusher", ("queue",))
+WRITE_BEHIND_FLUSHES = registry.counter("thesia_write_behind_flushes_total", "Lotes de escrituras diferidas enviados, por resultado", ("queue", "outcome"))
+WRITE_BEHIND_ROWS = registry.counter("thesia_write_behind_rows_total", "Filas escritas por el flusher (tras fusionar escrituras a la misma clave)", ("queue",))
+LLM_COST = registry.counter("thesia_llm_cost_usd_total", "Coste estimado de las llamadas al LLM en USD", ("endpoint",))
+QUOTA_REJECTIONS = registry.counter("thesia_quota_rejections_total", "Peticiones rechazadas por presupuesto diario agotado", ("reason",))
+
+# Etapas de la petición en curso, para la cabecera Server-Timing
+_current_trace: ContextVar[Optional[list]] = ContextVar("current_trace", default=None)
+
+def start_trace() -> object:
+    return _current_trace.set([])
+
+def end_trace(token) -> list:
+    spans = _current_trace.get() or []
+    _current_trace.reset(token)
+    return spans
+
+def server_timing_header(spans: list) -> str:
+    totals: dict[str, float] = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name.replace('.', '_')};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+def record_stage(name: str, seconds: float):
+    STAGE_LATENCY.observe(seconds, stage=name)
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def traced(name: str, endpoint: Optional[str] = None):
+    """
+    Decorador para métodos async de los servicios: mide la etapa completa y cuenta
+    los fallos de parseo según la convención {"error", "raw"} de las respuestas.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                result = await func(*args, **kwargs)
+            if endpoint and isinstance(result, dict):
+                failed = "error" in result and "raw" in result
+                JSON_PARSE.inc(endpoint=endpoint, result="error" if failed else "ok")
+            return result
+        return wrapper
+    return decorator
+
+def record_token_usage(endpoint: Optional[str], llm_output: Optional[dict]):
+    usage = (llm_output or {}).get("token_usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], endpoint=endpoint or "unknown", kind=kind)
+
+# Perfil EWMA por endpoint (segundos, prompt_tokens, completion_tokens) para estimar el ahorro de una cancelación
+_call_profiles: dict[str, list[float]] = {}
+_profiles_lock = threading.Lock()
+PROFILE_ALPHA = 0.2
+
+def observe_llm_call(endpoint: Optional[str], seconds: float, llm_output: Optional[dict]):
+    usage = (llm_output or {}).get("token_usage") or {}
+    sample = [seconds, float(usage.get("prompt_tokens") or 0), float(usage.get("completion_tokens") or 0)]
+    with _profiles_lock:
+        profile = _call_profiles.get(endpoint or "unknown")
+        if profile is None:
+            _call_profiles[endpoint or "unknown"] = sample
+        else:
+            for i, value in enumerate(sample):
+                profile[i] += PROFILE_ALPHA * (value - profile[i])
+
+def record_cancelled_call(endpoint: Optional[str], elapsed: Optional[float]):
+    """
+    Llamada cancelada (cliente desconectado, trabajo cancelado). Si aún estaba en cola se ahorra
+    la llamada entera; si ya estaba en curso, la parte de la respuesta que faltaba generar.
+    """
+    endpoint = endpoint or "unknown"
+    LLM_CANCELLED.inc(endpoint=endpoint, stage="queued" if elapsed is None else "in_flight")
+    with _profiles_lock:
+        profile = list(_call_profiles.get(endpoint) or ())
+    if not profile:
+        return
+    seconds, prompt_tokens, completion_tokens = profile
+    if elapsed is None:
+        saved_seconds, saved_tokens = seconds, prompt_tokens + completion_tokens
+    else:
+        remaining = max(0.0, 1 - elapsed / seconds) if seconds > 0 else 0.0
+        saved_seconds, saved_tokens = max(0.0, seconds - elapsed), completion_tokens * remaining
+    LLM_SAVED_SECONDS.inc(saved_seconds, endpoint=endpoint)
+    LLM_SAVED_TOKENS.inc(round(saved_tokens), endpoint=endpoint)
@@ -0,0 +1,78 @@
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+class SamplingProfiler:
+    """
+    Profiler por muestreo activable en caliente: un hilo toma cada `interval` segundos
+    las pilas de todos los hilos (sys._current_frames) y las acumula en formato
+    "collapsed" (compatible con flamegraph.pl / speedscope).
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._samples: Counter = Counter()
+        self._lock = threading.Lock()
+        self.interval = 0.01
+        self.started_at: Optional[float] = None
+        self.sample_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, duration: Optional[float] = None):
+        if self.running:
+            return
+        self.interval = max(0.001, interval)
+        self._stop.clear()
+        with self._lock:
+            self._samples.clear()
+            self.sample_count = 0
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, args=(duration,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self, duration: Optional[float]):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        while not self._stop.wait(self.interval):
+            if deadline and time.monotonic() > deadline:
+                break
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(parts)))
+            with self._lock:
+                self._samples.update(stacks)
+                self.sample_count += 1
+
+    def collapsed(self, limit: int = 500) -> str:
+        with self._lock:
+            items = self._samples.most_common(limit)
+        return "\n".join(f"{stack} {count}" for stack, count in items) + "\n"
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "started_at": self.started_at,
+            "samples": self.sample_count,
+            "unique_stacks": len(self._samples),
+        }
+
+profiler = SamplingProfiler()
@@ -0,0 +1,132 @@
+import json
+import re
+from typing import Any, AsyncIterator
+from app.utils.errors import error_event
+from app.utils.json_repair import repair_json
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Evita que nginx/proxies acumulen el stream antes de enviarlo
+    "X-Accel-Buffering": "no",
+}
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def ndjson_line(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+class JsonArrayStreamer:
+    """
+    Parser incremental que detecta los elementos completos de un arreglo JSON
+    (ej. "sections" o "chapters") mientras el modelo todavía está generando.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.buffer = ""
+        self.done = False
+        self._key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._pos = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+        self._count = 0
+
+    def feed(self, chunk: str) -> list[tuple[int, Any]]:
+        self.buffer += chunk
+        items = []
+        if self.done:
+            return items
+        if self._pos is None:
+            match = self._key_pattern.search(self.buffer)
+            if not match:
+                return items
+            self._pos = match.end()
+
+        buf = self.buffer
+        i = self._pos
+        while i < len(buf) and not self.done:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 0:
+                        self._emit(buf[self._start:i + 1], items)
+            elif ch == '"':
+                if self._depth == 0:
+                    self._start = i
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Cierre del arreglo: puede quedar un escalar pendiente (número, true...)
+                    if self._start is not None:
+                        self._emit(buf[self._start:i], items)
+                    self.done = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._emit(buf[self._start:i + 1], items)
+            elif ch == "," and self._depth == 0:
+                if self._start is not None:
+                    self._emit(buf[self._start:i], items)
+            elif self._depth == 0 and self._start is None and not ch.isspace():
+                self._start = i
+            i += 1
+        self._pos = i
+        return items
+
+    def _emit(self, fragment: str, items: list):
+        self._start = None
+        try:
+            value = json.loads(fragment)
+        except ValueError:
+            return
+        items.append((self._count, value))
+        self._count += 1
+
+def parse_llm_json(raw: str):
+    # Mismo parser tolerante que las respuestas no-streaming (fences, comas finales, cortes)
+    result = repair_json(raw)
+    if not result.ok:
+        raise ValueError("JSON inválido")
+    return result.value
+
+async def llm_stream_to_sse(chunks: AsyncIterator[str], array_key: str, error_message: str) -> AsyncIterator[str]:
+    """
+    Convierte el stream de tokens del modelo en eventos SSE:
+    - token: texto parcial tal como llega.
+    - item: cada elemento de `array_key` apenas se puede parsear.
+    - done / error: el JSON final completo (o el texto crudo si no es válido).
+    Un error del proveedor, de admisión o de cuota a mitad del stream llega como `error`
+    con el mismo `type` y `message` que la respuesta HTTP equivalente.
+    """
+    # Comentario inicial para que el proxy reciba bytes de inmediato
+    yield ": stream-open\n\n"
+    streamer = JsonArrayStreamer(array_key)
+    try:
+        async for chunk in chunks:
+            yield sse_event("token", {"text": chunk})
+            for index, value in streamer.feed(chunk):
+                yield sse_event("item", {"key": array_key, "index": index, "value": value})
+    except Exception as exc:
+        # Las cabeceras (200) ya salieron: los exception handlers de main.py no pueden actuar
+        yield sse_event("error", error_event(exc, {"error": error_message, "raw": streamer.buffer}))
+        return
+
+    try:
+        yield sse_event("done", parse_llm_json(streamer.buffer))
+    except ValueError:
+        yield sse_event("error", {"error": error_message, "raw": streamer.buffer})
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from contextlib import suppress
+from typing import Optional
+from app.utils.env import load_env
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+load_env()
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# Se acumula hasta este tamaño antes de escribir a disco (un hilo por bloque, no por chunk de red)
+UPLOAD_FLUSH_BYTES = int(os.getenv("UPLOAD_FLUSH_BYTES", str(1024 * 1024)))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or os.path.join(tempfile.gettempdir(), "thesia_uploads")
+# Margen para las cabeceras multipart al comparar con Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+PDF_MAGIC = b"%PDF-"
+
+# Documenta en OpenAPI el cuerpo multipart que las rutas leen a mano
+PDF_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
+class SpooledUpload:
+    """PDF subido, ya en disco: ruta, SHA-256 y tamaño calculados mientras se recibía."""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+    def cleanup(self):
+        with suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    async def __aenter__(self) -> "SpooledUpload":
+        return self
+
+    async def __aexit__(self, *exc):
+        await asyncio.to_thread(self.cleanup)
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"El archivo supera el máximo de {max_bytes / (1024 * 1024):.0f} MB")
+
+class _Spool:
+    """Destino del archivo mientras se parsea el multipart: búfer acotado + hash incremental."""
+
+    def __init__(self, max_bytes: int):
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_TMP_DIR)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.checked_magic = False
+
+    def _write(self, data: bytes):
+        self._hash.update(data)
+        self._file.write(data)
+
+    async def feed(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        self._buffer += data
+        if not self.checked_magic and len(self._buffer) >= len(PDF_MAGIC):
+            # Se rechaza en el primer bloque lo que no es PDF, sin esperar al resto del cuerpo
+            if bytes(self._buffer[:len(PDF_MAGIC)]) != PDF_MAGIC:
+                raise HTTPException(status_code=400, detail="El archivo debe ser un PDF")
+            self.checked_magic = True
+        if len(self._buffer) >= UPLOAD_FLUSH_BYTES:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            await asyncio.to_thread(self._write, data)
+
+    async def finish(self) -> str:
+        if not self.checked_magic:
+            raise HTTPException(status_code=400, detail="El archivo debe ser un PDF")
+        data, self._buffer = bytes(self._buffer), bytearray()
+        await asyncio.to_thread(self._write, data)
+        await asyncio.to_thread(self._file.close)
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        with suppress(FileNotFoundError):
+            os.remove(self.path)
+
+async def receive_pdf_upload(request: Request, field: str = "file",
+                             max_bytes: Optional[int] = None) -> SpooledUpload:
+    """
+    Lee un multipart/form-data por streaming y vuelca el campo `field` a un archivo temporal.
+    La memoria por subida queda acotada (~UPLOAD_FLUSH_BYTES) sin importar el tamaño del PDF,
+    y un archivo demasiado grande se rechaza en cuanto se pasa del límite (o antes, por Content-Length).
+    """
+    max_bytes = max_bytes or UPLOAD_MAX_BYTES
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Se esperaba un formulario multipart con el archivo")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD:
+        raise _too_large(max_bytes)
+
+    # El parser es síncrono: sus callbacks encolan eventos que se procesan después de cada chunk
+    events: list[tuple[str, bytes]] = []
+    header_field, header_value = bytearray(), bytearray()
+    headers: dict[bytes, bytes] = {}
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("part", headers.get(b"content-disposition", b"")))
+        headers.clear()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", b""))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end,
+    })
+
+    spool: Optional[_Spool] = None
+    filename, receiving, finished = None, False, False
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, data in events:
+                if kind == "part":
+                    _, options = parse_options_header(data)
+                    receiving = options.get(b"name") == field.encode() and not finished
+                    if receiving:
+                        filename = options.get(b"filename", b"").decode("utf-8", "replace")
+                        if not filename.lower().endswith(".pdf"):
+                            raise HTTPException(status_code=400, detail="El archivo debe ser un PDF")
+                        spool = _Spool(max_bytes)
+                elif kind == "data" and receiving:
+                    await spool.feed(data)
+                elif kind == "end" and receiving:
+                    receiving, finished = False, True
+            events.clear()
+        parser.finalize()
+        if spool is None or not finished:
+            raise HTTPException(status_code=400, detail=f"Falta el archivo en el campo '{field}'")
+        sha256 = await spool.finish()
+    except BaseException:
+        if spool is not None:
+            await asyncio.to_thread(spool.discard)
+        raise
+    return SpooledUpload(spool.path, filename, spool.size, sha256)
@@ -0,0 +1,178 @@
+"""
+Servidor mock compatible con la API de OpenAI/DeepSeek para benchmarks locales.
+
+Uso:
+    python -m benchmarks.mock_llm_server --port 9100 --latency 0.5 --tokens-per-second 80
+
+Luego apuntar el backend con DEEPSEEK_API_BASE=http://127.0.0.1:9100/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+class MockConfig:
+    latency = 0.5            # segundos hasta el primer token
+    tokens_per_second = 80.0
+    error_rate = 0.0         # fracción de respuestas 429/500
+    malformed_rate = 0.0     # fracción de respuestas con JSON truncado
+
+config = MockConfig()
+app = FastAPI(title="Mock DeepSeek")
+
+def _section(section_id: str) -> dict:
+    return {"id": section_id, "title": "Sección", "content": "Texto académico simulado. " * 40,
+            "citations_count": 3, "academic_tone_score": 90}
+
+# Respuestas canónicas según palabras clave del system prompt
+CANNED = [
+    ("VIABILIDAD", lambda: {
+        "score": 78, "verdict": "Viable con ajustes",
+        "analysis": {"strengths": ["Tema claro"], "weaknesses": ["Alcance amplio"], "recommendations": ["Delimitar la muestra"]},
+        "methodological_advice": "Precisar las variables.",
+    }),
+    ("TABLA DE CONTENIDOS", lambda: {
+        "thesis_title": "Tesis simulada",
+        "chapters": [{"title": f"Capítulo {i}", "sections": [{"name": f"{i}.1", "description": "Contenido"}]} for i in range(1, 6)],
+    }),
+    ("UNA sección del CAPÍTULO I", None),
+    # Revisión del Capítulo I (completa e incremental); va antes que "CAPÍTULO I"
+    ("Capítulo I (Planteamiento del Problema) de un estudiante", lambda: {
+        "feedback_general": "Coherencia aceptable.",
+        "revisions": [{"section": s, "evaluation": "Regular", "suggestions": "Precisar."} for s in ("Problema", "Objetivos", "Justificación")],
+        "draft_suggestion": "Párrafo sugerido.",
+    }),
+    ("CAPÍTULO I", lambda: {
+        "sections": [{"id": f"1.{i}", "title": "Sección", "content": "Texto académico simulado. " * 40} for i in range(1, 6)],
+        "citations_count": 15, "academic_tone_score": 92,
+    }),
+    ("párrafos numerados", None),
+    ("revisor de estilo", lambda: {
+        "has_issues": True,
+        "issues": [{"match": "hicimos", "problem": "Primera persona", "suggestion": "se realizó"}],
+        "improved_text": "Texto corregido.",
+    }),
+    ("TRES versiones", lambda: {"v1_formal": "Formal.", "v2_statistical": "Estadístico.", "v3_theoretical": "Teórico."}),
+    ("UNA versión profesional", lambda: {"text": "Versión simulada en el estilo pedido. " * 10}),
+    ("Arquitectura del Modelo", lambda: {
+        "architecture_title": "CNN simulada", "description": "Descripción técnica. " * 20,
+        "layers_breakdown": [{"layer": f"Conv{i}", "config": "3x3, ReLU"} for i in range(4)],
+        "rationale": "Justificación.",
+    }),
+    ("reglamento de tesis", lambda: {
+        "universidad": "Universidad Simulada", "facultad": "Ingeniería",
+        "estructura": [{"capitulo": "Capítulo I: Introducción", "secciones": ["1.1 Problema", "1.2 Objetivos"]}],
+        "formato": {"fuente": "Arial", "tamano": "12", "norma_citacion": "APA"},
+    }),
+]
+
+def build_content(messages: list[dict]) -> str:
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+    for keyword, factory in CANNED:
+        if keyword in system:
+            if factory is None and keyword == "párrafos numerados":
+                indexes = [int(i) for i in re.findall(r"^\[(\d+)\]", user, re.M)]
+                return json.dumps({"paragraphs": [
+                    {"index": i, "improved_text": "Párrafo corregido.", "issues": []} for i in indexes
+                ]}, ensure_ascii=False)
+            if factory is None:
+                match = re.search(r"sección (\S+)", user)
+                return json.dumps(_section(match.group(1) if match else "1.1"), ensure_ascii=False)
+            return json.dumps(factory(), ensure_ascii=False)
+    return json.dumps({"ok": True, "echo": user[:200]}, ensure_ascii=False)
+
+def _tokens(text: str) -> list[str]:
+    # ~4 caracteres por token, suficiente para simular la velocidad de decodificación
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+# Simula la caché de prefijos de DeepSeek: bloques de 64 tokens ya vistos se cobran como hit
+PREFIX_BLOCK_CHARS = 64 * 4
+_seen_prefixes: set[int] = set()
+
+def _prefix_cache_hit(prompt: str) -> int:
+    hit_chars = 0
+    for end in range(PREFIX_BLOCK_CHARS, len(prompt) + 1, PREFIX_BLOCK_CHARS):
+        key = hash(prompt[:end])
+        if key in _seen_prefixes and hit_chars == end - PREFIX_BLOCK_CHARS:
+            hit_chars = end
+        _seen_prefixes.add(key)
+    return hit_chars // 4
+
+def _usage(messages: list[dict], completion: str) -> dict:
+    prompt = "\x00".join(m.get("content", "") for m in messages)
+    prompt_tokens = len(prompt) // 4
+    hit = min(_prefix_cache_hit(prompt), prompt_tokens)
+    completion_tokens = len(_tokens(completion))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": hit, "prompt_cache_miss_tokens": prompt_tokens - hit}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "mock")
+
+    await asyncio.sleep(config.latency)
+    roll = random.random()
+    if roll < config.error_rate:
+        status_code = random.choice([429, 500])
+        return JSONResponse(status_code=status_code, content={"error": {"message": "mock error", "type": "mock", "code": status_code}})
+
+    content = build_content(messages)
+    if random.random() < config.malformed_rate:
+        content = content[: max(1, len(content) * 2 // 3)]
+    tokens = _tokens(content)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(tokens) / config.tokens_per_second)
+        return {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(messages, content),
+        }
+
+    async def event_stream():
+        delay = 1.0 / config.tokens_per_second
+        for token in tokens:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(delay)
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Mock DeepSeek/OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=MockConfig.latency)
+    parser.add_argument("--tokens-per-second", type=float, default=MockConfig.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate)
+    parser.add_argument("--malformed-rate", type=float, default=MockConfig.malformed_rate)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config.latency = args.latency
+    config.tokens_per_second = args.tokens_per_second
+    config.error_rate = args.error_rate
+    config.malformed_rate = args.malformed_rate
+    if args.seed is not None:
+        random.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
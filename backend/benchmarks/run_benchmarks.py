@@ -0,0 +1,318 @@
+"""
+Benchmark/carga de extremo a extremo del backend contra el mock de DeepSeek.
+
+Levanta el mock y la API (uvicorn) en procesos separados, ejecuta un workload
+por endpoint y guarda p50/p95/p99, throughput, lag del event loop y memoria en
+benchmarks/results/<fecha>_<commit>.json.
+
+Uso (desde backend/):
+    python -m benchmarks.run_benchmarks --requests 40 --concurrency 8
+    python -m benchmarks.run_benchmarks --only thesis.viability,writing.analyze
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/anterior.json
+
+Una respuesta 200 cuyo cuerpo trae "error" (o secciones/estilos fallidos) cuenta como
+error y no entra en las latencias; la corrida termina con código 1 si la tasa de errores
+supera --max-error-rate.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import fitz  # PyMuPDF
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+def _pdf(i: int, pages: int = 20) -> bytes:
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(
+            fitz.Rect(72, 72, 540, 770),
+            f"Reglamento {i}. Capítulo {p}. Formato APA, fuente Arial 12, márgenes 2.5 cm. " * 15,
+        )
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+# (nombre, método, ruta, fábrica del payload). El índice `i` varía la entrada para no medir la caché.
+WORKLOADS = [
+    ("profile.validate", "POST", "/profile/validate",
+     lambda i: {"json": {"grado": ["Bachiller", "Maestría", "Doctorado"][i % 3], "area": "Deep Learning", "nivel": "Descriptivo"}}),
+    ("tech.estimate_resources", "POST", "/tech/estimate-resources",
+     lambda i: {"json": {"params_millions": 10 + i, "batch_size": 32}}),
+    ("thesis.viability", "POST", "/thesis/evaluate-viability",
+     lambda i: {"json": {"title": f"Sistema de recomendación {i}", "objective": "Mejorar la precisión", "variables": ["precisión", "tiempo"], "scope": "Lima 2025"}}),
+    ("thesis.structure", "POST", "/thesis/generate-structure",
+     lambda i: {"json": {"title": f"Detección de fraude {i}", "objective": "Reducir falsos positivos"}}),
+    ("thesis.chapter_one", "POST", "/thesis/review-chapter-one",
+     lambda i: {"json": {"title": f"Tesis {i}", "problem_description": "Problema " * 50, "objectives": "Objetivos", "justification": "Justificación"}}),
+    ("writing.analyze", "POST", "/writing/analyze",
+     lambda i: {"json": {"text": f"En este trabajo hicimos un sistema {i} y vamos a poner los datos. " * 10}}),
+    ("writing.versions", "POST", "/writing/generate-versions",
+     lambda i: {"json": {"context_info": f"Datos del estudiante {i}", "style_request": "formal"}}),
+    ("writing.versions_parallel", "POST", "/writing/generate-versions",
+     lambda i: {"json": {"context_info": f"Datos del estudiante paralelo {i}", "style_request": "formal", "parallel": True}}),
+    ("writing.full_chapter", "POST", "/writing/generate-full-chapter",
+     lambda i: {"json": {"data": {"titulo": f"Tesis {i}"}, "profile": {"grado": "Maestría", "area": "Sistemas", "nivel": "Aplicado"}}}),
+    ("writing.full_chapter_parallel", "POST", "/writing/generate-full-chapter",
+     lambda i: {"json": {"data": {"titulo": f"Tesis paralela {i}"}, "profile": {"grado": "Maestría"}, "parallel": True}}),
+    ("tech.architecture", "POST", "/tech/generate-architecture",
+     lambda i: {"json": {"model_type": "CNN", "framework": "PyTorch", "task_description": f"Clasificación de imágenes {i}"}}),
+    ("analysis.extract_text", "POST", "/analyze/extract-text",
+     lambda i: {"files": {"file": (f"r{i}.pdf", _pdf(i), "application/pdf")}}),
+    ("analysis.regulations", "POST", "/analyze/regulations",
+     lambda i: {"files": {"file": (f"r{i}.pdf", _pdf(i), "application/pdf")}}),
+]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+async def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"El servicio no respondió a tiempo: {url}")
+
+def _body_error(response: httpx.Response) -> bool:
+    """El backend degrada a {"error", "raw"} con status 200: medir eso sería medir el camino de error."""
+    if not response.headers.get("content-type", "").startswith("application/json"):
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return isinstance(body, dict) and (
+        "error" in body or bool(body.get("failed_sections")) or bool(body.get("failed_styles"))
+    )
+
+async def run_workload(base_url: str, app_pid: int, name: str, method: str, path: str, factory,
+                       total: int, concurrency: int) -> dict:
+    payloads = [factory(i) for i in range(total)]
+    latencies, errors = [], 0
+    error_samples: list[str] = []
+    statuses: dict[int, int] = {}
+    lags: list[float] = []
+    rss_samples = [_rss_mb(app_pid) or 0.0]
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    running = True
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                payload = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **payload)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    failed = response.status_code >= 400 or _body_error(response)
+                    sample = f"{response.status_code} {response.text[:300]}"
+                except httpx.HTTPError as exc:
+                    failed, sample = True, repr(exc)
+                if failed:
+                    errors += 1
+                    if len(error_samples) < 3:
+                        error_samples.append(sample)
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        async def lag_probe():
+            # La latencia de /health bajo carga aproxima el bloqueo del event loop de la API
+            async with httpx.AsyncClient(base_url=base_url, timeout=30) as probe:
+                while running:
+                    started = time.perf_counter()
+                    await probe.get("/health")
+                    lags.append((time.perf_counter() - started) * 1000)
+                    rss_samples.append(_rss_mb(app_pid) or 0.0)
+                    await asyncio.sleep(0.05)
+
+        probe_task = asyncio.create_task(lag_probe())
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        running = False
+        await probe_task
+
+    return {
+        "endpoint": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_samples": error_samples,
+        "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 2),
+            "p95": round(_percentile(latencies, 95), 2),
+            "p99": round(_percentile(latencies, 99), 2),
+            "mean": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        },
+        # Solo respuestas exitosas: las de error no cuentan como trabajo hecho
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "event_loop_lag_ms": {
+            "p50": round(_percentile(lags, 50), 2),
+            "p99": round(_percentile(lags, 99), 2),
+            "max": round(max(lags), 2) if lags else 0.0,
+        },
+        "memory_mb": {
+            "start": round(rss_samples[0], 1),
+            "peak": round(max(rss_samples), 1),
+            "end": round(rss_samples[-1], 1),
+        },
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(current: dict, previous_path: str):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {r["endpoint"]: r for r in json.load(f)["results"]}
+    print(f"\n{'endpoint':32} {'p50 ms':>18} {'p95 ms':>18} {'rps':>14}")
+    for result in current["results"]:
+        old = previous.get(result["endpoint"])
+        if not old:
+            continue
+        def delta(new, prev):
+            pct = ((new - prev) / prev * 100) if prev else 0.0
+            return f"{new:>8.1f} ({pct:+5.1f}%)"
+        print(f"{result['endpoint']:32} {delta(result['latency_ms']['p50'], old['latency_ms']['p50']):>18} "
+              f"{delta(result['latency_ms']['p95'], old['latency_ms']['p95']):>18} "
+              f"{delta(result['throughput_rps'], old['throughput_rps']):>14}")
+
+async def main_async(args) -> dict:
+    mock_port, app_port = _free_port(), _free_port()
+    workdir = tempfile.mkdtemp(prefix="thesia-bench-")
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_llm_server", "--port", str(mock_port),
+         "--latency", str(args.mock_latency), "--tokens-per-second", str(args.mock_tps),
+         "--error-rate", str(args.mock_error_rate), "--malformed-rate", str(args.mock_malformed_rate),
+         "--seed", "42"],
+        cwd=BACKEND_DIR,
+    )
+    env = {
+        **os.environ,
+        "DEEPSEEK_API_KEY": "mock",
+        "DEEPSEEK_API_BASE": f"http://127.0.0.1:{mock_port}/v1",
+        # Se mide el camino completo: sin caché ni deduplicación salvo que se pida
+        "AI_CACHE_ENABLED": "true" if args.with_cache else "false",
+        "AI_SINGLEFLIGHT_ENABLED": "true" if args.with_cache else "false",
+        "DOCUMENT_STORE_SQLITE_PATH": os.path.join(workdir, "documents.db"),
+        "RETRIEVAL_INDEX_DIR": os.path.join(workdir, "indexes"),
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        await _wait_ready(f"http://127.0.0.1:{mock_port}/docs")
+        await _wait_ready(f"{base_url}/health")
+        selected = set(args.only.split(",")) if args.only else None
+        results = []
+        for name, method, path, factory in WORKLOADS:
+            if selected and name not in selected:
+                continue
+            result = await run_workload(base_url, api.pid, name, method, path, factory,
+                                        args.requests, args.concurrency)
+            results.append(result)
+            print(f"{name:32} p50={result['latency_ms']['p50']:>8.1f}ms p95={result['latency_ms']['p95']:>8.1f}ms "
+                  f"p99={result['latency_ms']['p99']:>8.1f}ms rps={result['throughput_rps']:>7.2f} "
+                  f"lag_p99={result['event_loop_lag_ms']['p99']:>7.1f}ms rss_peak={result['memory_mb']['peak']}MB "
+                  f"errors={result['errors']}")
+    finally:
+        for process in (api, mock):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency,
+            "mock_latency": args.mock_latency, "mock_tokens_per_second": args.mock_tps,
+            "mock_error_rate": args.mock_error_rate, "mock_malformed_rate": args.mock_malformed_rate,
+            "with_cache": args.with_cache,
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de ThesIA contra un DeepSeek simulado")
+    parser.add_argument("--requests", type=int, default=30, help="Peticiones por endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", default="", help="Endpoints separados por coma (ver WORKLOADS)")
+    parser.add_argument("--mock-latency", type=float, default=0.3)
+    parser.add_argument("--mock-tps", type=float, default=200.0)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-malformed-rate", type=float, default=0.0)
+    parser.add_argument("--with-cache", action="store_true", help="Mantener caché y single-flight activos")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="Tasa de errores tolerada por endpoint (subirla al inyectar fallos en el mock)")
+    parser.add_argument("--output", default="", help="Ruta del JSON de resultados")
+    parser.add_argument("--compare", default="", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}_{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+    failing = [r for r in report["results"] if r["requests"] and r["errors"] / r["requests"] > args.max_error_rate]
+    for result in failing:
+        print(f"ERROR: {result['endpoint']} falló {result['errors']}/{result['requests']} peticiones: "
+              f"{result['error_samples'][:1]}", file=sys.stderr)
+    if failing:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
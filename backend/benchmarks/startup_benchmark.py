@@ -0,0 +1,85 @@
+"""
+Presupuesto de arranque: mide cuánto tarda `import app.main` en un proceso nuevo y falla
+(código de salida 1) si la mediana supera el presupuesto o si algún módulo pesado que
+debería cargarse en diferido (SDK del LLM, PyMuPDF, Supabase) ya está importado.
+
+Uso (desde backend/):
+    python -m benchmarks.startup_benchmark
+    python -m benchmarks.startup_benchmark --runs 7 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se cargan en el primer uso o en el pre-calentamiento (GET /ready?warm=true), nunca al importar
+LAZY_MODULES = ("langchain_openai", "langchain_core", "openai", "fitz", "supabase")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("DEEPSEEK_API_KEY", "benchmark")
+    env["STARTUP_PREWARM"] = "false"
+    env["PYTHONWARNINGS"] = "ignore"
+    return env
+
+def measure_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=_env(),
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(top: int) -> list[tuple[float, str]]:
+    """Módulos con mayor tiempo acumulado según `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=BACKEND_DIR, env=_env(),
+        capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]) / 1_000_000, parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la API frente a un presupuesto")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "2000")))
+    parser.add_argument("--top", type=int, default=15, help="Módulos más lentos a listar")
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    median_ms = statistics.median(s["seconds"] for s in samples) * 1000
+    loaded = set(samples[-1]["modules"])
+    eager = [m for m in LAZY_MODULES if m in loaded]
+
+    print(f"import app.main: mediana {median_ms:.0f} ms en {args.runs} corridas (presupuesto {args.budget_ms:.0f} ms)")
+    print("Módulos más lentos (acumulado):")
+    for seconds, name in slowest_imports(args.top):
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        print(f"FALLO: el arranque supera el presupuesto por {median_ms - args.budget_ms:.0f} ms")
+        failed = True
+    if eager:
+        print(f"FALLO: módulos que deberían cargarse en diferido: {', '.join(eager)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -15,3 +15,64 @@ create policy "Usuarios gestionan su propio proyecto"
 on public.projects for all
 using (auth.uid() = user_id)
 with check (auth.uid() = user_id);
+
+-- 4. Almacén de reglamentos analizados (usado por el backend con DOCUMENT_STORE_BACKEND=supabase)
+--    La clave es el SHA-256 del PDF subido; el backend accede con la service role key.
+create table public.regulation_documents (
+  sha256 text primary key,
+  text text,
+  chunks jsonb,
+  regulation jsonb,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  updated_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+alter table public.regulation_documents enable row level security;
+
+-- 5. Trabajos en segundo plano (usado con JOB_STORE_BACKEND=supabase)
+--    Las marcas de tiempo son epoch en segundos: el backend las compara para el stream de eventos.
+create table public.generation_jobs (
+  id text primary key,
+  user_id text,
+  kind text not null,
+  status text not null,
+  payload jsonb,
+  progress jsonb,
+  result jsonb,
+  error text,
+  cancel_requested boolean not null default false,
+  created_at double precision not null,
+  updated_at double precision not null
+);
+
+alter table public.generation_jobs enable row level security;
+
+-- 6. Consumo de tokens por día, usuario y endpoint (usado con USAGE_STORE_BACKEND=supabase)
+--    Cada flush del backend inserta los incrementos del intervalo; la vista los suma en el servidor.
+create table public.llm_usage (
+  id bigint generated always as identity primary key,
+  day date not null,
+  user_id text not null,
+  endpoint text not null,
+  calls integer not null default 0,
+  cache_hits integer not null default 0,
+  prompt_tokens bigint not null default 0,
+  completion_tokens bigint not null default 0,
+  cache_hit_tokens bigint not null default 0,
+  cost_usd double precision not null default 0,
+  llm_seconds double precision not null default 0,
+  created_at double precision not null
+);
+
+create index llm_usage_day on public.llm_usage (day, user_id);
+
+alter table public.llm_usage enable row level security;
+
+create view public.llm_usage_daily as
+  select day, user_id, endpoint,
+         sum(calls) as calls, sum(cache_hits) as cache_hits,
+         sum(prompt_tokens) as prompt_tokens, sum(completion_tokens) as completion_tokens,
+         sum(cache_hit_tokens) as cache_hit_tokens, sum(cost_usd) as cost_usd,
+         sum(llm_seconds) as llm_seconds
+  from public.llm_usage
+  group by day, user_id, endpoint;